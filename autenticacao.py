@@ -0,0 +1,93 @@
+import logging
+import os
+import random
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as TempoEsgotado
+from flask import current_app
+from werkzeug.security import check_password_hash, generate_password_hash
+from models import db, metodo_hash_configurado
+
+logger = logging.getLogger('sigma.login')
+
+
+class LoginSobrecarregado(Exception):
+
+    def __init__(self, motivo='fila_cheia'):
+        super().__init__(motivo)
+        self.motivo = motivo
+
+
+class PoolVerificacao:
+    """Executa o hash de senhas fora da thread da requisição, com no máximo
+    `workers` hashes simultâneos e `fila_maxima` pedidos esperando. Acima disso
+    o pedido é recusado na hora em vez de acumular workers presos no login; o
+    pedido que não termina em `timeout` segundos também é recusado."""
+
+    def __init__(self, workers, fila_maxima):
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='verificacao-senha')
+        self.vagas = threading.BoundedSemaphore(workers + fila_maxima)
+
+    def executar(self, funcao, *args, timeout=None):
+        if not self.vagas.acquire(blocking=False):
+            raise LoginSobrecarregado()
+        try:
+            futuro = self.executor.submit(funcao, *args)
+        except BaseException:
+            self.vagas.release()
+            raise
+        futuro.add_done_callback(lambda _: self.vagas.release())
+        try:
+            return futuro.result(timeout=timeout)
+        except TempoEsgotado:
+            # Ainda na fila, o pedido sai dela; já em execução, o hash termina e libera a vaga.
+            futuro.cancel()
+            raise LoginSobrecarregado('tempo_esgotado')
+
+
+_trava_pool = threading.Lock()
+
+
+def pool_verificacao():
+    # Criado no primeiro login de cada processo, para não atravessar um fork de worker.
+    app = current_app._get_current_object()
+    pool = app.extensions.get('pool_verificacao')
+    if pool is None:
+        with _trava_pool:
+            pool = app.extensions.get('pool_verificacao')
+            if pool is None:
+                workers = app.config.get('LOGIN_WORKERS') or os.cpu_count() or 1
+                fila_maxima = app.config.get('LOGIN_FILA_MAXIMA', workers * 4)
+                pool = app.extensions['pool_verificacao'] = PoolVerificacao(workers, fila_maxima)
+    return pool
+
+
+def verificar_senha(usuario, senha):
+    """Confere a senha no pool e, se a política de hash mudou, regrava o hash
+    com a política atual. Levanta LoginSobrecarregado quando a fila está cheia ou
+    o hash não termina em LOGIN_TIMEOUT segundos."""
+    if not senha:
+        return False
+    pool = pool_verificacao()
+    timeout = current_app.config.get('LOGIN_TIMEOUT', 10)
+    if not pool.executar(check_password_hash, usuario.senha_hash, senha, timeout=timeout):
+        return False
+
+    metodo = metodo_hash_configurado()
+    if usuario.precisa_rehash(metodo):
+        try:
+            usuario.senha_hash = pool.executar(generate_password_hash, senha, metodo, timeout=timeout)
+            db.session.commit()
+            registrar_evento('rehash', usuario_id=usuario.id, metodo=metodo.split(':', 1)[0], forcar=True)
+        except LoginSobrecarregado:
+            # O login já foi validado; o rehash fica para a próxima vez.
+            pass
+    return True
+
+
+def registrar_evento(evento, forcar=False, **campos):
+    # Log em formato chave=valor com amostragem; nunca recebe senha nem o formulário.
+    taxa = current_app.config.get('LOGIN_LOG_AMOSTRAGEM', 1.0)
+    if not forcar and random.random() >= taxa:
+        return
+    detalhes = ' '.join(f'{chave}={valor}' for chave, valor in campos.items())
+    logger.info('evento=%s %s', evento, detalhes)
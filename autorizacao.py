@@ -0,0 +1,123 @@
+import threading
+import time
+from functools import wraps
+from flask import current_app, g, session, redirect, url_for
+from sqlalchemy import event, inspect, text
+from sqlalchemy.engine import Connection
+from models import db, Inscricao, Materia, VersaoAcesso
+
+# As matérias que o usuário pode acessar (inscrito, se aluno; professor, se professor)
+# ficam na sessão do Flask, que já é assinada, junto com a versão de acesso do usuário.
+# Gravar em Inscricao ou Materia.professor_id incrementa essa versão na mesma transação;
+# cada processo guarda as versões por AUTORIZACAO_TTL segundos, então as verificações das
+# rotas são feitas em memória e uma mudança vale em todos os processos depois do TTL.
+
+_versoes = {}
+_trava = threading.Lock()
+
+_SQL_INCREMENTAR = (
+    "INSERT INTO versoes_acesso (usuario_id, versao) VALUES (:usuario_id, 1)"
+    " ON CONFLICT (usuario_id) DO UPDATE SET versao = versao + 1"
+)
+
+
+def versao_acesso(usuario_id):
+    agora = time.monotonic()
+    with _trava:
+        atual = _versoes.get(usuario_id)
+    if atual is not None and agora < atual[1]:
+        return atual[0]
+
+    versao = db.session.execute(
+        db.select(VersaoAcesso.versao).where(VersaoAcesso.usuario_id == usuario_id)
+    ).scalar() or 0
+    with _trava:
+        _versoes[usuario_id] = (versao, agora + current_app.config.get('AUTORIZACAO_TTL', 5))
+    return versao
+
+
+def materias_do_usuario(usuario_id, role):
+    if role == 'aluno':
+        consulta = db.select(Inscricao.materia_id).where(Inscricao.aluno_id == usuario_id)
+    elif role == 'professor':
+        consulta = db.select(Materia.id).where(Materia.professor_id == usuario_id)
+    else:
+        return []
+    return sorted(db.session.scalars(consulta))
+
+
+def carregar_acesso(usuario_id, role):
+    # A versão é lida antes das matérias: se mudar no meio, a próxima verificação recarrega.
+    session['versao_acesso'] = versao_acesso(usuario_id)
+    session['materias'] = materias_do_usuario(usuario_id, role)
+
+
+def materias_permitidas():
+    if 'materias_permitidas' not in g:
+        if 'materias' not in session or session.get('versao_acesso') != versao_acesso(session['user_id']):
+            carregar_acesso(session['user_id'], session.get('role'))
+        g.materias_permitidas = frozenset(session['materias'])
+    return g.materias_permitidas
+
+
+def pode_acessar_materia(materia_id):
+    return materia_id in materias_permitidas()
+
+
+def login_required(role="qualquer", materia=None):
+    # `materia` é o nome do argumento da rota com o id da matéria que o usuário precisa acessar.
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            if 'authenticated' not in session:
+                return redirect(url_for('publico.index'))
+            if role != "qualquer" and session.get('role') != role:
+                return "Acesso Negado! Você não tem permissão para acessar esta página.", 403
+            if materia and not pode_acessar_materia(kwargs[materia]):
+                return "Acesso Negado!", 403
+            return f(*args, **kwargs)
+        return decorated_function
+    return decorator
+
+
+def invalidar_acesso(sessao, usuarios_ids):
+    """Incrementa a versão de acesso dos usuários dentro da transação de `sessao`
+    (Session ou Connection). Usado por quem grava inscrições sem passar pelo ORM."""
+    ids = sorted({usuario_id for usuario_id in usuarios_ids if usuario_id is not None})
+    if not ids:
+        return
+    executar = sessao.execute if isinstance(sessao, Connection) else sessao.connection().execute
+    executar(text(_SQL_INCREMENTAR), [{'usuario_id': usuario_id} for usuario_id in ids])
+    if not isinstance(sessao, Connection):
+        sessao.info.setdefault('acesso_alterado', set()).update(ids)
+
+
+@event.listens_for(db.session, 'after_flush')
+def _versionar_flush(sessao, contexto):
+    ids = set()
+    for obj in list(sessao.new) + list(sessao.deleted):
+        if isinstance(obj, Inscricao):
+            ids.add(obj.aluno_id)
+        elif isinstance(obj, Materia):
+            ids.add(obj.professor_id)
+    for obj in sessao.dirty:
+        if isinstance(obj, Materia):
+            historico = inspect(obj).attrs['professor_id'].history
+            if historico.has_changes():
+                ids.update(historico.deleted)
+                ids.update(historico.added)
+    invalidar_acesso(sessao, ids)
+
+
+@event.listens_for(db.session, 'after_commit')
+def _esquecer_apos_commit(sessao):
+    ids = sessao.info.pop('acesso_alterado', None)
+    if ids:
+        with _trava:
+            for usuario_id in ids:
+                _versoes.pop(usuario_id, None)
+
+
+@event.listens_for(db.session, 'after_rollback')
+def _descartar_apos_rollback(sessao):
+    sessao.info.pop('acesso_alterado', None)
@@ -0,0 +1,118 @@
+import logging
+import random
+import time
+from flask import current_app
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import OperationalError
+from models import db
+
+logger = logging.getLogger('sigma.banco')
+
+# Perfis de configuração do SQLite, aplicados a cada conexão nova pelo evento `connect`.
+# No perfil 'producao' o WAL deixa leituras e a escrita rodarem juntas (só escritores
+# esperam uns pelos outros), e o busy_timeout faz o escritor esperar a vez em vez de
+# falhar na hora com "database is locked". 'padrao' mantém o comportamento do SQLite.
+PERFIS = {
+    'padrao': {},
+    'producao': {
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'busy_timeout': 2000,
+        'cache_size': -64000,
+        'mmap_size': 256 * 1024 * 1024,
+        'temp_store': 'MEMORY',
+    },
+}
+
+
+MENSAGEM_BANCO_OCUPADO = 'O sistema está com muitos acessos no momento. Tente novamente em alguns segundos.'
+
+
+class BancoOcupado(Exception):
+    pass
+
+
+def banco_travado(erro):
+    return isinstance(erro, OperationalError) and any(
+        mensagem in str(erro.orig) for mensagem in ('database is locked', 'database is busy')
+    )
+
+
+def pragmas_do_perfil(config):
+    perfil = config.get('BANCO_PERFIL', 'producao')
+    if perfil not in PERFIS:
+        raise ValueError(f"BANCO_PERFIL desconhecido: {perfil}")
+    return {**PERFIS[perfil], **(config.get('BANCO_PRAGMAS') or {})}
+
+
+def opcoes_engine(url, pragmas, conexoes=None):
+    """Opções de create_engine para o banco em `url`: o timeout do driver acompanha o
+    busy_timeout, e bancos em arquivo usam um pool de `conexoes` (uma por thread)."""
+    opcoes = {}
+    if 'busy_timeout' in pragmas:
+        opcoes['connect_args'] = {'timeout': pragmas['busy_timeout'] / 1000}
+    url = make_url(url)
+    if url.get_backend_name() == 'sqlite' and url.database not in (None, '', ':memory:') and conexoes:
+        opcoes.update(pool_size=conexoes, max_overflow=conexoes, pool_timeout=30)
+    return opcoes
+
+
+def aplicar_pragmas(engine, pragmas):
+    if not pragmas or engine.dialect.name != 'sqlite':
+        return
+
+    @event.listens_for(engine, 'connect')
+    def _configurar_conexao(conexao, registro):
+        cursor = conexao.cursor()
+        try:
+            for nome, valor in pragmas.items():
+                cursor.execute(f"PRAGMA {nome} = {valor}")
+        finally:
+            cursor.close()
+
+
+def configurar_banco(app):
+    # Antes do db.init_app: as opções valem para o engine que ele cria.
+    pragmas = pragmas_do_perfil(app.config)
+    opcoes = opcoes_engine(app.config['SQLALCHEMY_DATABASE_URI'], pragmas, app.config.get('BANCO_CONEXOES'))
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {**opcoes, **app.config.get('SQLALCHEMY_ENGINE_OPTIONS', {})}
+
+
+def instalar_pragmas(app):
+    # Depois do db.init_app, que já criou o engine.
+    with app.app_context():
+        aplicar_pragmas(db.engine, pragmas_do_perfil(app.config))
+
+
+def repetir_se_travado(funcao, desfazer, tentativas, espera):
+    """Executa `funcao()`; se o banco estiver travado, chama `desfazer()` e tenta de novo
+    com espera exponencial (e aleatória, para os escritores não voltarem juntos).
+    Levanta BancoOcupado quando as tentativas acabam."""
+    for tentativa in range(tentativas):
+        try:
+            return funcao()
+        except OperationalError as erro:
+            desfazer()
+            if not banco_travado(erro):
+                raise
+            if tentativa == tentativas - 1:
+                raise BancoOcupado() from erro
+            time.sleep(espera * 2 ** tentativa * random.uniform(0.5, 1.5))
+
+
+def executar_escrita(funcao):
+    """Executa `funcao()` e faz o commit na sessão do Flask-SQLAlchemy, repetindo a
+    transação inteira se o banco estiver travado. Retorna o resultado de `funcao`."""
+    def transacao():
+        resultado = funcao()
+        db.session.commit()
+        return resultado
+
+    config = current_app.config
+    try:
+        return repetir_se_travado(transacao, db.session.rollback,
+                                  config.get('BANCO_TENTATIVAS', 3), config.get('BANCO_ESPERA_INICIAL', 0.05))
+    except BancoOcupado:
+        logger.warning('escrita desistiu: banco travado após %d tentativas', config.get('BANCO_TENTATIVAS', 3))
+        raise
@@ -0,0 +1,994 @@
+import argparse
+import itertools
+import json
+import multiprocessing
+import os
+import random
+import signal
+import socket
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+import urllib.request
+from collections import deque
+from datetime import date, datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.engine import make_url
+from sqlalchemy.pool import NullPool
+from flask import Response
+from flask.sessions import SecureCookieSessionInterface
+from werkzeug.security import generate_password_hash, check_password_hash
+from app import create_app
+from models import (db, Usuario, Materia, Inscricao, Atividade, Entrega, ConteudoEntrega, Tarefa, CalendarioAula,
+                    FrequenciaAluno, turma_alunos)
+from sessoes import InterfaceSessaoServidor, criar_armazem
+from notas import MAX_NOTAS_POR_LANCAMENTO
+from banco import PERFIS, opcoes_engine, aplicar_pragmas, repetir_se_travado
+from busca import COMANDOS_INDICES, comandos_indice, LIMITE_RANQUEAMENTO, TAMANHO_PAGINA, consulta_fts
+from similaridade import LIMIAR, assinaturas, agrupar, shingles
+from presencas import bits, conjunto, gravar_frequencias, historico_presencas
+from conteudos import RESPOSTAS_POR_PAGINA, guardar_conteudos, textos_das_entregas
+import risco
+
+ARQUIVO_BASELINE = 'benchmark_baseline.json'
+
+# Sem trabalhadores da fila neste processo: tarefas rodando junto distorceriam as medições.
+app = create_app({'TAREFAS_TRABALHADORES': 0})
+
+
+def percentil(valores, p):
+    ordenados = sorted(valores)
+    indice = max(0, min(len(ordenados) - 1, round(p / 100 * len(ordenados)) - 1))
+    return ordenados[indice]
+
+
+class ContadorSQL:
+
+    def __init__(self, engine):
+        self.total = 0
+        event.listen(engine, 'before_cursor_execute', self._contar)
+
+    def _contar(self, *args):
+        self.total += 1
+
+
+def montar_contexto():
+    # Escolhe um aluno inscrito e o professor de uma das matérias dele, de preferência
+    # entre os dados sintéticos (ids mais altos), para medir páginas com volume real.
+    aluno_id, materia_id = (db.session.query(Inscricao.aluno_id, Inscricao.materia_id)
+                            .order_by(Inscricao.aluno_id.desc()).first())
+    materia = db.session.get(Materia, materia_id)
+    atividade = Atividade.query.filter_by(materia_id=materia_id).first()
+    entrega = Entrega.query.filter_by(atividade_id=atividade.id).first() if atividade else None
+    turma_id = db.session.execute(
+        db.select(turma_alunos.c.turma_id).where(turma_alunos.c.aluno_id == aluno_id)
+    ).scalar()
+    return {
+        'aluno': {'ra': db.session.get(Usuario, aluno_id).ra, 'password': 'aluno123'},
+        'professor': {'email': materia.professor.email, 'password': 'prof123'},
+        'diretor': {'email': 'diretor@exemplo.com', 'password': 'diretor123'},
+        'aluno_id': aluno_id,
+        'materia_id': materia_id,
+        'materia_nome': materia.nome,
+        'atividade_id': atividade.id if atividade else 0,
+        'entrega_id': entrega.id if entrega else 0,
+        'entregas_ids': db.session.scalars(
+            db.select(Entrega.id).where(Entrega.atividade_id == atividade.id).limit(MAX_NOTAS_POR_LANCAMENTO)
+        ).all() if atividade else [],
+        'turma_id': turma_id or 0,
+        'tarefa_id': db.session.execute(db.select(db.func.max(Tarefa.id))).scalar() or 0,
+    }
+
+
+# (endpoint, método, perfil logado, url, dados do formulário)
+CENARIOS = [
+    ('publico.index', 'GET', None, lambda c: '/', None),
+    ('publico.login_aluno_page', 'GET', None, lambda c: '/login/aluno', None),
+    ('publico.login_professor_page', 'GET', None, lambda c: '/login/professor', None),
+    ('publico.login', 'POST', None, lambda c: '/login', lambda c: c['aluno']),
+    ('aluno.dashboard_aluno', 'GET', 'aluno', lambda c: '/dashboard/aluno', None),
+    ('aluno.materia_detalhes_aluno', 'GET', 'aluno', lambda c: f"/aluno/materia/{c['materia_id']}", None),
+    ('aluno.historico_materia_aluno', 'GET', 'aluno', lambda c: f"/aluno/materia/{c['materia_id']}/historico", None),
+    ('aluno.resumo_materia_aluno', 'GET', 'aluno', lambda c: f"/aluno/materia/{c['materia_id']}/resumo", None),
+    ('aluno.responder_atividade', 'GET', 'aluno', lambda c: f"/atividade/{c['atividade_id']}", None),
+    ('professor.dashboard_professor', 'GET', 'professor', lambda c: '/dashboard/professor', None),
+    ('professor.materia_detalhes_professor', 'GET', 'professor', lambda c: f"/professor/materia/{c['materia_id']}", None),
+    ('professor.registrar_presenca', 'POST', 'professor', lambda c: f"/professor/materia/{c['materia_id']}/registrar_presenca",
+     lambda c: {'data_presenca': '2025-12-01'}),
+    ('professor.criar_atividade', 'GET', 'professor', lambda c: f"/professor/materia/{c['materia_id']}/criar_atividade", None),
+    ('professor.ver_entregas', 'GET', 'professor', lambda c: f"/professor/atividade/{c['atividade_id']}/entregas", None),
+    # A segunda página de respostas, como a página de entregas pede ao rolar.
+    ('professor.respostas_entregas', 'GET', 'professor', lambda c: f"/professor/atividade/{c['atividade_id']}/respostas"
+     f"?ids={','.join(map(str, c['entregas_ids'][RESPOSTAS_POR_PAGINA:2 * RESPOSTAS_POR_PAGINA]))}", None),
+    ('professor.exportar_materia', 'GET', 'professor', lambda c: f"/professor/materia/{c['materia_id']}/exportar/presencas", None),
+    ('professor.atribuir_nota', 'POST', 'professor', lambda c: f"/professor/entrega/{c['entrega_id']}/atribuir_nota",
+     lambda c: {'nota': '7'}),
+    # Todas as entregas da atividade num envio; a partir da 2ª repetição nenhuma nota muda.
+    ('professor.lancar_notas', 'POST', 'professor', lambda c: f"/professor/atividade/{c['atividade_id']}/notas",
+     lambda c: {f'nota-{entrega_id}': '7' for entrega_id in c['entregas_ids']}),
+    ('professor.buscar', 'GET', 'professor', lambda c: '/professor/busca?q=resposta+aluno', None),
+    ('professor.reanalisar_similaridade', 'POST', 'professor',
+     lambda c: f"/professor/atividade/{c['atividade_id']}/similaridade", None),
+    ('diretoria.dashboard_diretor', 'GET', 'diretor', lambda c: '/dashboard/diretor', None),
+    ('diretoria.gerenciar_professores', 'GET', 'diretor', lambda c: '/diretor/professores', None),
+    ('diretoria.cadastrar_professor', 'GET', 'diretor', lambda c: '/diretor/cadastrar_professor', None),
+    ('diretoria.gerenciar_turmas', 'GET', 'diretor', lambda c: '/diretor/turmas', None),
+    ('diretoria.detalhes_turma', 'GET', 'diretor', lambda c: f"/diretor/turma/{c['turma_id']}", None),
+    # Cada remoção é seguida da inclusão correspondente, que restaura os dados; as
+    # repetições seguintes medem o caminho idempotente (diferença vazia).
+    ('diretoria.remover_materia_turma', 'POST', 'diretor',
+     lambda c: f"/diretor/turma/{c['turma_id']}/materias/{c['materia_id']}/remover", None),
+    ('diretoria.adicionar_materia_turma', 'POST', 'diretor', lambda c: f"/diretor/turma/{c['turma_id']}/materias",
+     lambda c: {'materia_id': c['materia_id']}),
+    ('diretoria.remover_aluno_turma', 'POST', 'diretor',
+     lambda c: f"/diretor/turma/{c['turma_id']}/alunos/{c['aluno_id']}/remover", None),
+    ('diretoria.adicionar_alunos_turma', 'POST', 'diretor', lambda c: f"/diretor/turma/{c['turma_id']}/alunos",
+     lambda c: {'ras': c['aluno']['ra']}),
+    ('diretoria.exportar_turma', 'GET', 'diretor', lambda c: f"/diretor/turma/{c['turma_id']}/exportar/notas", None),
+    ('diretoria.cadastrar_turma', 'GET', 'diretor', lambda c: '/diretor/cadastrar_turma', None),
+    ('diretoria.gerenciar_alunos', 'GET', 'diretor', lambda c: '/diretor/alunos', None),
+    ('diretoria.buscar', 'GET', 'diretor', lambda c: '/diretor/busca?q=prof', None),
+    ('diretoria.cadastrar_aluno', 'GET', 'diretor', lambda c: '/diretor/cadastrar_aluno', None),
+    ('diretoria.importar_csv', 'GET', 'diretor', lambda c: '/diretor/importar', None),
+    ('diretoria.metricas', 'GET', 'diretor', lambda c: '/diretor/metrics', None),
+    ('diretoria.tarefas', 'GET', 'diretor', lambda c: '/diretor/tarefas', None),
+    ('diretoria.enfileirar_tarefa', 'POST', 'diretor', lambda c: '/diretor/tarefas/nova',
+     lambda c: {'tipo': 'recalcular_estatisticas'}),
+    ('diretoria.status_tarefa', 'GET', 'diretor', lambda c: f"/diretor/tarefas/{c['tarefa_id']}", None),
+    ('diretoria.baixar_arquivo_tarefa', 'GET', 'diretor', lambda c: f"/diretor/tarefas/{c['tarefa_id']}/arquivo", None),
+    ('diretoria.gerenciar_materias', 'GET', 'diretor', lambda c: '/diretor/materias', None),
+    # Nome repetido: mede o caminho de validação sem criar uma matéria a cada iteração.
+    ('diretoria.cadastrar_materia', 'POST', 'diretor', lambda c: '/diretor/cadastrar_materia',
+     lambda c: {'nome': c['materia_nome'], 'professor_id': '1'}),
+    # Encerra as sessões do aluno do contexto; os cenários de aluno já rodaram.
+    ('diretoria.encerrar_sessoes_usuario', 'POST', 'diretor', lambda c: f"/diretor/usuario/{c['aluno_id']}/encerrar_sessoes", None),
+    ('publico.logout', 'GET', None, lambda c: '/logout', None),
+]
+
+
+def medir_rotas(iteracoes, aquecimento, filtro=None, condicional=False):
+    with app.app_context():
+        contador = ContadorSQL(db.engine)
+        contexto = montar_contexto()
+
+    cobertos = {cenario[0] for cenario in CENARIOS}
+    sem_cenario = sorted(r.endpoint for r in app.url_map.iter_rules()
+                         if r.endpoint != 'static' and r.endpoint not in cobertos)
+    for endpoint in sem_cenario:
+        print(f"Aviso: a rota '{endpoint}' não tem cenário no benchmark.", file=sys.stderr)
+
+    clientes = {}
+    for perfil in ('aluno', 'professor', 'diretor'):
+        clientes[perfil] = app.test_client()
+        clientes[perfil].post('/login', data=contexto[perfil])
+
+    resultados = {}
+    for endpoint, metodo, perfil, url, dados in CENARIOS:
+        if filtro and endpoint not in filtro:
+            continue
+        cliente = clientes[perfil] if perfil else app.test_client()
+        tempos, comandos = [], []
+        etag = None
+        for i in range(aquecimento + iteracoes):
+            contador.total = 0
+            # Com --condicional, cada GET repete a ETag da resposta anterior, como um navegador com cache.
+            cabecalhos = {'If-None-Match': etag} if etag else None
+            inicio = time.perf_counter()
+            resposta = cliente.open(url(contexto), method=metodo, data=dados(contexto) if dados else None,
+                                    headers=cabecalhos)
+            # Consome o corpo inteiro: nas rotas com streaming a latência inclui a geração toda.
+            resposta.get_data()
+            resposta.close()
+            duracao = time.perf_counter() - inicio
+            if resposta.status_code >= 500:
+                raise RuntimeError(f"{endpoint} respondeu {resposta.status_code}")
+            if condicional and metodo == 'GET':
+                etag = resposta.headers.get('ETag', etag)
+            if i >= aquecimento:
+                tempos.append(duracao * 1000)
+                comandos.append(contador.total)
+        resultados[endpoint] = {
+            'p50_ms': round(percentil(tempos, 50), 2),
+            'p99_ms': round(percentil(tempos, 99), 2),
+            'sql': max(comandos),
+        }
+    return resultados
+
+
+def comparar(resultados, baseline, tolerancia, folga_ms):
+    regressoes = []
+    for endpoint, atual in resultados.items():
+        base = baseline.get(endpoint)
+        if not base:
+            continue
+        if atual['sql'] > base['sql']:
+            regressoes.append(f"{endpoint}: {atual['sql']} comandos SQL (baseline {base['sql']})")
+        limite = max(base['p99_ms'] * (1 + tolerancia), base['p99_ms'] + folga_ms)
+        if atual['p99_ms'] > limite:
+            regressoes.append(f"{endpoint}: p99 {atual['p99_ms']}ms (baseline {base['p99_ms']}ms)")
+    return regressoes
+
+
+def comando_rotas(args):
+    resultados = medir_rotas(args.iteracoes, args.aquecimento, args.rota, args.condicional)
+
+    print(f"{'rota':<40} {'p50 (ms)':>10} {'p99 (ms)':>10} {'SQL':>5}")
+    for endpoint, r in resultados.items():
+        print(f"{endpoint:<40} {r['p50_ms']:>10.2f} {r['p99_ms']:>10.2f} {r['sql']:>5}")
+
+    if args.salvar_baseline:
+        with open(args.baseline, 'w', encoding='utf-8') as arquivo:
+            json.dump(resultados, arquivo, indent=2, ensure_ascii=False)
+        print(f"\nBaseline salvo em {args.baseline}.")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print(f"\nSem baseline em {args.baseline}; use --salvar-baseline para criar um.")
+        return 0
+
+    with open(args.baseline, encoding='utf-8') as arquivo:
+        regressoes = comparar(resultados, json.load(arquivo), args.tolerancia, args.folga_ms)
+    if regressoes:
+        print("\nRegressões em relação ao baseline:")
+        for regressao in regressoes:
+            print(f"- {regressao}")
+        return 1
+    print("\nNenhuma regressão em relação ao baseline.")
+    return 0
+
+
+def vazao(funcao, total, threads):
+    inicio = time.perf_counter()
+    if threads == 1:
+        for _ in range(total):
+            funcao()
+    else:
+        with ThreadPoolExecutor(max_workers=threads) as executor:
+            list(executor.map(lambda _: funcao(), range(total)))
+    return total / (time.perf_counter() - inicio)
+
+
+def comando_login(args):
+    nucleos = os.cpu_count() or 1
+    threads = args.threads or nucleos
+    metodos = args.metodo or [app.config['SENHA_METODO_HASH']]
+    print(f"Núcleos: {nucleos}, threads: {threads}\n")
+
+    print(f"{'método de hash':<28} {'1 thread/s':>12} {'pool/s':>10} {'por núcleo/s':>14}")
+    for metodo in metodos:
+        senha_hash = generate_password_hash('senha-de-teste', metodo)
+        verificar = lambda: check_password_hash(senha_hash, 'senha-de-teste')
+        sequencial = vazao(verificar, args.total, 1)
+        paralelo = vazao(verificar, args.total, threads)
+        print(f"{metodo:<28} {sequencial:>12.1f} {paralelo:>10.1f} {paralelo / nucleos:>14.1f}")
+
+    # Rota /login completa (consulta, pool de verificação e sessão), com um cliente por thread.
+    with app.app_context():
+        contexto = montar_contexto()
+
+    def logar():
+        resposta = app.test_client().post('/login', data=contexto['aluno'])
+        if resposta.status_code != 302:
+            raise RuntimeError(f"login respondeu {resposta.status_code}")
+
+    print(f"\n{'rota /login':<28} {'1 thread/s':>12} {'threads/s':>10} {'por núcleo/s':>14}")
+    sequencial = vazao(logar, args.total, 1)
+    paralelo = vazao(logar, args.total, threads)
+    print(f"{app.config['SENHA_METODO_HASH']:<28} {sequencial:>12.1f} {paralelo:>10.1f} {paralelo / nucleos:>14.1f}")
+    return 0
+
+
+def custo_sessao(interface, total, alterar):
+    # Abre e salva a sessão de um usuário logado como o Flask faz em cada requisição.
+    dados = {'authenticated': True, 'user_id': 42, 'username': 'Aluno Sintético', 'role': 'aluno',
+             'versao_acesso': 3, 'materias': list(range(100, 108))}
+    with app.test_request_context():
+        sessao = interface.open_session(app, app.request_class({}))
+        sessao.update(dados)
+        resposta = Response()
+        interface.save_session(app, sessao, resposta)
+        cookie = resposta.headers['Set-Cookie'].split(';', 1)[0]
+
+    inicio = time.perf_counter()
+    for i in range(total):
+        with app.test_request_context(headers={'Cookie': cookie}) as contexto:
+            sessao = interface.open_session(app, contexto.request)
+            sessao['user_id']
+            if alterar:
+                sessao['versao_acesso'] = i
+            interface.save_session(app, sessao, Response())
+    return (time.perf_counter() - inicio) / total * 1_000_000
+
+
+def comando_sessoes(args):
+    interfaces = [('cookie assinado', SecureCookieSessionInterface(), None)]
+    for backend in ('memoria', 'sqlite'):
+        app.config['SESSAO_BACKEND'] = backend
+        interfaces.append((f'servidor ({backend})', InterfaceSessaoServidor(), criar_armazem(app)))
+
+    print(f"{'armazenamento':<22} {'leitura (us)':>14} {'alteração (us)':>16}")
+    for nome, interface, armazem in interfaces:
+        if armazem is not None:
+            app.extensions['armazem_sessoes'] = armazem
+        leitura = custo_sessao(interface, args.total, alterar=False)
+        alteracao = custo_sessao(interface, args.total, alterar=True)
+        print(f"{nome:<22} {leitura:>14.1f} {alteracao:>16.1f}")
+        if armazem is not None:
+            armazem.revogar_usuario(42)
+    # O contexto de requisição vazio entra em todas as medições; desconte-o para ver só a sessão.
+    inicio = time.perf_counter()
+    for _ in range(args.total):
+        with app.test_request_context():
+            pass
+    print(f"{'(contexto vazio)':<22} {(time.perf_counter() - inicio) / args.total * 1_000_000:>14.1f}")
+    return 0
+
+
+_SQL_CONJUNTO = text(
+    "SELECT registradas, presentes FROM frequencias"
+    " WHERE aluno_id = :aluno_id AND materia_id = :materia_id AND periodo = :periodo"
+)
+_SQL_PRESENCA = text(
+    "INSERT INTO frequencias (aluno_id, materia_id, periodo, registradas, presentes, aulas, presencas)"
+    " VALUES (:aluno_id, :materia_id, :periodo, :registradas, :presentes, :aulas, :presencas)"
+    " ON CONFLICT (aluno_id, materia_id, periodo) DO UPDATE SET registradas = excluded.registradas,"
+    " presentes = excluded.presentes, aulas = excluded.aulas, presencas = excluded.presencas"
+)
+_SQL_RESUMO = text(
+    "UPDATE resumos_aluno_materia SET"
+    " aulas_total = (SELECT sum(aulas) FROM frequencias WHERE aluno_id = :aluno_id AND materia_id = :materia_id),"
+    " aulas_presente = (SELECT sum(presencas) FROM frequencias WHERE aluno_id = :aluno_id"
+    " AND materia_id = :materia_id) WHERE aluno_id = :aluno_id AND materia_id = :materia_id"
+)
+# Leitura longa, como uma exportação: no modo de journal padrão segura o lock de leitura.
+_SQL_LEITURA = text("SELECT count(*), avg(nota) FROM entregas JOIN usuarios ON usuarios.id = entregas.aluno_id")
+
+
+def _escritor(url, perfil, pares, numero, segundos, resultados):
+    # Uma transação = leitura do resumo + presença gravada no conjunto de bits + recálculo
+    # do resumo, o mesmo padrão de registrar_presenca e responder_atividade.
+    pragmas = PERFIS[perfil]
+    engine = create_engine(url, **opcoes_engine(url, pragmas))
+    aplicar_pragmas(engine, pragmas)
+    tempos, falhas, i = [], 0, 0
+    fim = time.perf_counter() + segundos
+    with engine.connect() as conn:
+        while time.perf_counter() < fim:
+            aluno_id, materia_id = pares[i % len(pares)]
+            # Um período próprio por escritor, para não disputarem os mesmos conjuntos.
+            parametros = {'aluno_id': aluno_id, 'materia_id': materia_id, 'periodo': f'e{numero}'}
+            dia = i // len(pares)
+            i += 1
+
+            def transacao():
+                conn.execute(text("SELECT * FROM resumos_aluno_materia WHERE aluno_id = :aluno_id"
+                                  " AND materia_id = :materia_id"), parametros).all()
+                atual = conn.execute(_SQL_CONJUNTO, parametros).first()
+                registradas = bits(atual.registradas) if atual else 0
+                presentes = bits(atual.presentes) if atual else 0
+                registradas, presentes = registradas | 1 << dia, presentes | 1 << dia
+                conn.execute(_SQL_PRESENCA, {**parametros, 'registradas': conjunto(registradas),
+                                             'presentes': conjunto(presentes), 'aulas': registradas.bit_count(),
+                                             'presencas': presentes.bit_count()})
+                conn.execute(_SQL_RESUMO, parametros)
+                conn.commit()
+
+            inicio = time.perf_counter()
+            try:
+                if perfil == 'padrao':
+                    transacao()
+                else:
+                    repetir_se_travado(transacao, conn.rollback, 4, 0.05)
+                tempos.append((time.perf_counter() - inicio) * 1000)
+            except Exception:
+                conn.rollback()
+                falhas += 1
+    resultados.put((tempos, falhas))
+    engine.dispose()
+
+
+def _leitor(url, perfil, parar):
+    pragmas = PERFIS[perfil]
+    engine = create_engine(url, **opcoes_engine(url, pragmas))
+    aplicar_pragmas(engine, pragmas)
+    with engine.connect() as conn:
+        while not parar.is_set():
+            conn.execute(_SQL_LEITURA).all()
+            conn.rollback()
+    engine.dispose()
+
+
+def comando_escrita(args):
+    origem = make_url(app.config['SQLALCHEMY_DATABASE_URI']).database
+    with app.app_context():
+        pares = [tuple(par) for par in db.session.execute(
+            db.select(Inscricao.aluno_id, Inscricao.materia_id).limit(1000)
+        )]
+    contexto = multiprocessing.get_context('fork')
+
+    print(f"{'perfil':<10} {'escritores':>10} {'transações/s':>14} {'p50 (ms)':>10} {'p99 (ms)':>10} {'falhas':>7}")
+    for perfil in args.perfil or ['padrao', 'producao']:
+        with tempfile.TemporaryDirectory() as pasta:
+            # Cada perfil roda numa cópia do banco; o modo de journal fica gravado no arquivo.
+            copia = os.path.join(pasta, 'escrita.db')
+            with sqlite3.connect(origem) as fonte, sqlite3.connect(copia) as destino:
+                fonte.backup(destino)
+                destino.execute("PRAGMA journal_mode = DELETE")
+            url = f'sqlite:///{copia}'
+
+            parar = contexto.Event()
+            leitores = [contexto.Process(target=_leitor, args=(url, perfil, parar)) for _ in range(args.leitores)]
+            resultados = contexto.Queue()
+            escritores = [contexto.Process(target=_escritor, args=(url, perfil, pares, n, args.segundos, resultados))
+                          for n in range(args.escritores)]
+            for processo in leitores + escritores:
+                processo.start()
+            coletados = [resultados.get() for _ in escritores]
+            parar.set()
+            for processo in leitores + escritores:
+                processo.join()
+
+        tempos = [t for tempos_escritor, _ in coletados for t in tempos_escritor]
+        falhas = sum(f for _, f in coletados)
+        print(f"{perfil:<10} {args.escritores:>10} {len(tempos) / args.segundos:>14.1f} "
+              f"{percentil(tempos, 50) if tempos else 0:>10.2f} {percentil(tempos, 99) if tempos else 0:>10.2f} "
+              f"{falhas:>7}")
+    return 0
+
+
+_SCRIPT_INICIALIZACAO = """
+import sys, time
+inicio = time.perf_counter()
+from app import create_app
+app = create_app({'AREAS': sys.argv[1].split(',')} if len(sys.argv) > 1 else None)
+print(time.perf_counter() - inicio)
+"""
+
+
+def _memoria(pid):
+    # RSS conta as páginas compartilhadas inteiras em cada processo; PSS as divide entre
+    # quem as compartilha, e a parte privada é o que cada worker custa de fato.
+    campos = {}
+    with open(f'/proc/{pid}/smaps_rollup') as arquivo:
+        for linha in arquivo:
+            partes = linha.split()
+            if len(partes) == 3 and partes[2] == 'kB':
+                campos[partes[0].rstrip(':')] = int(partes[1])
+    return campos['Rss'], campos['Pss'], campos['Private_Clean'] + campos['Private_Dirty']
+
+
+def _filhos(pid):
+    filhos = []
+    for entrada in os.listdir('/proc'):
+        if entrada.isdigit():
+            try:
+                with open(f'/proc/{entrada}/stat') as arquivo:
+                    if int(arquivo.read().rsplit(')', 1)[1].split()[1]) == pid:
+                        filhos.append(int(entrada))
+            except (OSError, IndexError):
+                pass
+    return filhos
+
+
+def _medir_servidor(workers, preload, requisicoes):
+    with socket.socket() as livre:
+        livre.bind(('127.0.0.1', 0))
+        porta = livre.getsockname()[1]
+    ambiente = {**os.environ, 'SIGMA_BIND': f'127.0.0.1:{porta}', 'SIGMA_WORKERS': str(workers),
+                'SIGMA_PRELOAD': '1' if preload else '0'}
+    inicio = time.perf_counter()
+    mestre = subprocess.Popen([sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py'], env=ambiente,
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        # Pronto quando o servidor responde e todos os workers já foram criados.
+        while True:
+            if time.perf_counter() - inicio > 60:
+                raise RuntimeError("o servidor não subiu em 60 s")
+            try:
+                with urllib.request.urlopen(f'http://127.0.0.1:{porta}/login/aluno', timeout=5) as resposta:
+                    resposta.read()
+                if len(_filhos(mestre.pid)) >= workers:
+                    break
+            except OSError:
+                pass
+            time.sleep(0.02)
+        subida = time.perf_counter() - inicio
+        for _ in range(requisicoes):
+            for url in ('/', '/login/aluno', '/login/professor'):
+                with urllib.request.urlopen(f'http://127.0.0.1:{porta}{url}', timeout=5) as resposta:
+                    resposta.read()
+        memorias = [_memoria(pid) for pid in _filhos(mestre.pid)]
+    finally:
+        mestre.send_signal(signal.SIGTERM)
+        mestre.wait(timeout=30)
+    return subida, memorias
+
+
+def comando_servidor(args):
+    print(f"{'create_app':<28} {'mediana (ms)':>14}")
+    for areas in (None, 'aluno'):
+        tempos = []
+        for _ in range(args.repeticoes):
+            saida = subprocess.run([sys.executable, '-c', _SCRIPT_INICIALIZACAO] + ([areas] if areas else []),
+                                   capture_output=True, text=True, check=True).stdout
+            tempos.append(float(saida.strip().splitlines()[-1]) * 1000)
+        print(f"{'todas as áreas' if areas is None else 'só ' + areas:<28} {statistics.median(tempos):>14.1f}")
+
+    print(f"\n{'gunicorn':<28} {'subida (s)':>11} {'RSS/worker':>11} {'PSS/worker':>11} {'privada/worker':>15}")
+    for preload in (False, True):
+        subida, memorias = _medir_servidor(args.workers, preload, args.requisicoes)
+        rss, pss, privada = (statistics.mean(m[i] for m in memorias) / 1024 for i in range(3))
+        nome = f"{args.workers} workers, {'com' if preload else 'sem'} preload"
+        print(f"{nome:<28} {subida:>11.2f} {rss:>9.1f}MB {pss:>9.1f}MB {privada:>13.1f}MB")
+    return 0
+
+
+_SILABAS = [c + v for c in 'bcdfglmnprstv' for v in 'aeiou']
+
+
+def _texto_sintetico(gerador, vocabulario, acumulados):
+    return ' '.join(gerador.choices(vocabulario, cum_weights=acumulados, k=gerador.randint(20, 60)))
+
+
+def comando_busca(args):
+    # Vocabulário com frequências de Zipf: poucas palavras muito comuns e uma cauda de raras,
+    # como nas respostas reais. Os termos medidos vão do mais comum ao mais raro, mais um
+    # que não aparece em nenhuma entrega (o pior caso do LIKE, que lê a tabela inteira).
+    gerador = random.Random(42)
+    vocabulario = sorted({''.join(gerador.choices(_SILABAS, k=gerador.randint(2, 5)))
+                          for _ in range(args.vocabulario)}, key=lambda _: gerador.random())
+    acumulados = list(itertools.accumulate(1 / (n + 1) for n in range(len(vocabulario))))
+    termos = [vocabulario[n] for n in (0, 10, 100, 1000, len(vocabulario) - 1)] + ['xyzzy']
+
+    with tempfile.TemporaryDirectory() as pasta:
+        url = f"sqlite:///{os.path.join(pasta, 'busca.db')}"
+        engine = create_engine(url)
+        db.metadata.create_all(engine, tables=[Usuario.__table__, Materia.__table__, Atividade.__table__,
+                                               ConteudoEntrega.__table__, Entrega.__table__])
+        inicio = time.perf_counter()
+        with engine.begin() as conn:
+            for comando in COMANDOS_INDICES:
+                conn.execute(text(comando))
+            for lote in range(0, args.linhas, 10_000):
+                ids = guardar_conteudos(conn, [_texto_sintetico(gerador, vocabulario, acumulados)
+                                               for _ in range(lote, min(lote + 10_000, args.linhas))])
+                conn.execute(Entrega.__table__.insert(), [
+                    {'conteudo_id': conteudo_id, 'aluno_id': 1, 'atividade_id': 1} for conteudo_id in ids
+                ])
+        # Com os triggers ativos: é o custo de manter o índice em cada gravação.
+        duracao = time.perf_counter() - inicio
+        print(f"{args.linhas} entregas inseridas com o índice ativo em {duracao:.1f}s "
+              f"({args.linhas / duracao:.0f} linhas/s)")
+
+        # O LIKE precisa descomprimir cada resposta (view textos_entregas).
+        like = ("SELECT e.id, t.conteudo FROM textos_entregas t JOIN entregas e ON e.conteudo_id = t.id"
+                " WHERE t.conteudo LIKE :padrao ORDER BY t.id DESC LIMIT :limite")
+        fts = ("SELECT e.id, snippet(busca_entregas, 0, '[', ']', '…', 16) FROM busca_entregas"
+               " JOIN entregas e ON e.conteudo_id = busca_entregas.rowid WHERE busca_entregas MATCH :consulta"
+               " ORDER BY {ordem} LIMIT :limite")
+        contagem = ("SELECT count(*) FROM (SELECT 1 FROM busca_entregas WHERE busca_entregas MATCH :consulta"
+                    " LIMIT :teto)")
+
+        def rota(conn, parametros):
+            # Mesma regra de busca.py: bm25 até LIMITE_RANQUEAMENTO resultados, depois as mais recentes.
+            comuns = conn.execute(text(contagem), parametros).scalar() > LIMITE_RANQUEAMENTO
+            ordem = 'busca_entregas.rowid DESC' if comuns else 'bm25(busca_entregas)'
+            return conn.execute(text(fts.format(ordem=ordem)), parametros).all()
+
+        medidas = {
+            'LIKE': lambda conn, parametros: conn.execute(text(like), parametros).all(),
+            'FTS5 bm25': lambda conn, parametros: conn.execute(
+                text(fts.format(ordem='bm25(busca_entregas)')), parametros).all(),
+            'FTS5 rota': rota,
+        }
+        print(f"{'termo':<12} {'ocorrências':>12}" + ''.join(f" {nome + ' p50 (ms)':>19}" for nome in medidas))
+        with engine.connect() as conn:
+            for termo in termos:
+                parametros = {'padrao': f'%{termo}%', 'consulta': consulta_fts(termo),
+                              'limite': TAMANHO_PAGINA + 1, 'teto': LIMITE_RANQUEAMENTO + 1}
+                ocorrencias = conn.execute(text("SELECT count(*) FROM busca_entregas WHERE busca_entregas MATCH :consulta"),
+                                           parametros).scalar()
+                medianas = []
+                for medir in medidas.values():
+                    tempos = []
+                    for _ in range(args.repeticoes):
+                        inicio = time.perf_counter()
+                        medir(conn, parametros)
+                        tempos.append((time.perf_counter() - inicio) * 1000)
+                    medianas.append(statistics.median(tempos))
+                print(f"{termo:<12} {ocorrencias:>12}" + ''.join(f" {mediana:>19.2f}" for mediana in medianas))
+        engine.dispose()
+    return 0
+
+
+def comando_similaridade(args):
+    # Respostas sintéticas de 40 a 120 palavras; uma fração delas copia outra resposta
+    # trocando algumas palavras, formando os pares que a análise deve encontrar.
+    gerador = random.Random(7)
+    vocabulario = sorted({''.join(gerador.choices(_SILABAS, k=gerador.randint(2, 4))) for _ in range(5000)})
+    textos, copias = [], []
+    for n in range(args.entregas):
+        if textos and gerador.random() < args.copias:
+            original = gerador.randrange(len(textos))
+            palavras = textos[original].split()
+            for _ in range(len(palavras) // 20):
+                palavras[gerador.randrange(len(palavras))] = gerador.choice(vocabulario)
+            textos.append(' '.join(palavras))
+            copias.append((original, n))
+        else:
+            textos.append(' '.join(gerador.choices(vocabulario, k=gerador.randint(40, 120))))
+
+    inicio = time.perf_counter()
+    matriz, _ = assinaturas(textos)
+    tempo_assinaturas = time.perf_counter() - inicio
+    inicio = time.perf_counter()
+    rotulos, _ = agrupar(matriz)
+    tempo_agrupar = time.perf_counter() - inicio
+
+    conjuntos = [shingles(texto) for texto in textos]
+    esperados = [(a, b) for a, b in copias if len(conjuntos[a] & conjuntos[b]) / len(conjuntos[a] | conjuntos[b]) >= LIMIAR]
+    encontrados = sum(rotulos[a] == rotulos[b] for a, b in esperados)
+
+    # Referência: todas as assinaturas comparadas duas a duas (O(n²)), por blocos de linhas.
+    inicio = time.perf_counter()
+    for linha in range(0, len(matriz), 256):
+        (matriz[linha:linha + 256, None, :] == matriz[None, :, :]).mean(axis=2)
+    tempo_todos_pares = time.perf_counter() - inicio
+
+    print(f"{args.entregas} entregas, {len(esperados)} cópias com similaridade >= {LIMIAR}")
+    print(f"assinaturas MinHash:          {tempo_assinaturas:8.2f}s ({matriz.nbytes / 1024:.0f} KB)")
+    print(f"agrupamento por LSH:          {tempo_agrupar:8.2f}s ({encontrados} de {len(esperados)} cópias agrupadas)")
+    print(f"todos os pares de assinaturas: {tempo_todos_pares:7.2f}s")
+    return 0
+
+
+def _dados_risco(inscricoes, gerador):
+    # 40 alunos por matéria, 30 aulas e 10 atividades por matéria em 16 semanas; cada
+    # aluno tem sua assiduidade e seu nível, e as notas variam em torno do nível.
+    alunos_por_materia, aulas, atividades = 40, 30, 10
+    materias = np.arange(inscricoes) // alunos_por_materia
+    inicio = risco.dia_juliano(date(2025, 2, 3))
+    dias_aula = inicio + np.sort(gerador.integers(0, 16 * 7, (materias[-1] + 1, aulas)), axis=1)
+    dias_atividade = inicio + np.sort(gerador.integers(0, 16 * 7, (materias[-1] + 1, atividades)), axis=1)
+    assiduidade = gerador.beta(8, 1.5, inscricoes)
+    nivel = gerador.normal(7, 1.5, inscricoes)
+
+    presenca_par = np.repeat(np.arange(inscricoes), aulas)
+    entrega_todas = np.repeat(np.arange(inscricoes), atividades)
+    entregou = gerador.random(len(entrega_todas)) < assiduidade[entrega_todas]
+    entrega_par = entrega_todas[entregou]
+    notas = np.clip(gerador.normal(nivel[entrega_par], 1.5), 0, 10)
+    notas[gerador.random(len(notas)) < 0.1] = np.nan
+    return risco.Dados(
+        np.arange(inscricoes), materias, materias,
+        presenca_par, dias_aula[materias].ravel(), gerador.random(len(presenca_par)) < assiduidade[presenca_par],
+        entrega_par, dias_atividade[materias].ravel()[entregou], notas,
+        np.repeat(np.arange(materias[-1] + 1), atividades), dias_atividade.ravel(),
+    )
+
+
+def comando_risco(args):
+    gerador = np.random.default_rng(3)
+    print(f"{'inscrições':>11} {'linhas':>10} {'atributos':>10} {'treino':>9} {'pontuação':>10} {'µs/inscrição':>13}")
+    for inscricoes in args.inscricoes:
+        dados = _dados_risco(inscricoes, gerador)
+        referencia = risco.ultimo_dia(dados)
+        linhas = len(dados.presenca_par) + len(dados.entrega_par)
+        inicio = time.perf_counter()
+        antes, agora = risco.atributos(dados, referencia - risco.HORIZONTE_DIAS), risco.atributos(dados, referencia)
+        tempo_atributos = time.perf_counter() - inicio
+        inicio = time.perf_counter()
+        modelo = risco.treinar(antes, risco.situacao_reprovado(agora))
+        tempo_treino = time.perf_counter() - inicio
+        inicio = time.perf_counter()
+        risco.pontuar(modelo, agora)
+        tempo_pontuar = time.perf_counter() - inicio
+        total = tempo_atributos + tempo_treino + tempo_pontuar
+        print(f"{inscricoes:>11} {linhas:>10} {tempo_atributos:>9.3f}s {tempo_treino:>8.3f}s {tempo_pontuar:>9.3f}s"
+              f" {total / inscricoes * 1e6:>13.1f}")
+
+    # Leitura do banco configurado, que a análise completa faz antes de calcular.
+    with app.app_context():
+        with db.engine.connect() as conn:
+            inicio = time.perf_counter()
+            dados = risco.carregar(conn)
+            tempo_leitura = time.perf_counter() - inicio
+    linhas = len(dados.presenca_par) + len(dados.entrega_par)
+    print(f"\nbanco: {len(dados.alunos)} inscrições, {linhas} presenças e entregas lidas em {tempo_leitura:.2f}s")
+    return 0
+
+
+# Esquema da tabela de presenças anterior à migração 12: uma linha por aluno e aula.
+_ESQUEMA_PRESENCAS_LINHAS = [
+    "CREATE TABLE presencas (id INTEGER NOT NULL PRIMARY KEY, data DATE NOT NULL, presente BOOLEAN,"
+    " aluno_id INTEGER NOT NULL, materia_id INTEGER NOT NULL)",
+    "CREATE UNIQUE INDEX ix_presencas_aluno_materia_data ON presencas (aluno_id, materia_id, data)",
+    "CREATE INDEX ix_presencas_materia_data ON presencas (materia_id, data)",
+]
+
+
+def _medir_leituras(funcao, pares):
+    tempos = []
+    for par in pares:
+        inicio = time.perf_counter()
+        funcao(*par)
+        tempos.append((time.perf_counter() - inicio) * 1_000_000)
+    return statistics.median(tempos), percentil(tempos, 99)
+
+
+def comando_presencas(args):
+    # Presenças sintéticas: 40 alunos por matéria, cada inscrição com uma presença por
+    # aula num período; os mesmos dados gravados nos dois formatos, cada um num banco.
+    gerador = random.Random(11)
+    materias = args.alunos * args.materias_por_aluno // 40
+    inscricoes = sorted({(aluno, materia) for aluno in range(1, args.alunos + 1)
+                         for materia in gerador.sample(range(1, materias + 1), args.materias_por_aluno)},
+                        key=lambda par: (par[1], par[0]))
+    datas, dia = [], date(2025, 8, 4)
+    while len(datas) < args.aulas:
+        if dia.weekday() < 5:
+            datas.append(dia)
+        dia += timedelta(days=1)
+
+    def presencas():
+        for aluno, materia in inscricoes:
+            for data in datas:
+                yield aluno, materia, data, gerador.random() < 0.85
+
+    amostra = gerador.sample(inscricoes, min(args.leituras, len(inscricoes)))
+    historico_linhas = text("SELECT data, presente FROM presencas WHERE aluno_id = :a AND materia_id = :m"
+                            " ORDER BY data").columns(data=db.Date, presente=db.Boolean)
+    percentual_linhas = text("SELECT count(*), sum(presente) FROM presencas WHERE aluno_id = :a AND materia_id = :m")
+    percentual_conjuntos = text("SELECT sum(aulas), sum(presencas) FROM frequencias"
+                                " WHERE aluno_id = :a AND materia_id = :m")
+
+    with tempfile.TemporaryDirectory() as pasta:
+        resultados = {}
+        for formato in ('linhas', 'conjuntos'):
+            caminho = os.path.join(pasta, f'{formato}.db')
+            engine = create_engine(f'sqlite:///{caminho}')
+            inicio = time.perf_counter()
+            with engine.begin() as conn:
+                if formato == 'linhas':
+                    for comando in _ESQUEMA_PRESENCAS_LINHAS:
+                        conn.execute(text(comando))
+                    linhas = ({'aluno_id': a, 'materia_id': m, 'data': d, 'presente': p} for a, m, d, p in presencas())
+                    while lote := list(itertools.islice(linhas, 50_000)):
+                        conn.execute(text("INSERT INTO presencas (aluno_id, materia_id, data, presente)"
+                                          " VALUES (:aluno_id, :materia_id, :data, :presente)"), lote)
+                else:
+                    db.metadata.create_all(conn, tables=[CalendarioAula.__table__, FrequenciaAluno.__table__])
+                    gravar_frequencias(conn, presencas())
+            gravacao = time.perf_counter() - inicio
+            with engine.connect() as conn:
+                conn.exec_driver_sql("VACUUM")
+                if formato == 'linhas':
+                    historico = _medir_leituras(lambda a, m: conn.execute(historico_linhas, {'a': a, 'm': m}).all(), amostra)
+                    percentual = _medir_leituras(lambda a, m: conn.execute(percentual_linhas, {'a': a, 'm': m}).one(), amostra)
+                else:
+                    historico = _medir_leituras(lambda a, m: historico_presencas(a, m, conn), amostra)
+                    percentual = _medir_leituras(lambda a, m: conn.execute(percentual_conjuntos, {'a': a, 'm': m}).one(), amostra)
+            engine.dispose()
+            resultados[formato] = (os.path.getsize(caminho), gravacao, historico, percentual)
+
+    total = len(inscricoes) * len(datas)
+    print(f"{len(inscricoes)} inscrições x {len(datas)} aulas = {total} presenças")
+    print(f"{'formato':<10} {'tamanho':>10} {'bytes/presença':>15} {'gravação':>10}"
+          f" {'histórico p50/p99 (µs)':>24} {'percentual p50/p99 (µs)':>25}")
+    for formato, (tamanho, gravacao, historico, percentual) in resultados.items():
+        print(f"{formato:<10} {tamanho / 1024 / 1024:>8.1f}MB {tamanho / total:>15.2f} {gravacao:>9.2f}s"
+              f" {historico[0]:>11.0f} / {historico[1]:<10.0f} {percentual[0]:>12.0f} / {percentual[1]:<10.0f}")
+    return 0
+
+
+# Esquema das entregas anterior à migração 13: a resposta na própria linha da entrega,
+# indexada na busca por trigger.
+_ESQUEMA_ENTREGAS_LINHAS = [
+    "CREATE TABLE entregas (id INTEGER NOT NULL PRIMARY KEY, conteudo TEXT, data_envio DATETIME, nota FLOAT,"
+    " aluno_id INTEGER NOT NULL, atividade_id INTEGER NOT NULL)",
+    "CREATE INDEX ix_entregas_aluno_atividade ON entregas (aluno_id, atividade_id)",
+    "CREATE INDEX ix_entregas_atividade_id ON entregas (atividade_id)",
+    "CREATE VIRTUAL TABLE busca_entregas USING fts5(conteudo, content='entregas', content_rowid='id',"
+    " tokenize='unicode61 remove_diacritics 2', prefix='2 3')",
+    "CREATE TRIGGER busca_entregas_ai AFTER INSERT ON entregas BEGIN"
+    " INSERT INTO busca_entregas (rowid, conteudo) VALUES (new.id, new.conteudo); END",
+]
+
+# Consultas das rotas que leem entregas, com as mesmas colunas que elas pedem.
+_CONSULTAS_ENTREGAS = {
+    # historico_materia_aluno: notas do aluno nas atividades da matéria.
+    'notas do aluno': "SELECT atividade_id, nota FROM entregas WHERE aluno_id = :aluno"
+                      " AND atividade_id IN (:atividade, :atividade + 1, :atividade + 2)",
+    # lancar_notas: as entregas conferidas antes do UPDATE.
+    'lançar notas': "SELECT id, aluno_id, nota FROM entregas WHERE atividade_id = :atividade",
+    # atribuir_nota: a entrega inteira, como o ORM a carrega.
+    'corrigir entrega': "SELECT * FROM entregas WHERE id = :entrega",
+    # ver_entregas: todas as entregas da atividade.
+    'ver entregas': "SELECT * FROM entregas WHERE atividade_id = :atividade ORDER BY id",
+}
+
+
+def _bytes_lidos():
+    # Bytes pedidos ao sistema pelas leituras do processo, inclusive os servidos pelo cache do SO.
+    with open('/proc/self/io') as arquivo:
+        return next(int(linha.split()[1]) for linha in arquivo if linha.startswith('rchar:'))
+
+
+def _respostas_sinteticas(total, copias):
+    # Respostas de 100 a 800 palavras com frequências de Zipf; uma fração `copias` repete
+    # uma resposta recente, como numa cópia entre colegas.
+    gerador = random.Random(25)
+    vocabulario = sorted({''.join(gerador.choices(_SILABAS, k=gerador.randint(2, 5))) for _ in range(20_000)})
+    acumulados = list(itertools.accumulate(1 / (n + 1) for n in range(len(vocabulario))))
+    recentes = deque(maxlen=1000)
+    for _ in range(total):
+        if recentes and gerador.random() < copias:
+            yield gerador.choice(recentes)
+            continue
+        recentes.append(' '.join(gerador.choices(vocabulario, cum_weights=acumulados, k=gerador.randint(100, 800))))
+        yield recentes[-1]
+
+
+def comando_entregas(args):
+    # As mesmas entregas em dois bancos: com a resposta na linha da entrega (antes da
+    # migração 13) e em conteudos_entregas. Cada consulta roda numa conexão nova, com o
+    # cache do SQLite vazio e sem mmap, e mede o que leu do arquivo e a memória de pico
+    # do Python; a página de entregas só lê as respostas da primeira página.
+    gerador = random.Random(26)
+    notas = [round(gerador.uniform(0, 10), 1) if gerador.random() < 0.7 else None for _ in range(args.entregas)]
+    amostra = gerador.sample(range(1, args.entregas + 1), min(args.amostras, args.entregas))
+
+    def entregas():
+        for n, texto in enumerate(_respostas_sinteticas(args.entregas, args.copias)):
+            yield {'id': n + 1, 'conteudo': texto, 'data_envio': datetime(2025, 9, 1), 'nota': notas[n],
+                   'aluno_id': n % args.por_atividade + 1, 'atividade_id': n // args.por_atividade + 1}
+
+    def consultar(formato, operacao, conn, parametros):
+        linhas = conn.execute(text(_CONSULTAS_ENTREGAS[operacao]), parametros).all()
+        if formato == 'separado' and operacao == 'ver entregas':
+            primeiras = [linha.id for linha in linhas[:RESPOSTAS_POR_PAGINA]]
+            return linhas, textos_das_entregas(parametros['atividade'], primeiras, conn)
+        return linhas
+
+    with tempfile.TemporaryDirectory() as pasta:
+        resultados, medidas = {}, {}
+        for formato in ('linhas', 'separado'):
+            caminho = os.path.join(pasta, f'{formato}.db')
+            engine = create_engine(f'sqlite:///{caminho}', poolclass=NullPool)
+            inicio = time.perf_counter()
+            with engine.begin() as conn:
+                if formato == 'linhas':
+                    for comando in _ESQUEMA_ENTREGAS_LINHAS:
+                        conn.execute(text(comando))
+                else:
+                    db.metadata.create_all(conn, tables=[ConteudoEntrega.__table__, Entrega.__table__])
+                    for comando in comandos_indice('busca_entregas'):
+                        conn.execute(text(comando))
+                linhas = entregas()
+                while lote := list(itertools.islice(linhas, 10_000)):
+                    if formato == 'linhas':
+                        conn.execute(text("INSERT INTO entregas VALUES (:id, :conteudo, :data_envio, :nota,"
+                                          " :aluno_id, :atividade_id)"), lote)
+                        continue
+                    ids = guardar_conteudos(conn, [linha.pop('conteudo') for linha in lote])
+                    conn.execute(Entrega.__table__.insert(),
+                                 [{**linha, 'conteudo_id': conteudo_id} for linha, conteudo_id in zip(lote, ids)])
+            gravacao = time.perf_counter() - inicio
+            with engine.connect() as conn:
+                conn.exec_driver_sql("VACUUM")
+                distintas = (conn.execute(text("SELECT count(*) FROM conteudos_entregas")).scalar()
+                             if formato == 'separado' else args.entregas)
+            resultados[formato] = (os.path.getsize(caminho), gravacao, distintas)
+
+            for operacao in _CONSULTAS_ENTREGAS:
+                tempos, lidos, memoria = [], [], []
+                for entrega in amostra:
+                    parametros = {'entrega': entrega, 'aluno': (entrega - 1) % args.por_atividade + 1,
+                                  'atividade': (entrega - 1) // args.por_atividade + 1}
+                    for rastrear in (False, True):
+                        with engine.connect() as conn:
+                            # Carrega o esquema antes da medição.
+                            conn.exec_driver_sql("SELECT count(*) FROM sqlite_master").scalar()
+                            if rastrear:
+                                tracemalloc.start()
+                                consultar(formato, operacao, conn, parametros)
+                                memoria.append(tracemalloc.get_traced_memory()[1])
+                                tracemalloc.stop()
+                            else:
+                                antes, inicio = _bytes_lidos(), time.perf_counter()
+                                consultar(formato, operacao, conn, parametros)
+                                tempos.append((time.perf_counter() - inicio) * 1000)
+                                lidos.append(_bytes_lidos() - antes)
+                medidas[(operacao, formato)] = (statistics.median(tempos), statistics.median(lidos),
+                                                statistics.median(memoria))
+            engine.dispose()
+
+    print(f"{args.entregas} entregas ({args.por_atividade} por atividade, {args.copias:.0%} de cópias)")
+    print(f"{'formato':<10} {'tamanho':>10} {'gravação':>10} {'respostas guardadas':>20}")
+    for formato, (tamanho, gravacao, distintas) in resultados.items():
+        print(f"{formato:<10} {tamanho / 1024 / 1024:>8.1f}MB {gravacao:>9.2f}s {distintas:>20}")
+    print(f"\n{'consulta (mediana)':<18} {'formato':<10} {'tempo (ms)':>11} {'lido (KB)':>10} {'memória (KB)':>13}")
+    for (operacao, formato), (tempo, lido, memoria) in medidas.items():
+        print(f"{operacao:<18} {formato:<10} {tempo:>11.2f} {lido / 1024:>10.1f} {memoria / 1024:>13.1f}")
+    return 0
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmarks do SIGMA.')
+    subparsers = parser.add_subparsers(dest='comando', required=True)
+
+    rotas = subparsers.add_parser('rotas', help='Latência e comandos SQL de cada rota via test client.')
+    rotas.add_argument('--iteracoes', type=int, default=50)
+    rotas.add_argument('--aquecimento', type=int, default=3)
+    rotas.add_argument('--rota', action='append', help='Mede só esta rota (pode repetir).')
+    rotas.add_argument('--baseline', default=ARQUIVO_BASELINE)
+    rotas.add_argument('--salvar-baseline', action='store_true')
+    rotas.add_argument('--condicional', action='store_true',
+                       help='Reenvia a ETag recebida (If-None-Match), medindo as respostas 304.')
+    rotas.add_argument('--tolerancia', type=float, default=0.5,
+                       help='Aumento relativo de p99 aceito antes de acusar regressão.')
+    rotas.add_argument('--folga-ms', type=float, default=5.0,
+                       help='Aumento absoluto de p99 sempre aceito (ruído de medição).')
+    rotas.set_defaults(funcao=comando_rotas)
+
+    login = subparsers.add_parser('login', help='Logins por segundo por núcleo.')
+    login.add_argument('--total', type=int, default=64)
+    login.add_argument('--threads', type=int)
+    login.add_argument('--metodo', action='append',
+                       help='Método de hash do werkzeug a comparar (ex.: pbkdf2:sha256:600000).')
+    login.set_defaults(funcao=comando_login)
+
+    sessoes = subparsers.add_parser('sessoes', help='Custo por requisição de abrir e salvar a sessão.')
+    sessoes.add_argument('--total', type=int, default=5000)
+    sessoes.set_defaults(funcao=comando_sessoes)
+
+    escrita = subparsers.add_parser('escrita', help='Vazão de escritores em paralelo, por perfil do banco.')
+    escrita.add_argument('--escritores', type=int, default=4)
+    escrita.add_argument('--leitores', type=int, default=1)
+    escrita.add_argument('--segundos', type=float, default=5)
+    escrita.add_argument('--perfil', action='append', choices=sorted(PERFIS))
+    escrita.set_defaults(funcao=comando_escrita)
+
+    servidor = subparsers.add_parser('servidor', help='Tempo de subida e memória por worker do gunicorn.')
+    servidor.add_argument('--workers', type=int, default=4)
+    servidor.add_argument('--repeticoes', type=int, default=5)
+    servidor.add_argument('--requisicoes', type=int, default=20)
+    servidor.set_defaults(funcao=comando_servidor)
+
+    busca = subparsers.add_parser('busca', help='Busca textual: LIKE contra o índice FTS5 num banco sintético.')
+    busca.add_argument('--linhas', type=int, default=1_000_000)
+    busca.add_argument('--vocabulario', type=int, default=20_000)
+    busca.add_argument('--repeticoes', type=int, default=5)
+    busca.set_defaults(funcao=comando_busca)
+
+    similaridade = subparsers.add_parser('similaridade', help='Assinaturas e agrupamento de respostas parecidas.')
+    similaridade.add_argument('--entregas', type=int, default=5000)
+    similaridade.add_argument('--copias', type=float, default=0.05, help='Fração de entregas copiadas de outra.')
+    similaridade.set_defaults(funcao=comando_similaridade)
+
+    riscos = subparsers.add_parser('risco', help='Atributos, treino e pontuação do risco em escalas crescentes.')
+    riscos.add_argument('--inscricoes', type=int, nargs='+', default=[10_000, 40_000, 160_000, 640_000])
+    riscos.set_defaults(funcao=comando_risco)
+
+    presencas = subparsers.add_parser('presencas', help='Tamanho e leitura das presenças: linhas contra conjuntos de bits.')
+    presencas.add_argument('--alunos', type=int, default=5000)
+    presencas.add_argument('--materias-por-aluno', type=int, default=5)
+    presencas.add_argument('--aulas', type=int, default=100)
+    presencas.add_argument('--leituras', type=int, default=2000)
+    presencas.set_defaults(funcao=comando_presencas)
+
+    entregas = subparsers.add_parser('entregas', help='Leitura e memória por consulta: respostas na entrega contra conteudos_entregas.')
+    entregas.add_argument('--entregas', type=int, default=50_000)
+    entregas.add_argument('--por-atividade', type=int, default=100)
+    entregas.add_argument('--copias', type=float, default=0.05, help='Fração de respostas idênticas a outra.')
+    entregas.add_argument('--amostras', type=int, default=200)
+    entregas.set_defaults(funcao=comando_entregas)
+
+    args = parser.parse_args()
+    sys.exit(args.funcao(args))
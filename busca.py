@@ -0,0 +1,187 @@
+import re
+import sys
+from markupsafe import Markup, escape
+from sqlalchemy import bindparam, text
+from models import db
+
+# Busca textual com índices FTS5 do SQLite sobre atividades (título e descrição),
+# entregas (conteúdo) e usuários (nome, e-mail e RA). Os índices são de conteúdo
+# externo: guardam só os termos e apontam para o rowid da tabela original. Os
+# resultados vêm ordenados por bm25 e paginados.
+# Só os índices de atividades e de usuários têm triggers, que os mantêm em dia com
+# qualquer gravação, pelo ORM ou por SQL direto (importação, migrações).
+# As respostas das entregas ficam comprimidas em conteudos_entregas (conteudos.py), e o
+# índice delas é por conteúdo: conteudos.guardar_conteudo(s) indexa cada conteúdo novo
+# e conteudos.remover_orfaos tira do índice os que removeu. O texto vem da view
+# textos_entregas, única usuária de descomprimir(), lida pelo FTS só no `python busca.py
+# reconstruir` e nos trechos (snippet) dos resultados. Essa função só existe nas
+# conexões da aplicação, por isso nenhum trigger a chama.
+
+TAMANHO_PAGINA = 20
+MAX_PALAVRAS = 8
+# O bm25 pontua toda linha que casa antes de devolver a primeira página; acima deste
+# número de resultados (termos comuns como "resposta") a ordem passa a ser das mais recentes.
+LIMITE_RANQUEAMENTO = 5000
+# Marcadores do snippet(); trocados por <mark> depois de escapar o texto.
+_INICIO_DESTAQUE, _FIM_DESTAQUE = '\x02', '\x03'
+
+# índice -> (tabela ou view com o texto, colunas indexadas)
+INDICES = {
+    'busca_atividades': ('atividades', ('titulo', 'descricao')),
+    'busca_entregas': ('textos_entregas', ('conteudo',)),
+    'busca_usuarios': ('usuarios', ('nome', 'email', 'ra')),
+}
+
+
+def _tabela_fts(indice, tabela, colunas):
+    return (f"CREATE VIRTUAL TABLE IF NOT EXISTS {indice} USING fts5({', '.join(colunas)}, content='{tabela}',"
+            f" content_rowid='id', tokenize='unicode61 remove_diacritics 2', prefix='2 3')")
+
+
+def comandos_indice(indice):
+    tabela, colunas = INDICES[indice]
+    if indice == 'busca_entregas':
+        return [
+            "CREATE VIEW IF NOT EXISTS textos_entregas AS"
+            " SELECT id, descomprimir(texto) AS conteudo FROM conteudos_entregas",
+            _tabela_fts(indice, tabela, colunas),
+        ]
+    lista = ', '.join(colunas)
+    novos = ', '.join(f'new.{c}' for c in colunas)
+    antigos = ', '.join(f'old.{c}' for c in colunas)
+    remover = f"INSERT INTO {indice} ({indice}, rowid, {lista}) VALUES ('delete', old.id, {antigos});"
+    inserir = f"INSERT INTO {indice} (rowid, {lista}) VALUES (new.id, {novos});"
+    return [
+        _tabela_fts(indice, tabela, colunas),
+        f"CREATE TRIGGER IF NOT EXISTS {indice}_ai AFTER INSERT ON {tabela} BEGIN {inserir} END",
+        f"CREATE TRIGGER IF NOT EXISTS {indice}_ad AFTER DELETE ON {tabela} BEGIN {remover} END",
+        f"CREATE TRIGGER IF NOT EXISTS {indice}_au AFTER UPDATE OF {lista} ON {tabela} BEGIN {remover} {inserir} END",
+    ]
+
+
+COMANDOS_INDICES = [comando for indice in INDICES for comando in comandos_indice(indice)]
+
+
+def reconstruir_indices(conn, indices=tuple(INDICES)):
+    """Refaz os índices a partir das tabelas (para bancos copiados ou restaurados sem
+    os triggers) e os compacta."""
+    for indice in indices:
+        conn.execute(text(f"INSERT INTO {indice} ({indice}) VALUES ('rebuild')"))
+        conn.execute(text(f"INSERT INTO {indice} ({indice}) VALUES ('optimize')"))
+
+
+def consulta_fts(termo):
+    """Converte o texto digitado numa consulta FTS5: cada palavra vira um prefixo entre
+    aspas, todas obrigatórias. A sintaxe do FTS5 (aspas, operadores, colunas) nunca
+    chega ao MATCH. Retorna None se não houver palavras."""
+    palavras = re.findall(r'\w+', termo or '')[:MAX_PALAVRAS]
+    if not palavras:
+        return None
+    return ' '.join(f'"{palavra}"*' for palavra in palavras)
+
+
+def destacar(trecho):
+    if trecho is None:
+        return Markup('')
+    return (escape(trecho).replace(_INICIO_DESTAQUE, Markup('<mark>'))
+            .replace(_FIM_DESTAQUE, Markup('</mark>')))
+
+
+def _ordem(indice, consulta, ranqueamento):
+    encontrados = db.session.execute(
+        text(f"SELECT count(*) FROM (SELECT 1 FROM {indice} WHERE {indice} MATCH :consulta LIMIT :limite)"),
+        {'consulta': consulta, 'limite': LIMITE_RANQUEAMENTO + 1},
+    ).scalar()
+    return ranqueamento if encontrados <= LIMITE_RANQUEAMENTO else f"{indice}.rowid DESC"
+
+
+def _pesquisar(sql, indice, ranqueamento, consulta, pagina, parametros=None, expandir=()):
+    # Uma linha a mais indica se há próxima página.
+    sql = sql.format(ordem=_ordem(indice, consulta, ranqueamento))
+    comando = text(sql).bindparams(*(bindparam(nome, expanding=True) for nome in expandir))
+    linhas = db.session.execute(comando, {
+        'consulta': consulta, 'inicio': _INICIO_DESTAQUE, 'fim': _FIM_DESTAQUE,
+        'limite': TAMANHO_PAGINA + 1, 'deslocamento': (pagina - 1) * TAMANHO_PAGINA, **(parametros or {}),
+    }).mappings().all()
+    itens = [{**linha, 'trecho': destacar(linha['trecho'])} for linha in linhas[:TAMANHO_PAGINA]]
+    return itens, (pagina + 1 if len(linhas) > TAMANHO_PAGINA else None)
+
+
+def _escopo(coluna, materias):
+    # materias=None: sem restrição (diretoria); um conjunto vazio não encontra nada.
+    return "1" if materias is None else f"{coluna} IN :materias"
+
+
+def pesquisar_atividades(termo, materias=None, pagina=1):
+    """Retorna (itens, próxima página) das atividades das `materias` que casam com `termo`."""
+    consulta = consulta_fts(termo)
+    if consulta is None or (materias is not None and not materias):
+        return [], None
+    sql = f"""
+        SELECT a.id, a.titulo, a.materia_id, m.nome AS materia,
+               snippet(busca_atividades, 1, :inicio, :fim, '…', 16) AS trecho
+        FROM busca_atividades
+        JOIN atividades a ON a.id = busca_atividades.rowid
+        JOIN materias m ON m.id = a.materia_id
+        WHERE busca_atividades MATCH :consulta AND {_escopo('a.materia_id', materias)}
+        ORDER BY {{ordem}}
+        LIMIT :limite OFFSET :deslocamento"""
+    return _pesquisar(sql, 'busca_atividades', 'bm25(busca_atividades, 5.0, 1.0)', consulta, pagina,
+                      {'materias': sorted(materias or ())},
+                      expandir=('materias',) if materias is not None else ())
+
+
+def pesquisar_entregas(termo, materias=None, pagina=1):
+    """Retorna (itens, próxima página) das entregas em atividades das `materias`."""
+    consulta = consulta_fts(termo)
+    if consulta is None or (materias is not None and not materias):
+        return [], None
+    sql = f"""
+        SELECT e.id, e.atividade_id, a.titulo AS atividade, m.nome AS materia, u.nome AS aluno, u.ra,
+               e.nota, snippet(busca_entregas, 0, :inicio, :fim, '…', 16) AS trecho
+        FROM busca_entregas
+        JOIN entregas e ON e.conteudo_id = busca_entregas.rowid
+        JOIN atividades a ON a.id = e.atividade_id
+        JOIN materias m ON m.id = a.materia_id
+        JOIN usuarios u ON u.id = e.aluno_id
+        WHERE busca_entregas MATCH :consulta AND {_escopo('a.materia_id', materias)}
+        ORDER BY {{ordem}}
+        LIMIT :limite OFFSET :deslocamento"""
+    return _pesquisar(sql, 'busca_entregas', 'bm25(busca_entregas)', consulta, pagina,
+                      {'materias': sorted(materias or ())},
+                      expandir=('materias',) if materias is not None else ())
+
+
+def pesquisar_usuarios(termo, role=None, pagina=1):
+    """Retorna (itens, próxima página) dos usuários (de um perfil, se `role`) que casam com `termo`."""
+    consulta = consulta_fts(termo)
+    if consulta is None:
+        return [], None
+    sql = f"""
+        SELECT u.id, u.nome, u.email, u.ra, u.role,
+               snippet(busca_usuarios, -1, :inicio, :fim, '…', 8) AS trecho
+        FROM busca_usuarios
+        JOIN usuarios u ON u.id = busca_usuarios.rowid
+        WHERE busca_usuarios MATCH :consulta AND {'u.role = :role' if role else '1'}
+        ORDER BY {{ordem}}
+        LIMIT :limite OFFSET :deslocamento"""
+    return _pesquisar(sql, 'busca_usuarios', 'bm25(busca_usuarios, 5.0, 2.0, 2.0)', consulta, pagina,
+                      {'role': role})
+
+
+if __name__ == '__main__':
+    from app import create_app
+
+    app = create_app()
+
+    if len(sys.argv) < 2 or sys.argv[1] != 'reconstruir':
+        print("Uso: python busca.py reconstruir")
+        sys.exit(2)
+
+    with app.app_context():
+        with db.engine.begin() as conn:
+            reconstruir_indices(conn)
+            totais = {indice: conn.execute(text(f"SELECT count(*) FROM {INDICES[indice][0]}")).scalar()
+                      for indice in INDICES}
+    for indice, total in totais.items():
+        print(f"- {indice}: {total} registros indexados")
@@ -0,0 +1,114 @@
+import hashlib
+import sys
+from itertools import islice
+from sqlalchemy import bindparam, text
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from models import db, ConteudoEntrega, TextoComprimido
+
+# As respostas das entregas ficam em `conteudos_entregas`, fora da tabela de entregas:
+# comprimidas (models.comprimir) e identificadas pelo SHA-256 do texto, então respostas
+# iguais são guardadas uma vez só. As entregas apontam para o conteúdo por conteudo_id,
+# e Entrega.conteudo só é lido quando acessado; listagens e correções não passam pelo
+# texto. A página de entregas lê as respostas de uma página por vez (textos_das_entregas).
+# O índice de busca (busca_entregas) é mantido aqui, com o texto ainda descomprimido.
+# Um conteúdo cujas entregas foram apagadas fica na tabela, e a busca o ignora porque
+# nenhuma entrega aponta para ele, até `remover_orfaos` tirá-lo junto com a linha do
+# índice. Assim o id nunca é reaproveitado enquanto o índice ainda guarda os termos.
+
+# Também o limite de ids por consulta (o SQLite aceita até 32766 parâmetros).
+TAMANHO_LOTE = 10_000
+# Respostas que a página de entregas traz junto com ela e por requisição depois.
+RESPOSTAS_POR_PAGINA = 20
+
+_SQL_ID = text("SELECT id FROM conteudos_entregas WHERE hash = :hash")
+_SQL_IDS = text("SELECT hash, id FROM conteudos_entregas WHERE hash IN :hashes").bindparams(
+    bindparam('hashes', expanding=True))
+_SQL_INDEXAR = text("INSERT INTO busca_entregas (rowid, conteudo) VALUES (:id, :texto)")
+_SQL_DESINDEXAR = text(
+    "INSERT INTO busca_entregas (busca_entregas, rowid, conteudo) VALUES ('delete', :id, :texto)")
+_SQL_REMOVER_ORFAOS = text(
+    "DELETE FROM conteudos_entregas WHERE id IN (SELECT c.id FROM conteudos_entregas c"
+    " WHERE NOT EXISTS (SELECT 1 FROM entregas e WHERE e.conteudo_id = c.id) LIMIT :limite)"
+    " RETURNING id, texto"
+).columns(id=db.Integer, texto=TextoComprimido)
+_SQL_TEXTOS = text(
+    "SELECT e.id, c.texto FROM entregas e JOIN conteudos_entregas c ON c.id = e.conteudo_id"
+    " WHERE e.atividade_id = :atividade_id AND e.id IN :ids"
+).bindparams(bindparam('ids', expanding=True)).columns(id=db.Integer, texto=TextoComprimido)
+
+
+def _linha(texto):
+    dados = texto.encode('utf-8')
+    return {'hash': hashlib.sha256(dados).digest(), 'tamanho': len(dados), 'texto': texto}
+
+
+def _inserir(conn, linhas):
+    # A coluna `texto` (TextoComprimido) comprime cada resposta no INSERT; o RETURNING só
+    # devolve as linhas novas, e só elas entram no índice de busca.
+    tabela = ConteudoEntrega.__table__
+    novas = conn.execute(
+        sqlite_insert(tabela).on_conflict_do_nothing(index_elements=['hash']).returning(tabela.c.id, tabela.c.hash),
+        linhas
+    ).all()
+    if novas:
+        textos = {linha['hash']: linha['texto'] for linha in linhas}
+        conn.execute(_SQL_INDEXAR, [{'id': conteudo_id, 'texto': textos[hash_]} for conteudo_id, hash_ in novas])
+
+
+def guardar_conteudo(sessao, texto):
+    """Id do conteúdo com `texto`, gravado agora se ainda não existir. O commit fica a
+    cargo de quem chamou."""
+    linha = _linha(texto)
+    _inserir(sessao, [linha])
+    return sessao.execute(_SQL_ID, {'hash': linha['hash']}).scalar()
+
+
+def guardar_conteudos(conn, textos):
+    """Grava em lote os `textos` ainda não guardados e retorna o id do conteúdo de cada
+    um, na mesma ordem (None para texto None)."""
+    ids = []
+    textos = iter(textos)
+    while lote := list(islice(textos, TAMANHO_LOTE)):
+        linhas = [None if texto is None else _linha(texto) for texto in lote]
+        novas = {linha['hash']: linha for linha in linhas if linha is not None}
+        if novas:
+            _inserir(conn, list(novas.values()))
+        existentes = dict(conn.execute(_SQL_IDS, {'hashes': list(novas)}).all()) if novas else {}
+        ids.extend(None if linha is None else existentes[linha['hash']] for linha in linhas)
+    return ids
+
+
+def textos_das_entregas(atividade_id, ids, conn=None):
+    """{entrega_id: texto} das entregas `ids` da atividade que têm resposta; ids de
+    outras atividades são ignorados."""
+    ids = sorted(set(ids))
+    textos = {}
+    for inicio in range(0, len(ids), TAMANHO_LOTE):
+        textos.update((conn or db.session).execute(
+            _SQL_TEXTOS, {'atividade_id': atividade_id, 'ids': ids[inicio:inicio + TAMANHO_LOTE]}).all())
+    return textos
+
+
+def remover_orfaos(conn):
+    """Remove os conteúdos que nenhuma entrega usa (entregas apagadas por SQL direto) e
+    as linhas deles no índice de busca. Retorna a quantidade removida."""
+    removidos = 0
+    while linhas := conn.execute(_SQL_REMOVER_ORFAOS, {'limite': TAMANHO_LOTE}).all():
+        conn.execute(_SQL_DESINDEXAR, [{'id': linha.id, 'texto': linha.texto} for linha in linhas])
+        removidos += len(linhas)
+    return removidos
+
+
+if __name__ == '__main__':
+    from app import create_app
+
+    app = create_app()
+
+    if len(sys.argv) < 2 or sys.argv[1] != 'limpar':
+        print("Uso: python conteudos.py limpar")
+        sys.exit(2)
+
+    with app.app_context():
+        with db.engine.begin() as conn:
+            removidos = remover_orfaos(conn)
+    print(f"{removidos} conteúdo(s) sem entrega removido(s).")
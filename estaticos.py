@@ -0,0 +1,51 @@
+import hashlib
+import os
+import threading
+from flask import request
+
+# Impressão digital dos arquivos estáticos: url_for('static', ...) ganha ?v=<hash do
+# conteúdo>, e a resposta com o hash atual vai com cache imutável de um ano. Alterar o
+# arquivo muda o hash e, com ele, a URL; sem ?v (ou com um hash antigo) vale o cache
+# padrão do Flask, revalidado por ETag.
+
+CACHE_IMUTAVEL = 365 * 24 * 60 * 60
+
+_hashes = {}
+_trava = threading.Lock()
+
+
+def impressao_digital(pasta, arquivo):
+    caminho = os.path.join(pasta, arquivo)
+    try:
+        mtime = os.stat(caminho).st_mtime_ns
+    except OSError:
+        return None
+    with _trava:
+        atual = _hashes.get(caminho)
+    if atual is not None and atual[0] == mtime:
+        return atual[1]
+    with open(caminho, 'rb') as conteudo:
+        digito = hashlib.md5(conteudo.read()).hexdigest()[:12]
+    with _trava:
+        _hashes[caminho] = (mtime, digito)
+    return digito
+
+
+def configurar_estaticos(app):
+
+    @app.url_defaults
+    def _adicionar_versao(endpoint, valores):
+        if endpoint == 'static' and 'filename' in valores and 'v' not in valores:
+            digito = impressao_digital(app.static_folder, valores['filename'])
+            if digito:
+                valores['v'] = digito
+
+    @app.after_request
+    def _cache_imutavel(resposta):
+        if (request.endpoint == 'static' and resposta.status_code in (200, 304) and request.args.get('v')
+                and request.args['v'] == impressao_digital(app.static_folder, request.view_args['filename'])):
+            resposta.cache_control.public = True
+            resposta.cache_control.max_age = CACHE_IMUTAVEL
+            resposta.cache_control.immutable = True
+            resposta.cache_control.no_cache = None
+        return resposta
@@ -0,0 +1,168 @@
+import math
+import sys
+import threading
+import time
+from collections import Counter
+from flask import current_app
+from sqlalchemy import event, text, inspect
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from models import db, Usuario, Materia, Entrega, Estatistica
+
+# Contadores mantidos na tabela `estatisticas`, atualizados na mesma transação das
+# alterações em Usuario, Materia e Entrega (e das presenças, por presencas.py). Os
+# indicadores do dashboard (taxa de presença, média, pendências) são derivados deles
+# sem varrer as tabelas.
+
+CONSULTAS_RECALCULO = {
+    'usuarios_aluno': "SELECT count(*) FROM usuarios WHERE role = 'aluno'",
+    'usuarios_professor': "SELECT count(*) FROM usuarios WHERE role = 'professor'",
+    'usuarios_diretor': "SELECT count(*) FROM usuarios WHERE role = 'diretor'",
+    'materias': "SELECT count(*) FROM materias",
+    'entregas': "SELECT count(*) FROM entregas",
+    'entregas_pendentes': "SELECT count(*) FROM entregas WHERE nota IS NULL",
+    'notas_quantidade': "SELECT count(nota) FROM entregas",
+    'notas_soma': "SELECT coalesce(sum(nota), 0) FROM entregas",
+    'presencas': "SELECT coalesce(sum(aulas), 0) FROM frequencias",
+    'presencas_presente': "SELECT coalesce(sum(presencas), 0) FROM frequencias",
+}
+
+_cache = {'valores': None, 'expira': 0.0}
+_trava = threading.Lock()
+
+
+def _anterior(obj, atributo):
+    historico = inspect(obj).attrs[atributo].history
+    if historico.deleted:
+        return historico.deleted[0]
+    return getattr(obj, atributo)
+
+
+def _contribuicao(obj, valores=None):
+    # Quanto um objeto soma aos contadores; `valores` substitui atributos (estado anterior).
+    valor = (lambda atributo: valores[atributo]) if valores else (lambda atributo: getattr(obj, atributo))
+    if isinstance(obj, Usuario):
+        return Counter({f"usuarios_{valor('role')}": 1})
+    if isinstance(obj, Materia):
+        return Counter({'materias': 1})
+    if isinstance(obj, Entrega):
+        nota = valor('nota')
+        if nota is None:
+            return Counter({'entregas': 1, 'entregas_pendentes': 1})
+        return Counter({'entregas': 1, 'notas_quantidade': 1, 'notas_soma': nota})
+    return Counter()
+
+
+ATRIBUTOS_MONITORADOS = {Usuario: ('role',), Entrega: ('nota',)}
+
+
+def ajustar(sessao, deltas):
+    """Soma `deltas` aos contadores dentro da transação de `sessao`.
+
+    Usado diretamente por quem grava em lote sem passar pelo flush do ORM.
+    """
+    deltas = {chave: valor for chave, valor in deltas.items() if valor}
+    if not deltas:
+        return
+    stmt = sqlite_insert(Estatistica.__table__)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=['chave'],
+        set_={'valor': Estatistica.__table__.c.valor + stmt.excluded.valor}
+    )
+    sessao.connection().execute(stmt, [{'chave': chave, 'valor': valor} for chave, valor in deltas.items()])
+    sessao.info['estatisticas_alteradas'] = True
+
+
+@event.listens_for(db.session, 'after_flush')
+def _contabilizar_flush(sessao, contexto):
+    deltas = Counter()
+    for obj in sessao.new:
+        deltas.update(_contribuicao(obj))
+    for obj in sessao.deleted:
+        deltas.subtract(_contribuicao(obj))
+    for obj in sessao.dirty:
+        atributos = ATRIBUTOS_MONITORADOS.get(type(obj))
+        if not atributos or not sessao.is_modified(obj):
+            continue
+        anteriores = {atributo: _anterior(obj, atributo) for atributo in atributos}
+        deltas.subtract(_contribuicao(obj, anteriores))
+        deltas.update(_contribuicao(obj))
+    ajustar(sessao, deltas)
+
+
+@event.listens_for(db.session, 'after_commit')
+def _invalidar_apos_commit(sessao):
+    if sessao.info.pop('estatisticas_alteradas', False):
+        invalidar_cache()
+
+
+@event.listens_for(db.session, 'after_rollback')
+def _descartar_apos_rollback(sessao):
+    sessao.info.pop('estatisticas_alteradas', None)
+
+
+def invalidar_cache():
+    with _trava:
+        _cache['valores'] = None
+
+
+def _indicadores(contadores):
+    presencas = contadores.get('presencas', 0)
+    notas = contadores.get('notas_quantidade', 0)
+    return {
+        'num_alunos': int(contadores.get('usuarios_aluno', 0)),
+        'num_professores': int(contadores.get('usuarios_professor', 0)),
+        'num_materias': int(contadores.get('materias', 0)),
+        'num_entregas': int(contadores.get('entregas', 0)),
+        'correcoes_pendentes': int(contadores.get('entregas_pendentes', 0)),
+        'media_notas': contadores.get('notas_soma', 0) / notas if notas else None,
+        'taxa_presenca': contadores.get('presencas_presente', 0) / presencas if presencas else None,
+    }
+
+
+def obter_estatisticas():
+    agora = time.monotonic()
+    with _trava:
+        if _cache['valores'] is not None and agora < _cache['expira']:
+            return _cache['valores']
+
+    contadores = dict(db.session.execute(db.select(Estatistica.chave, Estatistica.valor)).all())
+    valores = _indicadores(contadores)
+    with _trava:
+        _cache['valores'] = valores
+        _cache['expira'] = agora + current_app.config.get('ESTATISTICAS_TTL', 30)
+    return valores
+
+
+def recalcular_estatisticas(conn):
+    """Recalcula todos os contadores a partir das tabelas e retorna as diferenças
+    (chave -> (antes, depois)) encontradas em relação aos valores gravados."""
+    antes = dict(conn.execute(text("SELECT chave, valor FROM estatisticas")).all())
+    depois = {chave: float(conn.execute(text(sql)).scalar() or 0) for chave, sql in CONSULTAS_RECALCULO.items()}
+    conn.execute(text("DELETE FROM estatisticas"))
+    conn.execute(
+        text("INSERT INTO estatisticas (chave, valor) VALUES (:chave, :valor)"),
+        [{'chave': chave, 'valor': valor} for chave, valor in depois.items()]
+    )
+    invalidar_cache()
+    return {chave: (antes.get(chave, 0.0), valor)
+            for chave, valor in depois.items() if not math.isclose(antes.get(chave, 0.0), valor, abs_tol=1e-6)}
+
+
+if __name__ == '__main__':
+    from app import create_app
+
+    app = create_app()
+
+    if len(sys.argv) < 2 or sys.argv[1] != 'recalcular':
+        print("Uso: python estatisticas.py recalcular")
+        sys.exit(2)
+
+    with app.app_context():
+        with db.engine.begin() as conn:
+            divergencias = recalcular_estatisticas(conn)
+    if divergencias:
+        print("Contadores corrigidos:")
+        for chave, (antes, depois) in divergencias.items():
+            print(f"- {chave}: {antes:g} -> {depois:g}")
+    else:
+        print("Nenhuma divergência encontrada.")
@@ -0,0 +1,106 @@
+import csv
+import io
+from flask import Response, stream_with_context
+from models import db, Usuario, Atividade, Entrega, Materia, CalendarioAula, FrequenciaAluno, turma_alunos, turma_materias
+from presencas import tem_bit
+
+LINHAS_POR_LOTE = 1000
+
+
+def _notas(filtro):
+    return (db.select(Materia.nome, Usuario.ra, Usuario.nome, Atividade.titulo,
+                      Atividade.data_entrega, Entrega.data_envio, Entrega.nota)
+            .select_from(Entrega)
+            .join(Atividade, Atividade.id == Entrega.atividade_id)
+            .join(Materia, Materia.id == Atividade.materia_id)
+            .join(Usuario, Usuario.id == Entrega.aluno_id)
+            .where(filtro)
+            .order_by(Atividade.materia_id, Entrega.atividade_id, Entrega.aluno_id))
+
+
+def _presencas(filtro):
+    # Cada aula do calendário com o conjunto de cada aluno; o formatador confere o bit.
+    return (db.select(Materia.nome, Usuario.ra, Usuario.nome, CalendarioAula.data, CalendarioAula.dia,
+                      FrequenciaAluno.registradas, FrequenciaAluno.presentes)
+            .select_from(FrequenciaAluno)
+            .join(CalendarioAula, db.and_(CalendarioAula.materia_id == FrequenciaAluno.materia_id,
+                                          CalendarioAula.periodo == FrequenciaAluno.periodo))
+            .join(Materia, Materia.id == FrequenciaAluno.materia_id)
+            .join(Usuario, Usuario.id == FrequenciaAluno.aluno_id)
+            .where(filtro)
+            .order_by(FrequenciaAluno.materia_id, CalendarioAula.data, FrequenciaAluno.aluno_id))
+
+
+def _da_turma(coluna_aluno, coluna_materia, turma_id):
+    return db.and_(
+        coluna_aluno.in_(db.select(turma_alunos.c.aluno_id).where(turma_alunos.c.turma_id == turma_id)),
+        coluna_materia.in_(db.select(turma_materias.c.materia_id).where(turma_materias.c.turma_id == turma_id))
+    )
+
+
+CABECALHO_NOTAS = ['Matéria', 'RA', 'Aluno', 'Atividade', 'Data Limite', 'Enviado em', 'Nota']
+CABECALHO_PRESENCAS = ['Matéria', 'RA', 'Aluno', 'Data', 'Situação']
+
+
+def _formatar_nota(linha):
+    materia, ra, aluno, titulo, data_entrega, data_envio, nota = linha
+    return [materia, ra or '', aluno, titulo, data_entrega.strftime('%d/%m/%Y'),
+            data_envio.strftime('%d/%m/%Y %H:%M') if data_envio else '',
+            '' if nota is None else f'{nota:g}'.replace('.', ',')]
+
+
+def _formatar_presenca(linha):
+    materia, ra, aluno, data, dia, registradas, presentes = linha
+    if not tem_bit(registradas, dia):
+        return None
+    return [materia, ra or '', aluno, data.strftime('%d/%m/%Y'), 'Presente' if tem_bit(presentes, dia) else 'Falta']
+
+
+def consulta_exportacao(tipo, materia_id=None, turma_id=None):
+    """Retorna (cabeçalho, consulta, formatador) do tipo 'notas' ou 'presencas',
+    filtrado por matéria ou por turma. Levanta KeyError para tipo desconhecido."""
+    if tipo == 'notas':
+        filtro = (Atividade.materia_id == materia_id if materia_id is not None
+                  else _da_turma(Entrega.aluno_id, Atividade.materia_id, turma_id))
+        return CABECALHO_NOTAS, _notas(filtro), _formatar_nota
+    if tipo == 'presencas':
+        filtro = (FrequenciaAluno.materia_id == materia_id if materia_id is not None
+                  else _da_turma(FrequenciaAluno.aluno_id, FrequenciaAluno.materia_id, turma_id))
+        return CABECALHO_PRESENCAS, _presencas(filtro), _formatar_presenca
+    raise KeyError(tipo)
+
+
+def gerar_csv(cabecalho, consulta, formatar, ao_lote=None):
+    # ao_lote(linhas) é chamado depois de cada lote, com as linhas escritas; o formatador
+    # devolve None para as linhas da consulta que não entram no arquivo.
+    buffer = io.StringIO()
+    escritor = csv.writer(buffer, delimiter=';')
+
+    def esvaziar():
+        conteudo = buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate(0)
+        return conteudo
+
+    # BOM e ';' para o Excel em português abrir com acentos e colunas certas.
+    escritor.writerow(cabecalho)
+    yield '\ufeff' + esvaziar()
+
+    resultado = db.session.execute(consulta.execution_options(yield_per=LINHAS_POR_LOTE))
+    for lote in resultado.partitions():
+        linhas = [registro for registro in map(formatar, lote) if registro is not None]
+        escritor.writerows(linhas)
+        if ao_lote is not None:
+            ao_lote(len(linhas))
+        yield esvaziar()
+
+
+def resposta_csv(nome_arquivo, cabecalho, consulta, formatar):
+    return Response(
+        stream_with_context(gerar_csv(cabecalho, consulta, formatar)),
+        mimetype='text/csv; charset=utf-8',
+        headers={
+            'Content-Disposition': f'attachment; filename="{nome_arquivo}"',
+            'X-Accel-Buffering': 'no',
+        }
+    )
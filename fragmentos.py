@@ -0,0 +1,215 @@
+import threading
+import time
+from collections import OrderedDict
+from flask import current_app
+from markupsafe import Markup
+from sqlalchemy import event, inspect
+from sqlalchemy.engine import Connection
+from models import db, Usuario, Materia, Inscricao, Atividade
+
+# Cache de trechos de HTML já renderizados. Cada fragmento tem uma chave com os ids das
+# entidades que ele mostra (('materia', 12, 'alunos'), ('aluno', 7, 'materias')) e uma
+# lista de dependências; gravações nos modelos marcam dependências como alteradas e, no
+# commit, os fragmentos que dependem delas são descartados. O cache é de cada processo:
+# com vários workers, FRAGMENTOS_TTL limita por quanto tempo os outros servem a versão antiga.
+
+
+class CacheFragmentos:
+
+    def __init__(self, memoria_maxima, ttl):
+        self.memoria_maxima = memoria_maxima
+        self.ttl = ttl
+        self.entradas = OrderedDict()
+        self.por_dependencia = {}
+        self.memoria = 0
+        self.acertos = 0
+        self.falhas = 0
+        self.descartes = 0
+        self.trava = threading.Lock()
+
+    def obter(self, chave):
+        with self.trava:
+            entrada = self.entradas.get(chave)
+            if entrada is not None and entrada[1] > time.monotonic():
+                self.entradas.move_to_end(chave)
+                self.acertos += 1
+                return entrada[0]
+            if entrada is not None:
+                self._remover(chave)
+            self.falhas += 1
+            return None
+
+    def guardar(self, chave, conteudo, dependencias):
+        # `memoria_maxima` é em bytes: o fragmento conta pelo tamanho em UTF-8, não pelo
+        # número de caracteres (os acentos ocupam dois bytes).
+        tamanho = len(conteudo.encode('utf-8'))
+        with self.trava:
+            self._remover(chave)
+            self.entradas[chave] = (conteudo, time.monotonic() + self.ttl, dependencias, tamanho)
+            self.memoria += tamanho
+            for dependencia in dependencias:
+                self.por_dependencia.setdefault(dependencia, set()).add(chave)
+            while self.memoria > self.memoria_maxima and self.entradas:
+                self._remover(next(iter(self.entradas)))
+                self.descartes += 1
+
+    def invalidar(self, dependencias):
+        with self.trava:
+            for dependencia in dependencias:
+                for chave in list(self.por_dependencia.get(dependencia, ())):
+                    self._remover(chave)
+
+    def limpar(self):
+        with self.trava:
+            self.entradas.clear()
+            self.por_dependencia.clear()
+            self.memoria = 0
+
+    def contadores(self):
+        with self.trava:
+            consultas = self.acertos + self.falhas
+            return {
+                'fragmentos': len(self.entradas),
+                'memoria_bytes': self.memoria,
+                'acertos': self.acertos,
+                'falhas': self.falhas,
+                'descartes': self.descartes,
+                'taxa_acerto': self.acertos / consultas if consultas else None,
+            }
+
+    def _remover(self, chave):
+        entrada = self.entradas.pop(chave, None)
+        if entrada is None:
+            return
+        self.memoria -= entrada[3]
+        for dependencia in entrada[2]:
+            chaves = self.por_dependencia.get(dependencia)
+            if chaves is not None:
+                chaves.discard(chave)
+                if not chaves:
+                    del self.por_dependencia[dependencia]
+
+
+_trava_cache = threading.Lock()
+
+
+def cache_fragmentos(app=None):
+    app = app or current_app._get_current_object()
+    cache = app.extensions.get('cache_fragmentos')
+    if cache is None:
+        with _trava_cache:
+            cache = app.extensions.get('cache_fragmentos')
+            if cache is None:
+                cache = app.extensions['cache_fragmentos'] = CacheFragmentos(
+                    app.config.get('FRAGMENTOS_MEMORIA', 32 * 1024 * 1024),
+                    app.config.get('FRAGMENTOS_TTL', 60)
+                )
+    return cache
+
+
+def obter_fragmento(chave, gerar, dependencias=None):
+    """Retorna o fragmento `chave` do cache ou o gera com `gerar()` e guarda.
+    Sem `dependencias`, o fragmento depende da entidade dos dois primeiros itens da chave."""
+    chave = tuple(chave)
+    cache = cache_fragmentos()
+    conteudo = cache.obter(chave)
+    if conteudo is None:
+        conteudo = Markup(gerar())
+        cache.guardar(chave, conteudo, [tuple(d) for d in dependencias] if dependencias else [chave[:2]])
+    return conteudo
+
+
+def fragmento(*chave, dependencias=None, caller=None):
+    # Para os templates: {% call fragmento('materia', materia.id, 'alunos') %} ... {% endcall %}
+    return obter_fragmento(chave, caller, dependencias)
+
+
+class Adiado:
+    """Resultado de consulta calculado só no primeiro uso; passado ao template no lugar
+    da lista, faz a consulta de um fragmento em cache nem ser executada."""
+
+    def __init__(self, funcao, *args):
+        self.funcao = funcao
+        self.args = args
+        self.calculado = False
+        self.valor = None
+
+    def _valor(self):
+        if not self.calculado:
+            self.valor = self.funcao(*self.args)
+            self.calculado = True
+        return self.valor
+
+    def __iter__(self):
+        return iter(self._valor())
+
+    def __len__(self):
+        return len(self._valor())
+
+    def __bool__(self):
+        return bool(self._valor())
+
+
+def adiado(funcao, *args):
+    return Adiado(funcao, *args)
+
+
+def invalidar_fragmentos(sessao, dependencias):
+    """Marca dependências alteradas na transação de `sessao`; os fragmentos são
+    descartados no commit. Usado por quem grava sem passar pelo ORM."""
+    if isinstance(sessao, Connection):
+        # Migrações rodam antes de o cache existir.
+        return
+    sessao.info.setdefault('fragmentos_alterados', set()).update(dependencias)
+
+
+def dependencias_de_inscricoes(pares):
+    dependencias = set()
+    for aluno_id, materia_id in pares:
+        dependencias.add(('aluno', aluno_id))
+        dependencias.add(('materia', materia_id))
+    return dependencias
+
+
+def _dependencias(obj, alterado):
+    if isinstance(obj, Inscricao):
+        return dependencias_de_inscricoes([(obj.aluno_id, obj.materia_id)])
+    if isinstance(obj, Materia):
+        professores = {obj.professor_id}
+        professores.update(inspect(obj).attrs['professor_id'].history.deleted)
+        return {('materia', obj.id), ('materias',)} | {('professor', p) for p in professores}
+    if isinstance(obj, Atividade):
+        return {('atividades', obj.materia_id)}
+    if isinstance(obj, Usuario) and alterado:
+        # Só nome e RA aparecem nos fragmentos (uma troca de hash de senha não conta), e um
+        # usuário novo não aparece em fragmento nenhum até ser inscrito.
+        estado = inspect(obj)
+        if obj in estado.session.deleted or any(estado.attrs[a].history.has_changes() for a in ('nome', 'ra')):
+            return {('aluno', obj.id), ('professor', obj.id), ('usuarios',)}
+    return set()
+
+
+@event.listens_for(db.session, 'after_flush')
+def _registrar_flush(sessao, contexto):
+    dependencias = set()
+    for obj in sessao.new:
+        dependencias |= _dependencias(obj, alterado=False)
+    for obj in sessao.deleted:
+        dependencias |= _dependencias(obj, alterado=True)
+    for obj in sessao.dirty:
+        if sessao.is_modified(obj):
+            dependencias |= _dependencias(obj, alterado=True)
+    if dependencias:
+        invalidar_fragmentos(sessao, dependencias)
+
+
+@event.listens_for(db.session, 'after_commit')
+def _invalidar_apos_commit(sessao):
+    dependencias = sessao.info.pop('fragmentos_alterados', None)
+    if dependencias:
+        cache_fragmentos().invalidar(dependencias)
+
+
+@event.listens_for(db.session, 'after_rollback')
+def _descartar_apos_rollback(sessao):
+    sessao.info.pop('fragmentos_alterados', None)
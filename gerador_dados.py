@@ -0,0 +1,178 @@
+import argparse
+import random
+import time
+from datetime import date, datetime, timedelta
+from itertools import islice
+from sqlalchemy import insert
+from werkzeug.security import generate_password_hash
+from app import create_app
+from models import db, Usuario, Materia, Inscricao, Atividade, Entrega, Turma, turma_alunos, turma_materias
+from usuarios_padrao import popular_banco
+from estatisticas import recalcular_estatisticas
+from resumos import recalcular_resumos
+from similaridade import recalcular_similaridades
+from presencas import gravar_frequencias
+from conteudos import guardar_conteudos
+
+TAMANHO_LOTE = 50_000
+
+
+def inserir_em_lotes(tabela, linhas):
+    total = 0
+    linhas = iter(linhas)
+    while True:
+        lote = list(islice(linhas, TAMANHO_LOTE))
+        if not lote:
+            return total
+        db.session.execute(insert(tabela), lote)
+        total += len(lote)
+
+
+def proximo_id(modelo):
+    return (db.session.query(db.func.max(modelo.id)).scalar() or 0) + 1
+
+
+def dias_de_aula(inicio, quantidade):
+    dias = []
+    dia = inicio
+    while len(dias) < quantidade:
+        if dia.weekday() < 5:
+            dias.append(dia)
+        dia += timedelta(days=1)
+    return dias
+
+
+def gerar_instituicao(alunos=50_000, professores=500, materias=2_000, turmas=500,
+                      materias_por_turma=4, atividades_por_materia=3, aulas=10,
+                      taxa_entrega=0.8, semente=42):
+    rnd = random.Random(semente)
+    contagens = {}
+
+    # Todos os usuários sintéticos compartilham o hash: gerar 50 mil hashes levaria horas.
+    hash_aluno = generate_password_hash('aluno123')
+    hash_professor = generate_password_hash('prof123')
+
+    primeiro_prof = proximo_id(Usuario)
+    ids_professores = range(primeiro_prof, primeiro_prof + professores)
+    primeiro_aluno = primeiro_prof + professores
+    ids_alunos = range(primeiro_aluno, primeiro_aluno + alunos)
+
+    contagens['professores'] = inserir_em_lotes(Usuario.__table__, (
+        {'id': i, 'nome': f'Professor {n}', 'email': f'professor{n}@sintetico.edu',
+         'ra': None, 'senha_hash': hash_professor, 'role': 'professor'}
+        for n, i in enumerate(ids_professores, 1)
+    ))
+    contagens['alunos'] = inserir_em_lotes(Usuario.__table__, (
+        {'id': i, 'nome': f'Aluno {n}', 'email': f'aluno{n}@sintetico.edu',
+         'ra': str(9_000_000 + n), 'senha_hash': hash_aluno, 'role': 'aluno'}
+        for n, i in enumerate(ids_alunos, 1)
+    ))
+
+    primeira_materia = proximo_id(Materia)
+    ids_materias = range(primeira_materia, primeira_materia + materias)
+    contagens['materias'] = inserir_em_lotes(Materia.__table__, (
+        {'id': i, 'nome': f'Matéria {n}', 'professor_id': ids_professores[n % professores]}
+        for n, i in enumerate(ids_materias)
+    ))
+
+    primeira_turma = proximo_id(Turma)
+    ids_turmas = range(primeira_turma, primeira_turma + turmas)
+    contagens['turmas'] = inserir_em_lotes(Turma.__table__, (
+        {'id': i, 'nome': f'Turma {n}'} for n, i in enumerate(ids_turmas, 1)
+    ))
+
+    # Cada aluno pertence a uma turma e se inscreve em todas as matérias dela.
+    materias_da_turma = {t: rnd.sample(ids_materias, materias_por_turma) for t in ids_turmas}
+    turma_do_aluno = {a: ids_turmas[n % turmas] for n, a in enumerate(ids_alunos)}
+    contagens['turma_materias'] = inserir_em_lotes(turma_materias, (
+        {'turma_id': t, 'materia_id': m} for t, ms in materias_da_turma.items() for m in ms
+    ))
+    contagens['turma_alunos'] = inserir_em_lotes(turma_alunos, (
+        {'turma_id': t, 'aluno_id': a} for a, t in turma_do_aluno.items()
+    ))
+    inscricoes = sorted({(a, m) for a, t in turma_do_aluno.items() for m in materias_da_turma[t]})
+    contagens['inscricoes'] = inserir_em_lotes(Inscricao.__table__, (
+        {'aluno_id': a, 'materia_id': m, 'por_turma': True} for a, m in inscricoes
+    ))
+
+    primeira_atividade = proximo_id(Atividade)
+    atividades_da_materia = {}
+    linhas_atividades = []
+    proxima = primeira_atividade
+    for m in ids_materias:
+        atividades_da_materia[m] = []
+        for n in range(1, atividades_por_materia + 1):
+            atividades_da_materia[m].append(proxima)
+            linhas_atividades.append({
+                'id': proxima, 'titulo': f'Atividade {n}', 'descricao': 'Atividade gerada para testes de carga.',
+                'data_entrega': datetime(2025, 9, 1) + timedelta(weeks=n), 'materia_id': m
+            })
+            proxima += 1
+    contagens['atividades'] = inserir_em_lotes(Atividade.__table__, linhas_atividades)
+
+    def entregas():
+        for a, m in inscricoes:
+            for atividade_id in atividades_da_materia[m]:
+                if rnd.random() < taxa_entrega:
+                    nota = round(rnd.uniform(0, 10), 1) if rnd.random() < 0.7 else None
+                    yield f'Resposta do aluno {a} para a atividade {atividade_id}.', {
+                        'data_envio': datetime(2025, 9, 1), 'nota': nota,
+                        'aluno_id': a, 'atividade_id': atividade_id}
+
+    def com_conteudo(linhas):
+        # As respostas de cada lote vão antes para conteudos_entregas.
+        while lote := list(islice(linhas, TAMANHO_LOTE)):
+            ids = guardar_conteudos(db.session.connection(), [texto for texto, _ in lote])
+            for (_, linha), conteudo_id in zip(lote, ids):
+                yield {**linha, 'conteudo_id': conteudo_id}
+    contagens['entregas'] = inserir_em_lotes(Entrega.__table__, com_conteudo(entregas()))
+
+    datas = dias_de_aula(date(2025, 8, 4), aulas)
+    assiduidade = {a: rnd.uniform(0.5, 1.0) for a in ids_alunos}
+
+    def presencas():
+        # gravar_frequencias recebe as presenças agrupadas por matéria.
+        for a, m in sorted(inscricoes, key=lambda inscricao: inscricao[1]):
+            for data in datas:
+                yield a, m, data, rnd.random() < assiduidade[a]
+    contagens['presencas'] = gravar_frequencias(db.session.connection(), presencas())
+
+    # As inserções em lote não passam pelo flush do ORM, então contadores, resumos e
+    # assinaturas das entregas são refeitos.
+    recalcular_estatisticas(db.session.connection())
+    recalcular_resumos(db.session.connection())
+    recalcular_similaridades(db.session.connection())
+    db.session.execute(db.text("ANALYZE"))
+    db.session.commit()
+    return contagens
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Gera dados sintéticos de uma instituição grande.')
+    parser.add_argument('--alunos', type=int, default=50_000)
+    parser.add_argument('--professores', type=int, default=500)
+    parser.add_argument('--materias', type=int, default=2_000)
+    parser.add_argument('--turmas', type=int, default=500)
+    parser.add_argument('--materias-por-turma', type=int, default=4)
+    parser.add_argument('--atividades-por-materia', type=int, default=3)
+    parser.add_argument('--aulas', type=int, default=10)
+    parser.add_argument('--semente', type=int, default=42)
+    args = parser.parse_args()
+
+    app = create_app()
+    popular_banco(app)
+
+    with app.app_context():
+        inicio = time.perf_counter()
+        contagens = gerar_instituicao(
+            alunos=args.alunos, professores=args.professores, materias=args.materias,
+            turmas=args.turmas, materias_por_turma=args.materias_por_turma,
+            atividades_por_materia=args.atividades_por_materia, aulas=args.aulas,
+            semente=args.semente
+        )
+        duracao = time.perf_counter() - inicio
+
+    print("\nDados sintéticos gerados:")
+    for tabela, total in contagens.items():
+        print(f"- {tabela}: {total}")
+    print(f"Tempo total: {duracao:.1f}s")
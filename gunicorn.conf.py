@@ -0,0 +1,36 @@
+import multiprocessing
+import os
+
+# Servidor de produção: vários processos, cada um com algumas threads. Com preload a
+# aplicação é importada e criada uma única vez no processo mestre, e os workers herdam
+# a memória já carregada no fork (menos tempo de subida e páginas compartilhadas).
+#
+# Recarga: `kill -HUP <mestre>` troca os workers aos poucos, sem derrubar conexões,
+# mas com preload o código continua o carregado pelo mestre. Para publicar código
+# novo sem parar o serviço, `kill -USR2 <mestre>` sobe um mestre novo ao lado do
+# antigo e, quando ele estiver respondendo, `kill -QUIT <mestre antigo>`.
+
+wsgi_app = 'wsgi:app'
+bind = os.environ.get('SIGMA_BIND', '0.0.0.0:8000')
+workers = int(os.environ.get('SIGMA_WORKERS', multiprocessing.cpu_count() * 2 + 1))
+worker_class = 'gthread'
+threads = int(os.environ.get('SIGMA_THREADS', 4))
+preload_app = os.environ.get('SIGMA_PRELOAD', '1') == '1'
+timeout = 60
+graceful_timeout = 30
+# Recicla cada worker depois de um número de requisições, com folga aleatória para não
+# reiniciarem todos juntos.
+max_requests = 5000
+max_requests_jitter = 500
+
+# Uma conexão do pool por thread do worker.
+os.environ.setdefault('BANCO_CONEXOES', str(threads))
+
+
+def post_fork(server, worker):
+    # Conexões abertas pelo mestre durante o preload não podem ser usadas por dois processos.
+    if preload_app:
+        from wsgi import app
+        from models import db
+        with app.app_context():
+            db.engine.dispose(close=False)
@@ -0,0 +1,250 @@
+import csv
+import io
+import logging
+import multiprocessing
+import os
+import sys
+import time
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+from flask import current_app
+from sqlalchemy import insert
+from sqlalchemy.exc import IntegrityError
+from werkzeug.security import generate_password_hash
+import estatisticas
+from models import db, Usuario, Materia, Turma, Inscricao, turma_alunos, metodo_hash_configurado
+from resumos import atualizar_resumos
+from matriculas import sincronizar_inscricoes
+from autorizacao import invalidar_acesso
+from fragmentos import invalidar_fragmentos, dependencias_de_inscricoes
+from validacao import versionar
+
+logger = logging.getLogger('sigma.importacao')
+
+LINHAS_POR_TRANSACAO = 1000
+# Abaixo disso, subir os processos custa mais do que calcular os hashes na hora.
+MINIMO_PARA_PROCESSOS = 16
+
+COLUNAS = {
+    'alunos': ('nome', 'email', 'ra', 'senha'),
+    'professores': ('nome', 'email', 'senha'),
+    'inscricoes': ('ra', 'materia'),
+    'turma_alunos': ('turma', 'ra'),
+}
+PERFIS = {'alunos': 'aluno', 'professores': 'professor'}
+
+
+class RelatorioImportacao:
+
+    def __init__(self, tipo, progresso=None):
+        self.tipo = tipo
+        self.total = 0
+        self.importadas = 0
+        self.erros = []
+        self.duracao = 0.0
+        # progresso(processadas, total, mensagem), chamado a cada lote gravado.
+        self.progresso = progresso
+
+    def erro(self, linha, mensagem):
+        self.erros.append((linha, mensagem))
+
+    def avancar(self, mensagem=None):
+        if self.progresso is not None:
+            self.progresso(self.importadas + len(self.erros), self.total, mensagem)
+
+    @property
+    def linhas_por_segundo(self):
+        return self.total / self.duracao if self.duracao else 0.0
+
+    def como_dict(self):
+        return {
+            'tipo': self.tipo,
+            'total': self.total,
+            'importadas': self.importadas,
+            'erros': [{'linha': linha, 'mensagem': mensagem} for linha, mensagem in self.erros],
+            'duracao_s': round(self.duracao, 3),
+            'linhas_por_segundo': round(self.linhas_por_segundo, 1),
+        }
+
+
+def ler_csv(arquivo, colunas):
+    """Lê um CSV (UTF-8, separado por ';' ou ',') e retorna [(número da linha, campos)].
+    Levanta ValueError se o arquivo não puder ser lido ou faltar alguma coluna."""
+    try:
+        conteudo = arquivo.read().decode('utf-8-sig')
+    except UnicodeDecodeError:
+        raise ValueError("O arquivo precisa estar em UTF-8.")
+    primeira_linha = conteudo.split('\n', 1)[0]
+    leitor = csv.DictReader(io.StringIO(conteudo), delimiter=';' if ';' in primeira_linha else ',')
+    leitor.fieldnames = [(nome or '').strip().lower() for nome in leitor.fieldnames or []]
+
+    faltando = [coluna for coluna in colunas if coluna not in leitor.fieldnames]
+    if faltando:
+        raise ValueError(f"Colunas obrigatórias ausentes: {', '.join(faltando)}.")
+    return [(numero, {coluna: (campos.get(coluna) or '').strip() for coluna in colunas})
+            for numero, campos in enumerate(leitor, start=2)]
+
+
+def gerar_hashes(senhas, metodo):
+    processos = current_app.config.get('IMPORTACAO_PROCESSOS') or os.cpu_count() or 1
+    if processos == 1 or len(senhas) < MINIMO_PARA_PROCESSOS:
+        return [generate_password_hash(senha, metodo) for senha in senhas]
+    # forkserver e não fork: os processos do servidor e da fila têm outras threads, e um
+    # filho criado por fork enquanto uma delas segura uma trava (SQLite, logging) trava junto.
+    with ProcessPoolExecutor(max_workers=processos, mp_context=multiprocessing.get_context('forkserver')) as executor:
+        return list(executor.map(generate_password_hash, senhas, repeat(metodo),
+                                 chunksize=max(1, len(senhas) // (processos * 4))))
+
+
+def _inserir_em_transacoes(tabela, validas, relatorio, estatistica=None):
+    # Uma transação por lote. Se outro cadastro gravou o mesmo e-mail/RA depois da
+    # validação, o lote é refeito linha a linha para apontar só as linhas em conflito.
+    for inicio in range(0, len(validas), LINHAS_POR_TRANSACAO):
+        lote = validas[inicio:inicio + LINHAS_POR_TRANSACAO]
+        try:
+            db.session.execute(insert(tabela), [valores for _, valores in lote])
+            if estatistica:
+                estatisticas.ajustar(db.session, {estatistica: len(lote)})
+            db.session.commit()
+            relatorio.importadas += len(lote)
+            relatorio.avancar()
+        except IntegrityError:
+            db.session.rollback()
+            for linha, valores in lote:
+                try:
+                    db.session.execute(insert(tabela), [valores])
+                    if estatistica:
+                        estatisticas.ajustar(db.session, {estatistica: 1})
+                    db.session.commit()
+                    relatorio.importadas += 1
+                except IntegrityError:
+                    db.session.rollback()
+                    relatorio.erro(linha, "Registro já cadastrado por outra operação durante a importação.")
+            relatorio.avancar()
+
+
+def _importar_usuarios(linhas, tipo, relatorio):
+    role = PERFIS[tipo]
+    emails, ras = set(), set()
+    for email, ra in db.session.execute(db.select(Usuario.email, Usuario.ra)):
+        emails.add(email)
+        if ra:
+            ras.add(ra)
+
+    validas = []
+    for linha, campos in linhas:
+        vazios = [coluna for coluna in COLUNAS[tipo] if not campos[coluna]]
+        if vazios:
+            relatorio.erro(linha, f"Campo obrigatório vazio: {', '.join(vazios)}.")
+        elif '@' not in campos['email']:
+            relatorio.erro(linha, "E-mail inválido.")
+        elif campos['email'] in emails:
+            relatorio.erro(linha, "E-mail já cadastrado ou repetido no arquivo.")
+        elif role == 'aluno' and campos['ra'] in ras:
+            relatorio.erro(linha, "RA já cadastrado ou repetido no arquivo.")
+        else:
+            emails.add(campos['email'])
+            if role == 'aluno':
+                ras.add(campos['ra'])
+            validas.append((linha, campos))
+
+    relatorio.avancar("Gerando os hashes das senhas")
+    hashes = gerar_hashes([campos['senha'] for _, campos in validas], metodo_hash_configurado())
+    validas = [(linha, {'nome': campos['nome'], 'email': campos['email'], 'ra': campos.get('ra') or None,
+                        'senha_hash': senha_hash, 'role': role})
+               for (linha, campos), senha_hash in zip(validas, hashes)]
+    _inserir_em_transacoes(Usuario.__table__, validas, relatorio, estatistica=f'usuarios_{role}')
+
+
+def _alunos_por_ra(linhas):
+    ras = {campos['ra'] for _, campos in linhas if campos['ra']}
+    return dict(db.session.execute(
+        db.select(Usuario.ra, Usuario.id).where(Usuario.role == 'aluno', Usuario.ra.in_(ras))
+    ).all())
+
+
+def _importar_vinculos(linhas, relatorio, coluna_grupo, modelo_grupo, tabela, coluna_tabela, rotulo):
+    # Vínculo aluno x grupo (matéria ou turma), ambos identificados pelo nome/RA do arquivo.
+    alunos = _alunos_por_ra(linhas)
+    nomes = {campos[coluna_grupo] for _, campos in linhas if campos[coluna_grupo]}
+    grupos = dict(db.session.execute(
+        db.select(modelo_grupo.nome, modelo_grupo.id).where(modelo_grupo.nome.in_(nomes))
+    ).all())
+    existentes = {tuple(par) for par in db.session.execute(
+        db.select(tabela.c.aluno_id, tabela.c[coluna_tabela]).where(tabela.c.aluno_id.in_(list(alunos.values())))
+    )}
+
+    validas = []
+    for linha, campos in linhas:
+        aluno_id = alunos.get(campos['ra'])
+        grupo_id = grupos.get(campos[coluna_grupo])
+        if aluno_id is None:
+            relatorio.erro(linha, f"Aluno com RA '{campos['ra']}' não encontrado.")
+        elif grupo_id is None:
+            relatorio.erro(linha, f"{rotulo} '{campos[coluna_grupo]}' não encontrada.")
+        elif (aluno_id, grupo_id) in existentes:
+            relatorio.erro(linha, "Vínculo já cadastrado ou repetido no arquivo.")
+        else:
+            existentes.add((aluno_id, grupo_id))
+            validas.append((linha, {'aluno_id': aluno_id, coluna_tabela: grupo_id}))
+    _inserir_em_transacoes(tabela, validas, relatorio)
+    return validas
+
+
+def importar(tipo, arquivo, progresso=None):
+    """Importa um CSV do `tipo` ('alunos', 'professores', 'inscricoes' ou 'turma_alunos')
+    e retorna o RelatorioImportacao. Levanta ValueError para tipo ou arquivo inválido.
+    `progresso(processadas, total, mensagem)` acompanha a gravação dos lotes."""
+    if tipo not in COLUNAS:
+        raise ValueError("Tipo de importação inválido.")
+    relatorio = RelatorioImportacao(tipo, progresso)
+    inicio = time.perf_counter()
+    linhas = ler_csv(arquivo, COLUNAS[tipo])
+    relatorio.total = len(linhas)
+
+    if tipo in PERFIS:
+        _importar_usuarios(linhas, tipo, relatorio)
+    elif tipo == 'inscricoes':
+        validas = _importar_vinculos(linhas, relatorio, 'materia', Materia, Inscricao.__table__, 'materia_id', 'Matéria')
+        alunos_por_materia = defaultdict(list)
+        for _, valores in validas:
+            alunos_por_materia[valores['materia_id']].append(valores['aluno_id'])
+        for materia_id, alunos_ids in alunos_por_materia.items():
+            atualizar_resumos(materia_id, alunos_ids)
+        invalidar_acesso(db.session, [valores['aluno_id'] for _, valores in validas])
+        invalidar_fragmentos(db.session, dependencias_de_inscricoes(
+            (valores['aluno_id'], valores['materia_id']) for _, valores in validas
+        ))
+        versionar(db.session, materias=alunos_por_materia)
+        db.session.commit()
+    else:
+        validas = _importar_vinculos(linhas, relatorio, 'turma', Turma, turma_alunos, 'turma_id', 'Turma')
+        sincronizar_inscricoes(alunos_ids={valores['aluno_id'] for _, valores in validas})
+        db.session.commit()
+
+    relatorio.duracao = time.perf_counter() - inicio
+    logger.info('tipo=%s total=%d importadas=%d erros=%d linhas_por_segundo=%.1f', tipo, relatorio.total,
+                relatorio.importadas, len(relatorio.erros), relatorio.linhas_por_segundo)
+    return relatorio
+
+
+if __name__ == '__main__':
+    from app import create_app
+
+    app = create_app()
+
+    if len(sys.argv) != 3 or sys.argv[1] not in COLUNAS:
+        print(f"Uso: python importacao.py {{{'|'.join(COLUNAS)}}} arquivo.csv")
+        sys.exit(2)
+
+    with app.app_context(), open(sys.argv[2], 'rb') as arquivo:
+        try:
+            relatorio = importar(sys.argv[1], arquivo)
+        except ValueError as erro:
+            print(f"Erro: {erro}")
+            sys.exit(1)
+    for linha, mensagem in relatorio.erros:
+        print(f"Linha {linha}: {mensagem}")
+    print(f"{relatorio.importadas} de {relatorio.total} linhas importadas em {relatorio.duracao:.2f}s "
+          f"({relatorio.linhas_por_segundo:.0f} linhas/s).")
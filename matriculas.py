@@ -0,0 +1,124 @@
+import sys
+from collections import defaultdict
+from sqlalchemy import text, bindparam
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from models import db, turma_alunos, turma_materias
+from resumos import atualizar_resumos
+from autorizacao import invalidar_acesso
+from fragmentos import invalidar_fragmentos, dependencias_de_inscricoes
+from validacao import versionar
+
+# As inscrições de quem está numa turma são derivadas de turma_alunos x turma_materias.
+# Uma única consulta compara o conjunto desejado com o gravado (só dos alunos afetados)
+# e devolve o que falta incluir e o que ficou obsoleto; cada lado é aplicado num só
+# comando em lote. Inscrições feitas fora da turma (por_turma = 0) nunca são removidas.
+_SQL_DIFERENCA = """
+WITH desejadas AS (
+    SELECT DISTINCT ta.aluno_id, tm.materia_id
+    FROM turma_alunos ta JOIN turma_materias tm ON tm.turma_id = ta.turma_id
+    WHERE {escopo_turma}
+), atuais AS (
+    SELECT aluno_id, materia_id, por_turma FROM inscricoes WHERE {escopo_inscricoes}
+)
+SELECT 1, aluno_id, materia_id FROM (
+    SELECT aluno_id, materia_id FROM desejadas
+    EXCEPT SELECT aluno_id, materia_id FROM atuais
+)
+UNION ALL
+SELECT 0, aluno_id, materia_id FROM (
+    SELECT aluno_id, materia_id FROM atuais WHERE por_turma
+    EXCEPT SELECT aluno_id, materia_id FROM desejadas
+)
+"""
+
+
+def sincronizar_inscricoes(turma_id=None, alunos_ids=None, conn=None):
+    """Inclui as inscrições que faltam e remove as obsoletas dos alunos da turma
+    `turma_id`, dos `alunos_ids` ou, sem argumentos, de todos. Roda na transação
+    atual (o commit fica a cargo de quem chamou) e retorna (incluídas, removidas)."""
+    conn = conn or db.session
+    parametros = {}
+    if turma_id is not None:
+        escopo = "{aluno} IN (SELECT aluno_id FROM turma_alunos WHERE turma_id = :turma_id)"
+        parametros['turma_id'] = turma_id
+    elif alunos_ids is not None:
+        escopo = "{aluno} IN :alunos_ids"
+        parametros['alunos_ids'] = list(alunos_ids)
+        if not parametros['alunos_ids']:
+            return 0, 0
+    else:
+        escopo = "1"
+    sql = text(_SQL_DIFERENCA.format(escopo_turma=escopo.format(aluno='ta.aluno_id'),
+                                     escopo_inscricoes=escopo.format(aluno='aluno_id')))
+    if alunos_ids is not None and turma_id is None:
+        sql = sql.bindparams(bindparam('alunos_ids', expanding=True))
+
+    incluir, remover = [], []
+    for incluida, aluno_id, materia_id in conn.execute(sql, parametros):
+        (incluir if incluida else remover).append({'aluno_id': aluno_id, 'materia_id': materia_id})
+
+    if incluir:
+        conn.execute(
+            text("INSERT INTO inscricoes (aluno_id, materia_id, por_turma) VALUES (:aluno_id, :materia_id, 1)"),
+            incluir
+        )
+        alunos_por_materia = defaultdict(list)
+        for par in incluir:
+            alunos_por_materia[par['materia_id']].append(par['aluno_id'])
+        for materia_id, ids in alunos_por_materia.items():
+            atualizar_resumos(materia_id, ids, conn=conn)
+    if remover:
+        conn.execute(
+            text("DELETE FROM inscricoes WHERE aluno_id = :aluno_id AND materia_id = :materia_id"), remover
+        )
+        conn.execute(
+            text("DELETE FROM resumos_aluno_materia WHERE aluno_id = :aluno_id AND materia_id = :materia_id"),
+            remover
+        )
+    invalidar_acesso(conn, [par['aluno_id'] for par in incluir + remover])
+    invalidar_fragmentos(conn, dependencias_de_inscricoes(
+        (par['aluno_id'], par['materia_id']) for par in incluir + remover
+    ))
+    versionar(conn, materias=[par['materia_id'] for par in incluir + remover])
+    return len(incluir), len(remover)
+
+
+def adicionar_alunos(turma_id, alunos_ids):
+    alunos_ids = list(alunos_ids)
+    if alunos_ids:
+        db.session.execute(sqlite_insert(turma_alunos).on_conflict_do_nothing(),
+                           [{'turma_id': turma_id, 'aluno_id': aluno_id} for aluno_id in alunos_ids])
+    return sincronizar_inscricoes(alunos_ids=alunos_ids)
+
+
+def remover_aluno(turma_id, aluno_id):
+    db.session.execute(turma_alunos.delete().where(turma_alunos.c.turma_id == turma_id,
+                                                   turma_alunos.c.aluno_id == aluno_id))
+    return sincronizar_inscricoes(alunos_ids=[aluno_id])
+
+
+def adicionar_materia(turma_id, materia_id):
+    db.session.execute(sqlite_insert(turma_materias).on_conflict_do_nothing(),
+                       {'turma_id': turma_id, 'materia_id': materia_id})
+    return sincronizar_inscricoes(turma_id=turma_id)
+
+
+def remover_materia(turma_id, materia_id):
+    db.session.execute(turma_materias.delete().where(turma_materias.c.turma_id == turma_id,
+                                                     turma_materias.c.materia_id == materia_id))
+    return sincronizar_inscricoes(turma_id=turma_id)
+
+
+if __name__ == '__main__':
+    from app import create_app
+
+    app = create_app()
+
+    if len(sys.argv) < 2 or sys.argv[1] != 'sincronizar':
+        print("Uso: python matriculas.py sincronizar")
+        sys.exit(2)
+
+    with app.app_context():
+        incluidas, removidas = sincronizar_inscricoes()
+        db.session.commit()
+    print(f"Inscrições incluídas: {incluidas}, removidas: {removidas}.")
@@ -0,0 +1,261 @@
+import bisect
+import logging
+import re
+import threading
+import time
+from flask import current_app, g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from models import db
+
+logger = logging.getLogger('sigma.metricas')
+logger_consultas = logging.getLogger('sigma.consultas_lentas')
+
+# Instrumentação por rota: para cada endpoint, histogramas do tempo total e do tempo no
+# banco, comandos SQL, linhas e os comandos mais lentos. Os eventos do engine acumulam os
+# números da requisição em `g`; no fim dela tudo é somado ao registro do processo de uma
+# vez, sob uma única trava. Cada worker tem o seu registro.
+
+# Limites superiores dos baldes, em segundos (os mesmos para tempo total e tempo no banco).
+BALDES = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# Comandos distintos guardados por endpoint para o ranking dos mais lentos.
+MAXIMO_COMANDOS = 50
+
+_LISTA_PARAMETROS = re.compile(r'\?(?:\s*,\s*\?)+')
+_ESPACOS = re.compile(r'\s+')
+
+
+def formato_comando(sql):
+    # Listas de IN (?, ?, ...) de tamanhos diferentes contam como o mesmo comando.
+    return _ESPACOS.sub(' ', _LISTA_PARAMETROS.sub('?, ...', sql)).strip()
+
+
+class Histograma:
+
+    def __init__(self):
+        self.baldes = [0] * (len(BALDES) + 1)
+        self.soma = 0.0
+        self.total = 0
+
+    def registrar(self, valor):
+        self.baldes[bisect.bisect_left(BALDES, valor)] += 1
+        self.soma += valor
+        self.total += 1
+
+    def percentil(self, p):
+        # Interpolação linear dentro do balde, como o histogram_quantile do Prometheus.
+        if not self.total:
+            return None
+        alvo = p / 100 * self.total
+        acumulado = 0
+        for indice, quantidade in enumerate(self.baldes):
+            if acumulado + quantidade >= alvo and quantidade:
+                inicio = BALDES[indice - 1] if indice else 0.0
+                if indice == len(BALDES):
+                    return inicio
+                return inicio + (BALDES[indice] - inicio) * (alvo - acumulado) / quantidade
+            acumulado += quantidade
+        return BALDES[-1]
+
+    def acumulados(self):
+        acumulado = 0
+        for limite, quantidade in zip(BALDES + (float('inf'),), self.baldes):
+            acumulado += quantidade
+            yield limite, acumulado
+
+
+class MetricasEndpoint:
+
+    def __init__(self):
+        self.tempo = Histograma()
+        self.tempo_banco = Histograma()
+        self.comandos = 0
+        self.maximo_comandos = 0
+        self.linhas = 0
+        self.n_mais_1 = 0
+        self.erros = 0
+        # formato do comando -> [execuções, tempo total, maior tempo]
+        self.lentos = {}
+
+    def registrar(self, req, duracao, erro):
+        self.tempo.registrar(duracao)
+        self.tempo_banco.registrar(req.tempo_banco)
+        self.comandos += req.comandos
+        self.maximo_comandos = max(self.maximo_comandos, req.comandos)
+        self.linhas += req.linhas
+        self.n_mais_1 += bool(req.repetidos)
+        self.erros += erro
+        for formato, (execucoes, total, maior) in req.por_formato.items():
+            atual = self.lentos.get(formato)
+            if atual is None:
+                self.lentos[formato] = [execucoes, total, maior]
+            else:
+                atual[0] += execucoes
+                atual[1] += total
+                atual[2] = max(atual[2], maior)
+        if len(self.lentos) > MAXIMO_COMANDOS:
+            for formato in sorted(self.lentos, key=lambda f: self.lentos[f][2])[:-MAXIMO_COMANDOS]:
+                del self.lentos[formato]
+
+    def mais_lentos(self, quantidade=5):
+        ordenados = sorted(self.lentos.items(), key=lambda item: item[1][2], reverse=True)[:quantidade]
+        return [{'comando': formato, 'execucoes': execucoes, 'media_ms': total / execucoes * 1000,
+                 'maximo_ms': maior * 1000} for formato, (execucoes, total, maior) in ordenados]
+
+
+class MetricasRequisicao:
+
+    def __init__(self):
+        self.inicio = time.perf_counter()
+        self.comandos = 0
+        self.tempo_banco = 0.0
+        self.linhas = 0
+        self.por_formato = {}
+        self.repetidos = []
+
+
+class RegistroMetricas:
+
+    def __init__(self):
+        self.endpoints = {}
+        self.desde = time.time()
+        self.trava = threading.Lock()
+
+    def registrar(self, endpoint, req, duracao, erro=False):
+        with self.trava:
+            metricas = self.endpoints.get(endpoint)
+            if metricas is None:
+                metricas = self.endpoints[endpoint] = MetricasEndpoint()
+            metricas.registrar(req, duracao, erro)
+
+    def resumo(self):
+        with self.trava:
+            linhas = []
+            for endpoint, m in sorted(self.endpoints.items()):
+                total = m.tempo.total
+                linhas.append({
+                    'endpoint': endpoint,
+                    'requisicoes': total,
+                    'erros': m.erros,
+                    'p50_ms': m.tempo.percentil(50) * 1000,
+                    'p95_ms': m.tempo.percentil(95) * 1000,
+                    'p99_ms': m.tempo.percentil(99) * 1000,
+                    'media_ms': m.tempo.soma / total * 1000,
+                    'banco_media_ms': m.tempo_banco.soma / total * 1000,
+                    'sql_media': m.comandos / total,
+                    'sql_maximo': m.maximo_comandos,
+                    'linhas_media': m.linhas / total,
+                    'n_mais_1': m.n_mais_1,
+                    'mais_lentos': m.mais_lentos(),
+                })
+            return linhas
+
+    def prometheus(self):
+        saida = []
+
+        def histograma(nome, ajuda, atributo):
+            saida.append(f"# HELP {nome} {ajuda}")
+            saida.append(f"# TYPE {nome} histogram")
+            for endpoint, m in sorted(self.endpoints.items()):
+                h = getattr(m, atributo)
+                for limite, acumulado in h.acumulados():
+                    le = '+Inf' if limite == float('inf') else repr(limite)
+                    saida.append(f'{nome}_bucket{{endpoint="{endpoint}",le="{le}"}} {acumulado}')
+                saida.append(f'{nome}_sum{{endpoint="{endpoint}"}} {h.soma:.6f}')
+                saida.append(f'{nome}_count{{endpoint="{endpoint}"}} {h.total}')
+
+        def contador(nome, ajuda, atributo):
+            saida.append(f"# HELP {nome} {ajuda}")
+            saida.append(f"# TYPE {nome} counter")
+            for endpoint, m in sorted(self.endpoints.items()):
+                saida.append(f'{nome}{{endpoint="{endpoint}"}} {getattr(m, atributo)}')
+
+        with self.trava:
+            histograma('sigma_requisicao_segundos', 'Tempo total da requisição.', 'tempo')
+            histograma('sigma_banco_segundos', 'Tempo gasto em comandos SQL por requisição.', 'tempo_banco')
+            contador('sigma_sql_comandos_total', 'Comandos SQL executados.', 'comandos')
+            contador('sigma_linhas_total', 'Objetos carregados pelo ORM e linhas alteradas.', 'linhas')
+            contador('sigma_requisicoes_n_mais_1_total', 'Requisições com o mesmo comando repetido.', 'n_mais_1')
+            contador('sigma_requisicoes_erro_total', 'Requisições que terminaram com exceção.', 'erros')
+        return "\n".join(saida) + "\n"
+
+
+_trava_registro = threading.Lock()
+
+
+def registro_metricas(app=None):
+    app = app or current_app._get_current_object()
+    registro = app.extensions.get('metricas')
+    if registro is None:
+        with _trava_registro:
+            registro = app.extensions.get('metricas')
+            if registro is None:
+                registro = app.extensions['metricas'] = RegistroMetricas()
+    return registro
+
+
+def _requisicao_atual():
+    if has_request_context():
+        return g.get('metricas')
+    return None
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _antes_do_comando(conn, cursor, sql, parametros, contexto, executemany):
+    # O início fica no contexto da execução, e não na conexão: um comando que falha não
+    # chega ao after_cursor_execute, e o valor dele some junto com o contexto.
+    if contexto is not None:
+        contexto.inicio_comando = time.perf_counter()
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _depois_do_comando(conn, cursor, sql, parametros, contexto, executemany):
+    inicio = getattr(contexto, 'inicio_comando', None)
+    if inicio is None:
+        return
+    duracao = time.perf_counter() - inicio
+    req = _requisicao_atual()
+    if req is None:
+        return
+    req.comandos += 1
+    req.tempo_banco += duracao
+    if cursor.rowcount > 0:
+        # INSERT/UPDATE/DELETE; num SELECT o sqlite3 devolve -1.
+        req.linhas += cursor.rowcount
+    formato = formato_comando(sql)
+    atual = req.por_formato.get(formato)
+    if atual is None:
+        req.por_formato[formato] = (1, duracao, duracao)
+    else:
+        req.por_formato[formato] = (atual[0] + 1, atual[1] + duracao, max(atual[2], duracao))
+
+    config = current_app.config
+    limite_lenta = config.get('METRICAS_CONSULTA_LENTA_MS')
+    if limite_lenta is not None and duracao * 1000 >= limite_lenta:
+        logger_consultas.warning('endpoint=%s duracao_ms=%.1f comando=%s', request.endpoint, duracao * 1000, formato)
+    limite_n1 = config.get('METRICAS_N_MAIS_1')
+    if limite_n1 and req.por_formato[formato][0] == limite_n1 and not executemany:
+        req.repetidos.append(formato)
+        logger.warning('n+1 endpoint=%s repeticoes>=%d comando=%s', request.endpoint, limite_n1, formato)
+
+
+@event.listens_for(db.Model, 'load', propagate=True)
+def _objeto_carregado(obj, contexto):
+    req = _requisicao_atual()
+    if req is not None:
+        req.linhas += 1
+
+
+def configurar_metricas(app):
+
+    @app.before_request
+    def _iniciar_metricas():
+        if app.config.get('METRICAS_ATIVAS', True):
+            g.metricas = MetricasRequisicao()
+
+    @app.teardown_request
+    def _registrar_metricas(erro):
+        req = g.pop('metricas', None)
+        if req is not None:
+            registro_metricas(app).registrar(request.endpoint or 'sem_rota', req,
+                                             time.perf_counter() - req.inicio, erro is not None)
@@ -0,0 +1,394 @@
+import sys
+from sqlalchemy import text
+from models import db, normalizar_busca
+from estatisticas import recalcular_estatisticas
+from resumos import recalcular_resumos
+from matriculas import sincronizar_inscricoes
+from busca import comandos_indice, reconstruir_indices
+from similaridade import recalcular_similaridades
+from presencas import gravar_frequencias
+from conteudos import TAMANHO_LOTE, guardar_conteudos
+
+# Cada migração é (versão, descrição, passos). Um passo é um comando SQL ou uma
+# função que recebe a conexão. A versão aplicada fica no PRAGMA user_version do
+# próprio arquivo .db, então as migrações rodam sobre um banco em uso sem recriá-lo.
+# Os passos precisam ser idempotentes: num banco novo o db.create_all() já cria
+# tabelas e índices declarados em models.py antes de as migrações rodarem.
+
+
+def _tabela_existe(conn, tabela):
+    return conn.execute(text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :nome"),
+                        {'nome': tabela}).first() is not None
+
+
+def _se_existir(tabela, *passos):
+    # Passos sobre tabelas que uma migração posterior removeu: num banco novo elas nem existem.
+    def passo(conn):
+        if _tabela_existe(conn, tabela):
+            for comando in passos:
+                comando(conn) if callable(comando) else conn.execute(text(comando))
+    return passo
+
+
+def _remover_presencas_duplicadas(conn):
+    conn.execute(text(
+        "DELETE FROM presencas WHERE id NOT IN ("
+        " SELECT MAX(id) FROM presencas GROUP BY aluno_id, materia_id, data)"
+    ))
+
+
+def _converter_presencas(conn):
+    # Uma linha por aluno e aula em `presencas` vira um bit nos conjuntos de `frequencias`;
+    # a tabela antiga só é removida se todas as presenças tiverem sido convertidas.
+    if not _tabela_existe(conn, 'presencas'):
+        return
+    linhas = conn.execute(
+        text("SELECT aluno_id, materia_id, data, presente FROM presencas ORDER BY materia_id")
+        .columns(aluno_id=db.Integer, materia_id=db.Integer, data=db.Date, presente=db.Boolean)
+    )
+    convertidas = gravar_frequencias(conn, linhas)
+    total = conn.execute(text("SELECT count(*) FROM presencas")).scalar()
+    if convertidas != total:
+        raise RuntimeError(f"Conversão das presenças incompleta: {convertidas} de {total}.")
+    conn.execute(text("DROP TABLE presencas"))
+
+
+def _colunas(conn, tabela):
+    return {linha[1] for linha in conn.execute(text(f"PRAGMA table_info({tabela})"))}
+
+
+def _adicionar_coluna(tabela, coluna, definicao):
+    # ALTER TABLE ADD COLUMN não tem IF NOT EXISTS no SQLite.
+    def passo(conn):
+        if coluna not in _colunas(conn, tabela):
+            conn.execute(text(f"ALTER TABLE {tabela} ADD COLUMN {coluna} {definicao}"))
+    return passo
+
+
+def _mover_conteudos(conn):
+    # O texto de cada entrega vai para conteudos_entregas (comprimido, um por resposta
+    # distinta) e a coluna entregas.conteudo é removida.
+    if 'conteudo' not in _colunas(conn, 'entregas'):
+        return
+    ultima = 0
+    while linhas := conn.execute(text(
+        "SELECT id, conteudo FROM entregas WHERE id > :ultima AND conteudo IS NOT NULL ORDER BY id LIMIT :limite"
+    ), {'ultima': ultima, 'limite': TAMANHO_LOTE}).all():
+        ids = guardar_conteudos(conn, [linha.conteudo for linha in linhas])
+        conn.execute(text("UPDATE entregas SET conteudo_id = :conteudo_id WHERE id = :id"),
+                     [{'conteudo_id': conteudo_id, 'id': linha.id} for linha, conteudo_id in zip(linhas, ids)])
+        ultima = linhas[-1].id
+    conn.execute(text("ALTER TABLE entregas DROP COLUMN conteudo"))
+
+
+def _preencher_nome_busca(conn):
+    # nome_busca é calculado em Python: o lower() do SQLite não trata acentos.
+    for tabela in ('usuarios', 'materias', 'turmas'):
+        ultima = 0
+        while linhas := conn.execute(text(
+            f"SELECT id, nome FROM {tabela} WHERE id > :ultima ORDER BY id LIMIT :limite"
+        ), {'ultima': ultima, 'limite': TAMANHO_LOTE}).all():
+            conn.execute(text(f"UPDATE {tabela} SET nome_busca = :nome_busca WHERE id = :id"),
+                         [{'nome_busca': normalizar_busca(linha.nome), 'id': linha.id} for linha in linhas])
+            ultima = linhas[-1].id
+
+
+def _assinar_entregas(conn):
+    # As assinaturas leem as respostas de conteudos_entregas: num banco anterior à
+    # migração 13 a 10 só cria a tabela, e as entregas são assinadas depois de a 13
+    # mover os textos.
+    if 'conteudo_id' not in _colunas(conn, 'entregas'):
+        return
+    if conn.execute(text("SELECT 1 FROM assinaturas_entregas LIMIT 1")).first() is None:
+        recalcular_similaridades(conn)
+
+
+MIGRACOES = [
+    (1, 'Índices das consultas principais', [
+        "CREATE INDEX IF NOT EXISTS ix_inscricoes_materia_id ON inscricoes (materia_id)",
+        "CREATE INDEX IF NOT EXISTS ix_atividades_materia_id ON atividades (materia_id)",
+        "CREATE INDEX IF NOT EXISTS ix_entregas_aluno_atividade ON entregas (aluno_id, atividade_id)",
+        "CREATE INDEX IF NOT EXISTS ix_entregas_atividade_id ON entregas (atividade_id)",
+        _se_existir('presencas',
+                    _remover_presencas_duplicadas,
+                    "CREATE UNIQUE INDEX IF NOT EXISTS ix_presencas_aluno_materia_data"
+                    " ON presencas (aluno_id, materia_id, data)",
+                    "CREATE INDEX IF NOT EXISTS ix_presencas_materia_data ON presencas (materia_id, data)"),
+        "CREATE INDEX IF NOT EXISTS ix_materias_professor_id ON materias (professor_id)",
+        "CREATE INDEX IF NOT EXISTS ix_usuarios_role ON usuarios (role)",
+    ]),
+    (2, 'Índices da busca por nome nas listagens da diretoria', [
+        "CREATE INDEX IF NOT EXISTS ix_usuarios_role_nome ON usuarios (role, lower(nome))",
+        "CREATE INDEX IF NOT EXISTS ix_materias_nome_lower ON materias (lower(nome))",
+        "CREATE INDEX IF NOT EXISTS ix_turmas_nome_lower ON turmas (lower(nome))",
+        # Sem estatísticas o planner prefere ix_usuarios_role às buscas por RA e email.
+        "ANALYZE",
+    ]),
+    (3, 'Contadores do dashboard da diretoria', [
+        "CREATE TABLE IF NOT EXISTS estatisticas (chave VARCHAR(50) NOT NULL PRIMARY KEY, valor FLOAT NOT NULL)",
+        recalcular_estatisticas,
+    ]),
+    (4, 'Resumo de frequência e notas por aluno e matéria', [
+        "CREATE TABLE IF NOT EXISTS resumos_aluno_materia ("
+        " aluno_id INTEGER NOT NULL REFERENCES usuarios (id),"
+        " materia_id INTEGER NOT NULL REFERENCES materias (id),"
+        " aulas_total INTEGER NOT NULL, aulas_presente INTEGER NOT NULL,"
+        " entregas_corrigidas INTEGER NOT NULL, entregas_pendentes INTEGER NOT NULL,"
+        " media_notas FLOAT, atualizado_em DATETIME NOT NULL,"
+        " PRIMARY KEY (aluno_id, materia_id))",
+        recalcular_resumos,
+    ]),
+    (5, 'Inscrições derivadas das turmas', [
+        _adicionar_coluna('inscricoes', 'por_turma', 'BOOLEAN NOT NULL DEFAULT 0'),
+        "CREATE INDEX IF NOT EXISTS ix_turma_alunos_aluno_id ON turma_alunos (aluno_id)",
+        # As inscrições já existentes continuam manuais; só as que faltam são criadas pela turma.
+        lambda conn: sincronizar_inscricoes(conn=conn),
+    ]),
+    (6, 'Versões de acesso para o cache de autorização', [
+        "CREATE TABLE IF NOT EXISTS versoes_acesso ("
+        " usuario_id INTEGER NOT NULL PRIMARY KEY REFERENCES usuarios (id),"
+        " versao INTEGER NOT NULL)",
+    ]),
+    (7, 'Versões de matérias e atividades para respostas condicionais', [
+        _adicionar_coluna('materias', 'versao', "INTEGER NOT NULL DEFAULT '0'"),
+        _adicionar_coluna('atividades', 'versao', "INTEGER NOT NULL DEFAULT '0'"),
+    ]),
+    (8, 'Fila de tarefas em segundo plano', [
+        "CREATE TABLE IF NOT EXISTS tarefas ("
+        " id INTEGER NOT NULL PRIMARY KEY, tipo VARCHAR(50) NOT NULL, parametros TEXT NOT NULL,"
+        " estado VARCHAR(20) NOT NULL, tentativas INTEGER NOT NULL, max_tentativas INTEGER NOT NULL,"
+        " progresso FLOAT NOT NULL, mensagem VARCHAR(200), resultado TEXT, erro TEXT, arquivo BLOB,"
+        " criada_por INTEGER REFERENCES usuarios (id), criada_em DATETIME NOT NULL,"
+        " disponivel_em DATETIME NOT NULL, iniciada_em DATETIME, atualizada_em DATETIME,"
+        " concluida_em DATETIME, trabalhador VARCHAR(100))",
+        "CREATE INDEX IF NOT EXISTS ix_tarefas_estado_disponivel ON tarefas (estado, disponivel_em)",
+    ]),
+    (9, 'Índices de busca textual (FTS5) de atividades, entregas e usuários', [
+        # O das entregas é criado pela migração 13, sobre conteudos_entregas.
+        *comandos_indice('busca_atividades'),
+        *comandos_indice('busca_usuarios'),
+        lambda conn: reconstruir_indices(conn, ('busca_atividades', 'busca_usuarios')),
+    ]),
+    (10, 'Assinaturas MinHash das entregas e grupos de respostas parecidas', [
+        "CREATE TABLE IF NOT EXISTS assinaturas_entregas ("
+        " entrega_id INTEGER NOT NULL PRIMARY KEY REFERENCES entregas (id),"
+        " atividade_id INTEGER NOT NULL REFERENCES atividades (id),"
+        " assinatura BLOB NOT NULL, grupo INTEGER, similaridade FLOAT)",
+        "CREATE INDEX IF NOT EXISTS ix_assinaturas_entregas_atividade_grupo"
+        " ON assinaturas_entregas (atividade_id, grupo)",
+        _assinar_entregas,
+    ]),
+    (11, 'Riscos de reprovação por aluno e matéria', [
+        "CREATE TABLE IF NOT EXISTS riscos_aluno_materia ("
+        " aluno_id INTEGER NOT NULL REFERENCES usuarios (id),"
+        " materia_id INTEGER NOT NULL REFERENCES materias (id),"
+        " risco FLOAT NOT NULL, motivo VARCHAR(120), calculado_em DATETIME NOT NULL,"
+        " PRIMARY KEY (aluno_id, materia_id))",
+        "CREATE INDEX IF NOT EXISTS ix_riscos_aluno_materia_risco ON riscos_aluno_materia (risco)",
+        "CREATE INDEX IF NOT EXISTS ix_riscos_aluno_materia_materia_risco ON riscos_aluno_materia (materia_id, risco)",
+        "CREATE TABLE IF NOT EXISTS modelos_risco ("
+        " id INTEGER NOT NULL PRIMARY KEY, treinado_em DATETIME NOT NULL, parametros TEXT NOT NULL)",
+    ]),
+    (12, 'Presenças em conjuntos de bits por aluno, matéria e período', [
+        "CREATE TABLE IF NOT EXISTS calendario_aulas ("
+        " materia_id INTEGER NOT NULL REFERENCES materias (id), periodo VARCHAR(6) NOT NULL,"
+        " dia INTEGER NOT NULL, data DATE NOT NULL,"
+        " PRIMARY KEY (materia_id, periodo, dia)) WITHOUT ROWID",
+        "CREATE UNIQUE INDEX IF NOT EXISTS ix_calendario_aulas_materia_data ON calendario_aulas (materia_id, data)",
+        "CREATE TABLE IF NOT EXISTS frequencias ("
+        " aluno_id INTEGER NOT NULL REFERENCES usuarios (id),"
+        " materia_id INTEGER NOT NULL REFERENCES materias (id), periodo VARCHAR(6) NOT NULL,"
+        " registradas BLOB NOT NULL, presentes BLOB NOT NULL,"
+        " aulas INTEGER NOT NULL, presencas INTEGER NOT NULL,"
+        " PRIMARY KEY (aluno_id, materia_id, periodo)) WITHOUT ROWID",
+        "CREATE INDEX IF NOT EXISTS ix_frequencias_materia_periodo ON frequencias (materia_id, periodo)",
+        _converter_presencas,
+        # Contadores e resumos das migrações 3 e 4 já leem frequencias, vazia até a conversão.
+        recalcular_estatisticas,
+        recalcular_resumos,
+    ]),
+    (13, 'Respostas das entregas comprimidas e sem repetições em conteudos_entregas', [
+        "CREATE TABLE IF NOT EXISTS conteudos_entregas ("
+        " id INTEGER NOT NULL PRIMARY KEY, hash BLOB NOT NULL UNIQUE, tamanho INTEGER NOT NULL, texto BLOB NOT NULL)",
+        _adicionar_coluna('entregas', 'conteudo_id', 'INTEGER REFERENCES conteudos_entregas (id)'),
+        "CREATE INDEX IF NOT EXISTS ix_entregas_conteudo_id ON entregas (conteudo_id)",
+        # Índice de busca antigo, sobre entregas.conteudo.
+        "DROP TRIGGER IF EXISTS busca_entregas_ai",
+        "DROP TRIGGER IF EXISTS busca_entregas_ad",
+        "DROP TRIGGER IF EXISTS busca_entregas_au",
+        "DROP TABLE IF EXISTS busca_entregas",
+        # O índice novo vem antes: guardar_conteudos indexa cada conteúdo que grava.
+        *comandos_indice('busca_entregas'),
+        _mover_conteudos,
+        _assinar_entregas,
+    ]),
+    (14, 'Nomes normalizados (sem acentos) e emails sem distinção de maiúsculas nas buscas por prefixo', [
+        _adicionar_coluna('usuarios', 'nome_busca', "VARCHAR(150) NOT NULL DEFAULT ''"),
+        _adicionar_coluna('materias', 'nome_busca', "VARCHAR(100) NOT NULL DEFAULT ''"),
+        _adicionar_coluna('turmas', 'nome_busca', "VARCHAR(150) NOT NULL DEFAULT ''"),
+        _preencher_nome_busca,
+        "CREATE INDEX IF NOT EXISTS ix_usuarios_role_nome_busca ON usuarios (role, nome_busca)",
+        "CREATE INDEX IF NOT EXISTS ix_usuarios_role_email_nocase ON usuarios (role, email COLLATE NOCASE)",
+        "CREATE INDEX IF NOT EXISTS ix_materias_nome_busca ON materias (nome_busca)",
+        "CREATE INDEX IF NOT EXISTS ix_turmas_nome_busca ON turmas (nome_busca)",
+        "DROP INDEX IF EXISTS ix_usuarios_role_nome",
+        "DROP INDEX IF EXISTS ix_materias_nome_lower",
+        "DROP INDEX IF EXISTS ix_turmas_nome_lower",
+        "ANALYZE",
+    ]),
+    (15, 'Índice de busca das respostas mantido pela aplicação, sem triggers que descomprimem', [
+        # Os triggers chamavam descomprimir(), que o cliente sqlite3 não tem: um DELETE
+        # de entrega feito fora da aplicação falhava. Órfãos saem por conteudos.remover_orfaos.
+        "DROP TRIGGER IF EXISTS busca_entregas_ai",
+        "DROP TRIGGER IF EXISTS busca_entregas_ad",
+        "DROP TRIGGER IF EXISTS conteudos_entregas_orfaos",
+    ]),
+    (16, 'Assinaturas removidas junto com a entrega', [
+        # Uma entrega apagada por SQL direto deixava a assinatura para trás, e a próxima
+        # entrega que reaproveitasse o id falhava no INSERT da assinatura.
+        "DELETE FROM assinaturas_entregas WHERE entrega_id NOT IN (SELECT id FROM entregas)",
+        "CREATE TRIGGER IF NOT EXISTS assinaturas_entregas_ad AFTER DELETE ON entregas"
+        " BEGIN DELETE FROM assinaturas_entregas WHERE entrega_id = old.id; END",
+    ]),
+    (17, 'Arquivos gerados pelas tarefas gravados em disco, com o nome na tarefa', [
+        _adicionar_coluna('tarefas', 'saida', 'VARCHAR(255)'),
+        # Os CSVs das tarefas já terminadas ficavam no próprio banco; uma exportação antiga
+        # precisa ser pedida de novo.
+        "UPDATE tarefas SET arquivo = NULL WHERE estado IN ('concluida', 'falhou')",
+    ]),
+]
+
+
+def versao_atual(conn):
+    return conn.execute(text("PRAGMA user_version")).scalar()
+
+
+def aplicar_migracoes():
+    aplicadas = []
+    with db.engine.begin() as conn:
+        versao = versao_atual(conn)
+        for numero, descricao, passos in MIGRACOES:
+            if numero <= versao:
+                continue
+            for passo in passos:
+                if callable(passo):
+                    passo(conn)
+                else:
+                    conn.execute(text(passo))
+            conn.execute(text(f"PRAGMA user_version = {int(numero)}"))
+            aplicadas.append((numero, descricao))
+    return aplicadas
+
+
+# Consultas das rotas cujo plano deve usar índice. As listagens completas da
+# diretoria não entram aqui porque percorrem a tabela inteira por definição.
+# As entregas são lidas sem a resposta, que fica em conteudos_entregas (migração 13).
+CONSULTAS_ROTAS = [
+    ('dashboard_aluno: matérias do aluno',
+     "SELECT materias.* FROM materias JOIN inscricoes ON inscricoes.materia_id = materias.id"
+     " WHERE inscricoes.aluno_id = 1"),
+    ('materia_detalhes_professor / registrar_presenca: alunos da matéria',
+     "SELECT usuarios.* FROM usuarios JOIN inscricoes ON inscricoes.aluno_id = usuarios.id"
+     " WHERE inscricoes.materia_id = 1"),
+    ('materia_detalhes_professor: atividades da matéria',
+     "SELECT * FROM atividades WHERE materia_id = 1 ORDER BY data_entrega DESC"),
+    ('materia_detalhes_aluno: resumo do aluno',
+     "SELECT * FROM resumos_aluno_materia WHERE aluno_id = 1 AND materia_id = 1"),
+    ('historico_materia_aluno: notas do aluno',
+     "SELECT id, conteudo_id, data_envio, nota, aluno_id, atividade_id FROM entregas"
+     " WHERE aluno_id = 1 AND atividade_id IN (1, 2, 3)"),
+    ('historico_materia_aluno: presenças do aluno',
+     "SELECT periodo, registradas, presentes FROM frequencias WHERE aluno_id = 1 AND materia_id = 1"),
+    ('historico_materia_aluno: calendário da matéria',
+     "SELECT data, periodo, dia FROM calendario_aulas WHERE materia_id = 1 AND periodo IN ('2025-2')"
+     " ORDER BY data"),
+    ('responder_atividade: entrega existente',
+     "SELECT id, conteudo_id, data_envio, nota, aluno_id, atividade_id FROM entregas"
+     " WHERE aluno_id = 1 AND atividade_id = 1"),
+    ('ver_entregas: entregas da atividade',
+     "SELECT id, conteudo_id, data_envio, nota, aluno_id, atividade_id FROM entregas"
+     " WHERE atividade_id = 1"),
+    ('ver_entregas / respostas_entregas: respostas da página',
+     "SELECT e.id, c.texto FROM entregas e JOIN conteudos_entregas c ON c.id = e.conteudo_id"
+     " WHERE e.atividade_id = 1 AND e.id IN (1, 2, 3)"),
+    ('responder_atividade: conteúdo já guardado',
+     "SELECT id FROM conteudos_entregas WHERE hash = x'00'"),
+    ('responder_atividade: assinaturas da atividade',
+     "SELECT entrega_id, assinatura, grupo FROM assinaturas_entregas WHERE atividade_id = 1"),
+    ('ver_entregas: respostas parecidas',
+     "SELECT entrega_id, grupo, similaridade FROM assinaturas_entregas WHERE atividade_id = 1 AND grupo IS NOT NULL"),
+    ('dashboard_diretor: alunos em risco',
+     "SELECT * FROM riscos_aluno_materia WHERE risco >= 0.5 ORDER BY risco DESC LIMIT 10"),
+    ('dashboard_professor: alunos em risco por matéria',
+     "SELECT * FROM riscos_aluno_materia WHERE materia_id = 1 AND risco >= 0.5 ORDER BY risco DESC LIMIT 10"),
+    ('registrar_presenca: aulas do calendário',
+     "SELECT data, periodo, dia FROM calendario_aulas WHERE materia_id = 1 AND data IN ('2025-10-06')"),
+    ('registrar_presenca: conjuntos da matéria',
+     "SELECT aluno_id, periodo, registradas, presentes FROM frequencias WHERE materia_id = 1 AND periodo IN ('2025-2')"),
+    ('dashboard_professor: matérias do professor',
+     "SELECT * FROM materias WHERE professor_id = 1"),
+    ('dashboard_diretor: usuários por perfil',
+     "SELECT count(*) FROM usuarios WHERE role = 'aluno'"),
+    ('gerenciar_alunos: página seguinte',
+     "SELECT * FROM usuarios WHERE role = 'aluno' AND id > 100 ORDER BY id LIMIT 51"),
+    ('gerenciar_alunos: busca por nome',
+     "SELECT * FROM usuarios WHERE role = 'aluno' AND nome_busca >= 'mar' AND nome_busca < 'mar' || char(65535)"
+     " ORDER BY id LIMIT 51"),
+    ('gerenciar_alunos: busca por RA',
+     "SELECT * FROM usuarios WHERE role = 'aluno' AND ra >= '123' AND ra < '123' || char(65535) ORDER BY id LIMIT 51"),
+    ('gerenciar_professores: busca por email',
+     "SELECT * FROM usuarios WHERE role = 'professor' AND email COLLATE NOCASE >= 'Prof'"
+     " AND email COLLATE NOCASE < 'Prof' || char(65535)"
+     " ORDER BY id LIMIT 51"),
+    ('gerenciar_materias: busca por nome',
+     "SELECT * FROM materias WHERE nome_busca >= 'eng' AND nome_busca < 'eng' || char(65535) ORDER BY id LIMIT 51"),
+    ('gerenciar_turmas: página seguinte',
+     "SELECT turmas.id, count(turma_alunos.aluno_id) FROM turmas"
+     " LEFT JOIN turma_alunos ON turma_alunos.turma_id = turmas.id"
+     " WHERE turmas.id > 100 GROUP BY turmas.id ORDER BY turmas.id LIMIT 51"),
+]
+
+
+def relatorio_plano_consultas():
+    linhas = []
+    sem_indice = []
+    with db.engine.connect() as conn:
+        linhas.append(f"Versão do esquema: {versao_atual(conn)}")
+        for rotulo, sql in CONSULTAS_ROTAS:
+            plano = [linha[-1] for linha in conn.execute(text("EXPLAIN QUERY PLAN " + sql))]
+            # SCAN percorre a tabela ou o índice inteiro; só SEARCH é busca por índice.
+            varreduras = [p for p in plano if p.startswith('SCAN')]
+            if varreduras:
+                sem_indice.append(rotulo)
+            linhas.append("")
+            linhas.append(f"[{'VARREDURA' if varreduras else 'OK'}] {rotulo}")
+            linhas.append(f"    {sql}")
+            linhas.extend(f"    -> {p}" for p in plano)
+    linhas.append("")
+    if sem_indice:
+        linhas.append(f"{len(sem_indice)} consulta(s) sem índice: {', '.join(sem_indice)}")
+    else:
+        linhas.append("Todas as consultas usam índice.")
+    return "\n".join(linhas), sem_indice
+
+
+if __name__ == '__main__':
+    from app import create_app
+
+    app = create_app()
+
+    with app.app_context():
+        if len(sys.argv) > 1 and sys.argv[1] == 'explicar':
+            relatorio, sem_indice = relatorio_plano_consultas()
+            print(relatorio)
+            if len(sys.argv) > 2:
+                with open(sys.argv[2], 'w', encoding='utf-8') as arquivo:
+                    arquivo.write(relatorio + "\n")
+            sys.exit(1 if sem_indice else 0)
+
+        db.create_all()
+        aplicadas = aplicar_migracoes()
+        for numero, descricao in aplicadas:
+            print(f"- Migração {numero} aplicada: {descricao}")
+        if not aplicadas:
+            print("Banco de dados já está na versão mais recente.")
@@ -1,13 +1,20 @@
+from flask import current_app, has_app_context
 from flask_sqlalchemy import SQLAlchemy
-from werkzeug.security import generate_password_hash, check_password_hash
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from werkzeug.security import generate_password_hash, check_password_hash, DEFAULT_PBKDF2_ITERATIONS
 from datetime import datetime
+import json
+import sqlite3
+import unicodedata
+import zlib
 
 
 db = SQLAlchemy()
 
 turma_alunos = db.Table('turma_alunos',
     db.Column('turma_id', db.Integer, db.ForeignKey('turmas.id'), primary_key=True),
-    db.Column('aluno_id', db.Integer, db.ForeignKey('usuarios.id'), primary_key=True)
+    db.Column('aluno_id', db.Integer, db.ForeignKey('usuarios.id'), primary_key=True, index=True)
 )
 
 turma_materias = db.Table('turma_materias',
@@ -16,27 +23,59 @@ turma_materias = db.Table('turma_materias',
 )
 
 
+METODO_HASH_PADRAO = 'scrypt:32768:8:1'
+
+
+def normalizar_metodo_hash(metodo):
+    # O werkzeug completa 'scrypt' e 'pbkdf2' com os parâmetros padrão no prefixo do hash.
+    if metodo == 'scrypt':
+        return METODO_HASH_PADRAO
+    if metodo in ('pbkdf2', 'pbkdf2:sha256'):
+        return f'pbkdf2:sha256:{DEFAULT_PBKDF2_ITERATIONS}'
+    return metodo
+
+def metodo_hash_configurado():
+    if has_app_context():
+        return normalizar_metodo_hash(current_app.config.get('SENHA_METODO_HASH', METODO_HASH_PADRAO))
+    return METODO_HASH_PADRAO
+
+
+def normalizar_busca(texto):
+    """Minúsculas e sem acentos: 'jose' e 'JOSÉ' encontram 'José'. O lower() do SQLite
+    só converte ASCII, então a forma normalizada fica gravada em `nome_busca`."""
+    decomposto = unicodedata.normalize('NFKD', (texto or '').strip().casefold())
+    return ''.join(c for c in decomposto if not unicodedata.combining(c))
+
+def _nome_busca(contexto):
+    # Padrão da coluna também nas inserções em lote (importação, dados sintéticos).
+    return normalizar_busca(contexto.get_current_parameters()['nome'])
+
+
 class Usuario(db.Model):
   
     __tablename__ = 'usuarios'
     
     id = db.Column(db.Integer, primary_key=True)
     nome = db.Column(db.String(150), nullable=False)
+    nome_busca = db.Column(db.String(150), nullable=False, default=_nome_busca)
     email = db.Column(db.String(150), unique=True, nullable=False) 
     ra = db.Column(db.String(20), unique=True, nullable=True)
     senha_hash = db.Column(db.String(255), nullable=False)
-    role = db.Column(db.String(50), nullable=False) 
+    role = db.Column(db.String(50), nullable=False, index=True)
 
     turmas = db.relationship('Turma', secondary=turma_alunos, back_populates='alunos')
 
-    def set_senha(self, senha):
+    def set_senha(self, senha, metodo=None):
        
-        self.senha_hash = generate_password_hash(senha)
+        self.senha_hash = generate_password_hash(senha, metodo or metodo_hash_configurado())
     
     def check_senha(self, senha):
     
         return check_password_hash(self.senha_hash, senha)
 
+    def precisa_rehash(self, metodo=None):
+        return self.senha_hash.split('$', 1)[0] != (metodo or metodo_hash_configurado())
+
     def __repr__(self):
         return f'<Usuario {self.nome} ({self.role})>'
 
@@ -44,6 +83,7 @@ class Turma(db.Model):
     __tablename__ = 'turmas'
     id = db.Column(db.Integer, primary_key=True)
     nome = db.Column(db.String(150), unique=True, nullable=False)
+    nome_busca = db.Column(db.String(150), nullable=False, default=_nome_busca)
 
     alunos = db.relationship('Usuario', secondary=turma_alunos, back_populates='turmas')
     
@@ -56,7 +96,10 @@ class Materia(db.Model):
     __tablename__ = 'materias'
     id = db.Column(db.Integer, primary_key=True)
     nome = db.Column(db.String(100), nullable=False, unique=True)
-    professor_id = db.Column(db.Integer, db.ForeignKey('usuarios.id'), nullable=False)
+    nome_busca = db.Column(db.String(100), nullable=False, default=_nome_busca)
+    professor_id = db.Column(db.Integer, db.ForeignKey('usuarios.id'), nullable=False, index=True)
+    # Incrementada a cada gravação que muda as páginas da matéria (ver validacao.py).
+    versao = db.Column(db.Integer, nullable=False, default=0, server_default='0')
     
     professor = db.relationship('Usuario', backref='materias_lecionadas')
 
@@ -66,8 +109,9 @@ class Materia(db.Model):
 class Inscricao(db.Model):
     __tablename__ = 'inscricoes'
     aluno_id = db.Column(db.Integer, db.ForeignKey('usuarios.id'), primary_key=True)
-    materia_id = db.Column(db.Integer, db.ForeignKey('materias.id'), primary_key=True)
-
+    materia_id = db.Column(db.Integer, db.ForeignKey('materias.id'), primary_key=True, index=True)
+    # Inscrições criadas pela turma do aluno; só essas são removidas quando ele sai da turma.
+    por_turma = db.Column(db.Boolean, nullable=False, default=False, server_default=db.false())
 
     aluno = db.relationship('Usuario', backref=db.backref('inscricoes', cascade="all, delete-orphan"))
     materia = db.relationship('Materia', backref=db.backref('inscricoes', cascade="all, delete-orphan"))
@@ -78,29 +122,291 @@ class Atividade(db.Model):
     titulo = db.Column(db.String(200), nullable=False)
     descricao = db.Column(db.Text, nullable=False)
     data_entrega = db.Column(db.DateTime, nullable=False)
-    materia_id = db.Column(db.Integer, db.ForeignKey('materias.id'), nullable=False)
+    materia_id = db.Column(db.Integer, db.ForeignKey('materias.id'), nullable=False, index=True)
+    versao = db.Column(db.Integer, nullable=False, default=0, server_default='0')
     
     materia = db.relationship('Materia', backref='atividades')
 
+# Textos guardados comprimidos: o primeiro byte diz como o resto foi gravado. Respostas
+# curtas, que o zlib aumentaria, ficam como estão.
+_SEM_COMPRESSAO, _ZLIB = b'\x00', b'\x01'
+NIVEL_COMPRESSAO = 6
+
+
+def comprimir(texto):
+    dados = texto.encode('utf-8')
+    comprimido = zlib.compress(dados, NIVEL_COMPRESSAO)
+    return _ZLIB + comprimido if len(comprimido) < len(dados) else _SEM_COMPRESSAO + dados
+
+
+def descomprimir(dados):
+    if dados is None:
+        return None
+    dados = memoryview(dados)
+    if dados[:1] == _ZLIB:
+        return zlib.decompress(dados[1:]).decode('utf-8')
+    return bytes(dados[1:]).decode('utf-8')
+
+
+class TextoComprimido(db.TypeDecorator):
+    """Coluna BLOB com texto comprimido por `comprimir`; a aplicação lê e grava str."""
+    impl = db.LargeBinary
+    cache_ok = True
+
+    def process_bind_param(self, valor, dialect):
+        return None if valor is None else comprimir(valor)
+
+    def process_result_value(self, valor, dialect):
+        return descomprimir(valor)
+
+
+@event.listens_for(Engine, 'connect')
+def _registrar_descomprimir(conexao, registro):
+    # descomprimir() no SQL de toda conexão: usado só pela view textos_entregas, que o
+    # índice de busca das entregas lê no `python busca.py reconstruir` e nos trechos dos
+    # resultados. O índice é mantido por conteudos.py, sem triggers (ver busca.py).
+    if isinstance(conexao, sqlite3.Connection):
+        conexao.create_function('descomprimir', 1, descomprimir, deterministic=True)
+
+
+class ConteudoEntrega(db.Model):
+    __tablename__ = 'conteudos_entregas'
+    id = db.Column(db.Integer, primary_key=True)
+    # SHA-256 do texto em UTF-8: entregas com a mesma resposta apontam para a mesma linha.
+    hash = db.Column(db.LargeBinary(32), nullable=False, unique=True)
+    # Bytes do texto sem compressão.
+    tamanho = db.Column(db.Integer, nullable=False)
+    texto = db.Column(TextoComprimido, nullable=False)
+
 class Entrega(db.Model):
     __tablename__ = 'entregas'
+    __table_args__ = (
+        db.Index('ix_entregas_aluno_atividade', 'aluno_id', 'atividade_id'),
+    )
     id = db.Column(db.Integer, primary_key=True)
-    conteudo = db.Column(db.Text) 
+    # Resposta em conteudos_entregas (gravada por conteudos.guardar_conteudo).
+    conteudo_id = db.Column(db.Integer, db.ForeignKey('conteudos_entregas.id'), index=True)
     data_envio = db.Column(db.DateTime, default=datetime.utcnow)
     nota = db.Column(db.Float)
     aluno_id = db.Column(db.Integer, db.ForeignKey('usuarios.id'), nullable=False)
-    atividade_id = db.Column(db.Integer, db.ForeignKey('atividades.id'), nullable=False)
+    atividade_id = db.Column(db.Integer, db.ForeignKey('atividades.id'), nullable=False, index=True)
+    # Texto da resposta, só lido quando acessado (ou com db.undefer(Entrega.conteudo)):
+    # listagens e correções carregam as entregas sem ele.
+    conteudo = db.deferred(
+        db.select(ConteudoEntrega.texto).where(ConteudoEntrega.id == conteudo_id).scalar_subquery()
+    )
 
     aluno = db.relationship('Usuario', backref='entregas')
     atividade = db.relationship('Atividade', backref='entregas')
 
-class Presenca(db.Model):
-    __tablename__ = 'presencas'
-    id = db.Column(db.Integer, primary_key=True)
+class CalendarioAula(db.Model):
+    __tablename__ = 'calendario_aulas'
+    __table_args__ = (
+        db.Index('ix_calendario_aulas_materia_data', 'materia_id', 'data', unique=True),
+        {'sqlite_with_rowid': False},
+    )
+    materia_id = db.Column(db.Integer, db.ForeignKey('materias.id'), primary_key=True)
+    # Período letivo ('2025-2'); as aulas de cada período são numeradas a partir de 0.
+    periodo = db.Column(db.String(6), primary_key=True)
+    # Número da aula no período: a posição do bit dela nos conjuntos de FrequenciaAluno.
+    dia = db.Column(db.Integer, primary_key=True)
     data = db.Column(db.Date, nullable=False)
-    presente = db.Column(db.Boolean, default=True)
-    aluno_id = db.Column(db.Integer, db.ForeignKey('usuarios.id'), nullable=False)
-    materia_id = db.Column(db.Integer, db.ForeignKey('materias.id'), nullable=False)
 
-    aluno = db.relationship('Usuario', backref='presencas')
-    materia = db.relationship('Materia', backref='presencas')
\ No newline at end of file
+class FrequenciaAluno(db.Model):
+    __tablename__ = 'frequencias'
+    __table_args__ = (
+        db.Index('ix_frequencias_materia_periodo', 'materia_id', 'periodo'),
+        {'sqlite_with_rowid': False},
+    )
+    aluno_id = db.Column(db.Integer, db.ForeignKey('usuarios.id'), primary_key=True)
+    materia_id = db.Column(db.Integer, db.ForeignKey('materias.id'), primary_key=True)
+    periodo = db.Column(db.String(6), primary_key=True)
+    # Conjuntos de bits (little-endian) indexados pelo número da aula no calendário da
+    # matéria: aulas com presença lançada e aulas em que o aluno estava presente.
+    registradas = db.Column(db.LargeBinary, nullable=False)
+    presentes = db.Column(db.LargeBinary, nullable=False)
+    # Contagem de bits de cada conjunto, mantida por presencas.py a cada gravação.
+    aulas = db.Column(db.Integer, nullable=False)
+    presencas = db.Column(db.Integer, nullable=False)
+
+class ResumoAlunoMateria(db.Model):
+    __tablename__ = 'resumos_aluno_materia'
+    aluno_id = db.Column(db.Integer, db.ForeignKey('usuarios.id'), primary_key=True)
+    materia_id = db.Column(db.Integer, db.ForeignKey('materias.id'), primary_key=True)
+    aulas_total = db.Column(db.Integer, nullable=False, default=0)
+    aulas_presente = db.Column(db.Integer, nullable=False, default=0)
+    entregas_corrigidas = db.Column(db.Integer, nullable=False, default=0)
+    entregas_pendentes = db.Column(db.Integer, nullable=False, default=0)
+    media_notas = db.Column(db.Float)
+    atualizado_em = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    @property
+    def percentual_presenca(self):
+        if not self.aulas_total:
+            return None
+        return 100.0 * self.aulas_presente / self.aulas_total
+
+    @property
+    def faltas(self):
+        return self.aulas_total - self.aulas_presente
+
+class Estatistica(db.Model):
+    __tablename__ = 'estatisticas'
+    chave = db.Column(db.String(50), primary_key=True)
+    valor = db.Column(db.Float, nullable=False, default=0)
+
+class AssinaturaEntrega(db.Model):
+    __tablename__ = 'assinaturas_entregas'
+    __table_args__ = (
+        db.Index('ix_assinaturas_entregas_atividade_grupo', 'atividade_id', 'grupo'),
+    )
+    entrega_id = db.Column(db.Integer, db.ForeignKey('entregas.id'), primary_key=True)
+    atividade_id = db.Column(db.Integer, db.ForeignKey('atividades.id'), nullable=False)
+    # Assinatura MinHash (similaridade.py): 128 inteiros de 32 bits little-endian.
+    assinatura = db.Column(db.LargeBinary, nullable=False)
+    # Menor entrega do grupo de respostas parecidas; NULL quando não há nenhuma parecida.
+    grupo = db.Column(db.Integer)
+    similaridade = db.Column(db.Float)
+
+class RiscoAlunoMateria(db.Model):
+    __tablename__ = 'riscos_aluno_materia'
+    __table_args__ = (
+        db.Index('ix_riscos_aluno_materia_risco', 'risco'),
+        db.Index('ix_riscos_aluno_materia_materia_risco', 'materia_id', 'risco'),
+    )
+    aluno_id = db.Column(db.Integer, db.ForeignKey('usuarios.id'), primary_key=True)
+    materia_id = db.Column(db.Integer, db.ForeignKey('materias.id'), primary_key=True)
+    # Probabilidade de reprovação estimada por risco.py e o atributo que mais pesou nela.
+    risco = db.Column(db.Float, nullable=False)
+    motivo = db.Column(db.String(120))
+    calculado_em = db.Column(db.DateTime, nullable=False)
+
+class ModeloRisco(db.Model):
+    __tablename__ = 'modelos_risco'
+    id = db.Column(db.Integer, primary_key=True)
+    treinado_em = db.Column(db.DateTime, nullable=False)
+    # Pesos, médias e desvios dos atributos e as medidas do treino, em JSON.
+    parametros = db.Column(db.Text, nullable=False)
+
+class VersaoAcesso(db.Model):
+    __tablename__ = 'versoes_acesso'
+    usuario_id = db.Column(db.Integer, db.ForeignKey('usuarios.id'), primary_key=True)
+    versao = db.Column(db.Integer, nullable=False, default=0)
+
+class Tarefa(db.Model):
+    __tablename__ = 'tarefas'
+    __table_args__ = (
+        db.Index('ix_tarefas_estado_disponivel', 'estado', 'disponivel_em'),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    tipo = db.Column(db.String(50), nullable=False)
+    parametros = db.Column(db.Text, nullable=False, default='{}')
+    # pendente -> executando -> concluida | falhou (volta a pendente enquanto houver tentativas).
+    estado = db.Column(db.String(20), nullable=False, default='pendente')
+    tentativas = db.Column(db.Integer, nullable=False, default=0)
+    max_tentativas = db.Column(db.Integer, nullable=False, default=3)
+    progresso = db.Column(db.Float, nullable=False, default=0)
+    mensagem = db.Column(db.String(200))
+    resultado = db.Column(db.Text)
+    erro = db.Column(db.Text)
+    # Arquivo de entrada (CSV a importar) enquanto a tarefa não termina.
+    arquivo = db.Column(db.LargeBinary)
+    # Nome, dentro de TAREFAS_PASTA, do arquivo gerado pela tarefa (exportações).
+    saida = db.Column(db.String(255))
+    criada_por = db.Column(db.Integer, db.ForeignKey('usuarios.id'))
+    criada_em = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    disponivel_em = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    iniciada_em = db.Column(db.DateTime)
+    atualizada_em = db.Column(db.DateTime)
+    concluida_em = db.Column(db.DateTime)
+    trabalhador = db.Column(db.String(100))
+
+    usuario = db.relationship('Usuario')
+
+    @property
+    def dados_resultado(self):
+        return json.loads(self.resultado) if self.resultado else None
+
+
+def materias_do_aluno(aluno_id):
+    return (Materia.query
+            .join(Inscricao, Inscricao.materia_id == Materia.id)
+            .filter(Inscricao.aluno_id == aluno_id)
+            .options(db.joinedload(Materia.professor))
+            .order_by(Materia.id)
+            .all())
+
+def alunos_da_materia(materia_id):
+    return (Usuario.query
+            .join(Inscricao, Inscricao.aluno_id == Usuario.id)
+            .filter(Inscricao.materia_id == materia_id)
+            .order_by(Usuario.id)
+            .all())
+
+def entregas_da_atividade(atividade_id):
+    return (Entrega.query
+            .filter_by(atividade_id=atividade_id)
+            .options(db.joinedload(Entrega.aluno))
+            .order_by(Entrega.id)
+            .all())
+
+TAMANHO_PAGINA = 50
+
+
+def filtrar_por_prefixo(consulta, expressao, termo):
+    # Intervalo [termo, termo + U+FFFF) em vez de LIKE para que o SQLite use o índice.
+    return consulta.filter(expressao >= termo, expressao < termo + '\uffff')
+
+def pagina_keyset(consulta, coluna_id, apos=None, tamanho=TAMANHO_PAGINA, chave=lambda item: item.id):
+    """Retorna (itens, proximo): no máximo `tamanho` itens com id maior que `apos`
+    e o cursor da próxima página, ou None quando não há mais itens."""
+    if apos is not None:
+        consulta = consulta.filter(coluna_id > apos)
+    itens = consulta.order_by(coluna_id).limit(tamanho + 1).all()
+    if len(itens) <= tamanho:
+        return itens, None
+    itens = itens[:tamanho]
+    return itens, chave(itens[-1])
+
+def buscar_usuarios(role, termo=None):
+    consulta = Usuario.query.filter_by(role=role)
+    termo = (termo or '').strip()
+    if '@' in termo:
+        # Os emails ficam como foram digitados; a comparação ignora maiúsculas.
+        consulta = filtrar_por_prefixo(consulta, Usuario.email.collate('NOCASE'), termo)
+    elif termo.isdigit():
+        consulta = filtrar_por_prefixo(consulta, Usuario.ra, termo)
+    elif termo:
+        consulta = filtrar_por_prefixo(consulta, Usuario.nome_busca, normalizar_busca(termo))
+    return consulta
+
+def materias_com_professor(termo=None, fora_da_turma=None):
+    consulta = Materia.query.options(db.joinedload(Materia.professor))
+    if fora_da_turma is not None:
+        consulta = consulta.filter(~Materia.turmas.any(Turma.id == fora_da_turma))
+    if termo and termo.strip():
+        consulta = filtrar_por_prefixo(consulta, Materia.nome_busca, normalizar_busca(termo))
+    return consulta
+
+def turmas_com_contagem(termo=None):
+    # Consulta de (turma, nº de alunos) com a contagem feita no próprio banco.
+    num_alunos = db.func.count(turma_alunos.c.aluno_id)
+    consulta = (db.session.query(Turma, num_alunos)
+                .outerjoin(turma_alunos, turma_alunos.c.turma_id == Turma.id)
+                .group_by(Turma.id))
+    if termo and termo.strip():
+        consulta = filtrar_por_prefixo(consulta, Turma.nome_busca, normalizar_busca(termo))
+    return consulta
+
+
+db.Index('ix_usuarios_role_nome_busca', Usuario.role, Usuario.nome_busca)
+db.Index('ix_usuarios_role_email_nocase', Usuario.role, Usuario.email.collate('NOCASE'))
+db.Index('ix_materias_nome_busca', Materia.nome_busca)
+db.Index('ix_turmas_nome_busca', Turma.nome_busca)
+
+
+@event.listens_for(Usuario.nome, 'set')
+@event.listens_for(Materia.nome, 'set')
+@event.listens_for(Turma.nome, 'set')
+def _atualizar_nome_busca(alvo, valor, anterior, iniciador):
+    alvo.nome_busca = normalizar_busca(valor)
@@ -0,0 +1,89 @@
+from collections import Counter
+from models import db, Entrega
+import estatisticas
+from resumos import atualizar_resumos
+from validacao import versionar
+
+NOTA_MINIMA, NOTA_MAXIMA = 0, 10
+# O UPDATE usa três parâmetros por nota; o SQLite aceita até 32766 por comando.
+MAX_NOTAS_POR_LANCAMENTO = 5000
+
+
+def interpretar_nota(valor):
+    """Converte o valor enviado em nota. Vazio (ou None) remove a nota; aceita vírgula
+    decimal. Levanta ValueError para valor inválido ou fora da escala."""
+    if valor is None or (isinstance(valor, str) and not valor.strip()):
+        return None
+    if isinstance(valor, bool):
+        raise ValueError('Valor da nota inválido.')
+    try:
+        nota = float(valor.strip().replace(',', '.')) if isinstance(valor, str) else float(valor)
+    except (TypeError, ValueError):
+        raise ValueError('Valor da nota inválido.')
+    if not NOTA_MINIMA <= nota <= NOTA_MAXIMA:
+        raise ValueError(f'Nota inválida. Deve ser entre {NOTA_MINIMA} e {NOTA_MAXIMA}.')
+    return nota
+
+
+def _variacao(anterior, nova):
+    # Diferença nos contadores de `estatisticas` quando a nota vai de `anterior` para `nova`.
+    deltas = Counter()
+    for nota, sinal in ((anterior, -1), (nova, 1)):
+        if nota is None:
+            deltas['entregas_pendentes'] += sinal
+        else:
+            deltas['notas_quantidade'] += sinal
+            deltas['notas_soma'] += sinal * nota
+    return deltas
+
+
+def lancar_notas(atividade, notas):
+    """Grava as notas {entrega_id: valor} das entregas de `atividade` num único UPDATE.
+
+    As entregas são conferidas numa só consulta contra a atividade; entradas inválidas
+    ou de outra atividade vão para a lista de erros sem impedir as demais, e notas
+    iguais às gravadas são ignoradas. Retorna (alteradas, erros), com os erros como
+    [{'entrega_id', 'erro'}]; o commit fica a cargo de quem chamou.
+    """
+    erros, pedidas = [], {}
+    for chave, valor in notas.items():
+        try:
+            entrega_id = int(chave)
+        except (TypeError, ValueError):
+            erros.append({'entrega_id': chave, 'erro': 'Identificador de entrega inválido.'})
+            continue
+        try:
+            pedidas[entrega_id] = interpretar_nota(valor)
+        except ValueError as erro:
+            erros.append({'entrega_id': entrega_id, 'erro': str(erro)})
+    if not pedidas:
+        return 0, erros
+
+    atuais = {
+        entrega_id: (aluno_id, nota)
+        for entrega_id, aluno_id, nota in db.session.execute(
+            db.select(Entrega.id, Entrega.aluno_id, Entrega.nota)
+            .where(Entrega.atividade_id == atividade.id, Entrega.id.in_(list(pedidas)))
+        )
+    }
+    alteradas = {}
+    for entrega_id, nota in pedidas.items():
+        if entrega_id not in atuais:
+            erros.append({'entrega_id': entrega_id, 'erro': 'Entrega não encontrada nesta atividade.'})
+        elif atuais[entrega_id][1] != nota:
+            alteradas[entrega_id] = nota
+    if not alteradas:
+        return 0, erros
+
+    tabela = Entrega.__table__
+    db.session.execute(
+        tabela.update().where(tabela.c.id.in_(list(alteradas)))
+        .values(nota=db.case(alteradas, value=tabela.c.id))
+    )
+    deltas = Counter()
+    for entrega_id, nota in alteradas.items():
+        deltas.update(_variacao(atuais[entrega_id][1], nota))
+    estatisticas.ajustar(db.session, deltas)
+    atualizar_resumos(atividade.materia_id, {atuais[entrega_id][0] for entrega_id in alteradas})
+    versionar(db.session, atividades=[atividade.id])
+    return len(alteradas), erros
@@ -0,0 +1,168 @@
+from collections import namedtuple
+from datetime import timedelta
+from itertools import groupby
+from sqlalchemy import text
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from models import db, CalendarioAula, FrequenciaAluno
+import estatisticas
+from validacao import versionar
+
+# Presenças guardadas como conjuntos de bits: cada matéria tem um calendário por período
+# letivo que numera suas aulas (calendario_aulas), e cada (aluno, matéria, período) tem
+# uma linha em `frequencias` com dois conjuntos indexados por esse número, o das aulas
+# com presença lançada e o das aulas em que o aluno estava presente, mais a contagem de
+# bits de cada um. Um semestre de 100 aulas cabe em 2 x 13 bytes numa só linha.
+
+MAX_DATAS_POR_REGISTRO = 7
+TAMANHO_LOTE = 50_000
+
+Presenca = namedtuple('Presenca', 'data presente')
+
+_SQL_NOVA_AULA = text(
+    "INSERT INTO calendario_aulas (materia_id, periodo, dia, data)"
+    " SELECT :materia_id, :periodo, coalesce(max(dia) + 1, 0), :data FROM calendario_aulas"
+    " WHERE materia_id = :materia_id AND periodo = :periodo"
+    " ON CONFLICT DO NOTHING"
+)
+_SQL_HISTORICO = text(
+    "SELECT c.data, c.dia, f.registradas, f.presentes FROM frequencias f"
+    " JOIN calendario_aulas c ON c.materia_id = f.materia_id AND c.periodo = f.periodo"
+    " WHERE f.aluno_id = :aluno_id AND f.materia_id = :materia_id ORDER BY c.data"
+).columns(data=db.Date, dia=db.Integer, registradas=db.LargeBinary, presentes=db.LargeBinary)
+
+
+def intervalo_de_datas(inicio, fim):
+    if fim < inicio:
+        raise ValueError('A data final é anterior à data inicial.')
+    dias = (fim - inicio).days + 1
+    if dias > MAX_DATAS_POR_REGISTRO:
+        raise ValueError(f'No máximo {MAX_DATAS_POR_REGISTRO} dias por registro.')
+    return [inicio + timedelta(days=i) for i in range(dias)]
+
+
+def periodo_letivo(data):
+    return f'{data.year}-{1 if data.month <= 6 else 2}'
+
+
+def bits(conjunto):
+    return int.from_bytes(conjunto, 'little')
+
+
+def conjunto(bits):
+    return bits.to_bytes((bits.bit_length() + 7) // 8, 'little')
+
+
+def tem_bit(conjunto, dia):
+    return dia >> 3 < len(conjunto) and conjunto[dia >> 3] >> (dia & 7) & 1 == 1
+
+
+def _linha(aluno_id, materia_id, periodo, registradas, presentes):
+    return {'aluno_id': aluno_id, 'materia_id': materia_id, 'periodo': periodo,
+            'registradas': conjunto(registradas), 'presentes': conjunto(presentes),
+            'aulas': registradas.bit_count(), 'presencas': presentes.bit_count()}
+
+
+def _aulas(sessao, materia_id, datas):
+    # Número de cada data no calendário da matéria; datas novas entram no fim do período.
+    sessao.execute(_SQL_NOVA_AULA, [
+        {'materia_id': materia_id, 'periodo': periodo_letivo(data), 'data': data.isoformat()}
+        for data in sorted(datas)
+    ])
+    return {
+        data: (periodo, dia)
+        for data, periodo, dia in sessao.execute(
+            db.select(CalendarioAula.data, CalendarioAula.periodo, CalendarioAula.dia)
+            .where(CalendarioAula.materia_id == materia_id, CalendarioAula.data.in_(sorted(datas)))
+        )
+    }
+
+
+def registrar_presencas(materia_id, presencas):
+    """Grava as presenças de uma matéria: lê os conjuntos dos alunos nos períodos das
+    datas, liga ou desliga os bits e grava todos num único INSERT ... ON CONFLICT.
+
+    `presencas` mapeia (aluno_id, data) -> presente. Retorna a quantidade de
+    presenças novas e atualizadas; o commit fica a cargo de quem chamou.
+    """
+    if not presencas:
+        return 0, 0
+
+    aulas = _aulas(db.session, materia_id, {data for _, data in presencas})
+    tabela = FrequenciaAluno.__table__
+    atuais = {
+        (aluno_id, periodo): (bits(registradas), bits(presentes))
+        for aluno_id, periodo, registradas, presentes in db.session.execute(
+            db.select(tabela.c.aluno_id, tabela.c.periodo, tabela.c.registradas, tabela.c.presentes)
+            .where(tabela.c.materia_id == materia_id,
+                   tabela.c.periodo.in_(sorted({periodo for periodo, _ in aulas.values()})))
+        )
+    }
+
+    novos, atualizadas = {}, 0
+    for (aluno_id, data), presente in presencas.items():
+        periodo, dia = aulas[data]
+        bit = 1 << dia
+        registradas, presentes = novos.get((aluno_id, periodo)) or atuais.get((aluno_id, periodo), (0, 0))
+        atualizadas += bool(registradas & bit)
+        novos[(aluno_id, periodo)] = (registradas | bit, presentes | bit if presente else presentes & ~bit)
+    alterados = {chave: valor for chave, valor in novos.items() if atuais.get(chave) != valor}
+
+    if alterados:
+        stmt = sqlite_insert(tabela)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=['aluno_id', 'materia_id', 'periodo'],
+            set_={coluna: stmt.excluded[coluna] for coluna in ('registradas', 'presentes', 'aulas', 'presencas')}
+        )
+        db.session.execute(stmt, [
+            _linha(aluno_id, materia_id, periodo, registradas, presentes)
+            for (aluno_id, periodo), (registradas, presentes) in alterados.items()
+        ])
+    versionar(db.session, materias=[materia_id])
+
+    antes = [atuais.get(chave, (0, 0)) for chave in alterados]
+    estatisticas.ajustar(db.session, {
+        'presencas': sum(r.bit_count() for r, _ in alterados.values()) - sum(r.bit_count() for r, _ in antes),
+        'presencas_presente': sum(p.bit_count() for _, p in alterados.values()) - sum(p.bit_count() for _, p in antes),
+    })
+    return len(presencas) - atualizadas, atualizadas
+
+
+def historico_presencas(aluno_id, materia_id, conn=None):
+    """Presenças lançadas do aluno na matéria, [Presenca(data, presente)] em ordem de data."""
+    linhas = (conn or db.session).execute(_SQL_HISTORICO, {'aluno_id': aluno_id, 'materia_id': materia_id})
+    return [Presenca(data, tem_bit(presentes, dia))
+            for data, dia, registradas, presentes in linhas if tem_bit(registradas, dia)]
+
+
+def gravar_frequencias(conn, presencas):
+    """Grava em lote presenças (aluno_id, materia_id, data, presente) de matérias ainda
+    sem calendário, agrupadas por matéria: as aulas de cada período são numeradas em
+    ordem de data. Usado pela migração da tabela antiga e pelos dados sintéticos.
+    Retorna a quantidade de presenças gravadas."""
+    calendario, frequencias, total = [], [], 0
+
+    def esvaziar(minimo):
+        for tabela, linhas in ((CalendarioAula.__table__, calendario), (FrequenciaAluno.__table__, frequencias)):
+            if len(linhas) >= minimo and linhas:
+                conn.execute(tabela.insert(), linhas)
+                linhas.clear()
+
+    for materia_id, linhas in groupby(presencas, key=lambda linha: linha[1]):
+        linhas = list(linhas)
+        aulas, contagem = {}, {}
+        for data in sorted({data for _, _, data, _ in linhas}):
+            periodo = periodo_letivo(data)
+            aulas[data] = (periodo, contagem.setdefault(periodo, 0))
+            contagem[periodo] += 1
+            calendario.append({'materia_id': materia_id, 'periodo': periodo, 'dia': aulas[data][1], 'data': data})
+        conjuntos = {}
+        for aluno_id, _, data, presente in linhas:
+            periodo, dia = aulas[data]
+            registradas, presentes = conjuntos.get((aluno_id, periodo), (0, 0))
+            conjuntos[(aluno_id, periodo)] = (registradas | 1 << dia, presentes | bool(presente) << dia)
+        for (aluno_id, periodo), (registradas, presentes) in conjuntos.items():
+            frequencias.append(_linha(aluno_id, materia_id, periodo, registradas, presentes))
+            total += registradas.bit_count()
+        esvaziar(TAMANHO_LOTE)
+    esvaziar(1)
+    return total
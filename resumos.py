@@ -0,0 +1,61 @@
+from datetime import datetime
+from sqlalchemy import text, bindparam
+from models import db
+
+# Recalcula o resumo de cada (aluno, matéria) inscrito com um único INSERT ... SELECT,
+# a partir das contagens de `frequencias` e das entregas. `filtro` restringe quais
+# inscrições entram.
+_SQL_RESUMO = """
+INSERT INTO resumos_aluno_materia (
+    aluno_id, materia_id, aulas_total, aulas_presente,
+    entregas_corrigidas, entregas_pendentes, media_notas, atualizado_em
+)
+SELECT
+    i.aluno_id,
+    i.materia_id,
+    (SELECT coalesce(sum(f.aulas), 0) FROM frequencias f WHERE f.aluno_id = i.aluno_id AND f.materia_id = i.materia_id),
+    (SELECT coalesce(sum(f.presencas), 0) FROM frequencias f WHERE f.aluno_id = i.aluno_id AND f.materia_id = i.materia_id),
+    coalesce(e.corrigidas, 0),
+    coalesce(e.pendentes, 0),
+    e.media,
+    :agora
+FROM inscricoes i
+LEFT JOIN (
+    SELECT en.aluno_id, a.materia_id,
+           count(en.nota) AS corrigidas,
+           sum(en.nota IS NULL) AS pendentes,
+           avg(en.nota) AS media
+    FROM entregas en JOIN atividades a ON a.id = en.atividade_id
+    WHERE {filtro_entregas}
+    GROUP BY en.aluno_id, a.materia_id
+) e ON e.aluno_id = i.aluno_id AND e.materia_id = i.materia_id
+WHERE {filtro}
+ON CONFLICT (aluno_id, materia_id) DO UPDATE SET
+    aulas_total = excluded.aulas_total,
+    aulas_presente = excluded.aulas_presente,
+    entregas_corrigidas = excluded.entregas_corrigidas,
+    entregas_pendentes = excluded.entregas_pendentes,
+    media_notas = excluded.media_notas,
+    atualizado_em = excluded.atualizado_em
+"""
+
+
+def atualizar_resumos(materia_id, alunos_ids=None, conn=None):
+    """Atualiza os resumos da matéria (de todos os inscritos ou só de `alunos_ids`)
+    dentro da transação atual; o commit fica a cargo de quem chamou."""
+    parametros = {'agora': datetime.utcnow(), 'materia_id': materia_id}
+    filtro = "i.materia_id = :materia_id"
+    filtro_entregas = "a.materia_id = :materia_id"
+    if alunos_ids is not None:
+        filtro += " AND i.aluno_id IN :alunos_ids"
+        filtro_entregas += " AND en.aluno_id IN :alunos_ids"
+        parametros['alunos_ids'] = list(alunos_ids)
+    sql = text(_SQL_RESUMO.format(filtro=filtro, filtro_entregas=filtro_entregas))
+    if alunos_ids is not None:
+        sql = sql.bindparams(bindparam('alunos_ids', expanding=True))
+    (conn or db.session).execute(sql, parametros)
+
+
+def recalcular_resumos(conn):
+    conn.execute(text("DELETE FROM resumos_aluno_materia"))
+    conn.execute(text(_SQL_RESUMO.format(filtro="1", filtro_entregas="1")), {'agora': datetime.utcnow()})
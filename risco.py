@@ -0,0 +1,396 @@
+import json
+import logging
+import sys
+import time
+from collections import namedtuple
+from datetime import date, datetime, timedelta
+import numpy as np
+from sqlalchemy import text
+from models import db, Usuario, Materia, RiscoAlunoMateria, ModeloRisco
+
+logger = logging.getLogger('sigma.risco')
+
+# Risco de reprovação por (aluno, matéria). Presenças, entregas e atividades são lidas
+# em colunas (arrays NumPy) numa consulta cada, os atributos de todas as inscrições são
+# calculados de uma vez com np.bincount, e uma regressão logística treinada aqui mesmo
+# dá a probabilidade. O treino olha para trás: atributos de HORIZONTE_DIAS atrás contra
+# a situação de hoje (frequência abaixo de 75% ou média abaixo de 6). Entre um treino e
+# outro, a análise só reavalia as inscrições cujo resumo mudou desde a última avaliação.
+
+ATRIBUTOS = ('frequencia', 'frequencia_recente', 'media', 'entregas', 'notas_baixas', 'tendencia')
+# Sinal esperado do peso de cada atributo: frequência, média, entregas e tendência
+# maiores diminuem o risco; mais notas baixas o aumentam.
+SENTIDOS = {'frequencia': -1, 'frequencia_recente': -1, 'media': -1, 'entregas': -1,
+            'notas_baixas': 1, 'tendencia': -1}
+FREQUENCIA_MINIMA = 0.75
+MEDIA_MINIMA = 6.0
+HORIZONTE_DIAS = 28
+JANELA_RECENTE_DIAS = 21
+# A partir desta probabilidade o aluno entra na lista dos dashboards.
+LIMIAR_RISCO = 0.5
+MIN_AMOSTRAS = 50
+REGULARIZACAO = 1.0
+# Dia juliano de date.toordinal() == 0, para comparar com julianday() do SQLite.
+_DIA_JULIANO_ZERO = 1721424.5
+
+
+
+class HistoricoInsuficiente(ValueError):
+    pass
+
+
+Dados = namedtuple('Dados', 'alunos materias par_materia presenca_par presenca_dia presenca_ok '
+                            'entrega_par entrega_dia entrega_nota atividade_materia atividade_dia')
+
+_MOTIVOS = {
+    'frequencia': lambda valor: f'Frequência de {valor:.0%}',
+    'frequencia_recente': lambda valor: f'Frequência de {valor:.0%} nas últimas {JANELA_RECENTE_DIAS // 7} semanas',
+    'media': lambda valor: f'Média {valor:.1f}'.replace('.', ','),
+    'entregas': lambda valor: f'Entregou {valor:.0%} das atividades',
+    'notas_baixas': lambda valor: f'{valor:.0%} das notas abaixo de {MEDIA_MINIMA:.0f}',
+    'tendencia': lambda valor: f'Notas variando {valor:+.1f} por semana'.replace('.', ','),
+}
+
+
+def dia_juliano(dia):
+    return dia.toordinal() + _DIA_JULIANO_ZERO
+
+
+def _colunas(conn, sql, tipos, parametros=()):
+    # Cursor do driver direto no np.fromiter: sem um objeto Row por linha.
+    cursor = conn.connection.cursor()
+    try:
+        cursor.execute(sql, parametros)
+        return np.fromiter(cursor, dtype=list(tipos.items()))
+    finally:
+        cursor.close()
+
+
+def _indices(chaves_pares, chaves):
+    # Posição de cada linha no vetor (ordenado) de pares; -1 se a linha não é de nenhum par.
+    if not len(chaves_pares):
+        return np.full(len(chaves), -1)
+    posicoes = np.minimum(np.searchsorted(chaves_pares, chaves), len(chaves_pares) - 1)
+    return np.where(chaves_pares[posicoes] == chaves, posicoes, -1)
+
+
+def _presencas(conn, juncao, filtro_calendario, parametros):
+    # Os conjuntos de bits de `frequencias` viram matrizes (conjuntos x aulas) com
+    # np.unpackbits; cada bit ligado de `registradas` é uma presença, com a data vinda
+    # do calendário da matéria no período.
+    cursor = conn.connection.cursor()
+    try:
+        conjuntos = cursor.execute("SELECT f.aluno_id, f.materia_id, f.periodo, f.registradas, f.presentes"
+                                   " FROM frequencias f" + juncao, parametros).fetchall()
+        calendario = cursor.execute("SELECT materia_id, periodo, dia, julianday(data) FROM calendario_aulas"
+                                    + filtro_calendario, parametros).fetchall()
+    finally:
+        cursor.close()
+    chaves = {}
+    for materia, periodo, _, _ in calendario:
+        chaves.setdefault((materia, periodo), len(chaves))
+    largura = max([len(linha[3]) for linha in conjuntos] + [0])
+    datas = np.full((len(chaves), max([largura * 8] + [dia + 1 for _, _, dia, _ in calendario])), np.nan)
+    for materia, periodo, dia, data in calendario:
+        datas[chaves[(materia, periodo)], dia] = data
+
+    def bits(coluna):
+        matriz = np.frombuffer(b''.join(linha[coluna].ljust(largura, b'\0') for linha in conjuntos), dtype=np.uint8)
+        return np.unpackbits(matriz.reshape(len(conjuntos), largura), axis=1, bitorder='little').astype(bool)
+
+    linhas, dias = np.nonzero(bits(3))
+    chave = np.array([chaves[(materia, periodo)] for _, materia, periodo, _, _ in conjuntos], dtype=int)
+    presencas = np.empty(len(linhas), dtype=[('aluno', 'i8'), ('materia', 'i8'), ('dia', 'f8'), ('presente', '?')])
+    presencas['aluno'] = np.array([linha[0] for linha in conjuntos], dtype='i8')[linhas]
+    presencas['materia'] = np.array([linha[1] for linha in conjuntos], dtype='i8')[linhas]
+    presencas['dia'] = datas[chave[linhas], dias]
+    presencas['presente'] = bits(4)[linhas, dias]
+    return presencas
+
+
+def carregar(conn, pares=None):
+    """Lê as inscrições com suas presenças, entregas e atividades em arrays. Com `pares`
+    ([(aluno_id, materia_id)]), só as linhas desses pares."""
+    # Os pares vão como um parâmetro JSON e não numa tabela temporária: gravar nela abriria
+    # a transação já nas leituras, e qualquer outra gravação até os INSERTs derrubaria a análise.
+    juncao, parametros, origem = "", {}, "inscricoes"
+    if pares is not None:
+        origem = ("(SELECT DISTINCT json_extract(value, '$[0]') AS aluno_id, json_extract(value, '$[1]') AS materia_id"
+                  " FROM json_each(:alvo))")
+        parametros = {'alvo': json.dumps([[int(aluno), int(materia)] for aluno, materia in pares])}
+        juncao = f" JOIN {origem} i ON i.aluno_id = {{aluno}} AND i.materia_id = {{materia}}"
+    inscricoes = _colunas(conn, f"SELECT aluno_id, materia_id FROM {origem} ORDER BY aluno_id, materia_id",
+                          {'aluno': 'i8', 'materia': 'i8'}, parametros)
+    presencas = _presencas(conn, juncao.format(aluno='f.aluno_id', materia='f.materia_id'),
+                           f" WHERE materia_id IN (SELECT materia_id FROM {origem})" if pares is not None else "",
+                           parametros)
+    entregas = _colunas(conn, "SELECT e.aluno_id, a.materia_id, julianday(a.data_entrega), coalesce(e.nota, -1)"
+                        " FROM entregas e JOIN atividades a ON a.id = e.atividade_id"
+                        + juncao.format(aluno='e.aluno_id', materia='a.materia_id'),
+                        {'aluno': 'i8', 'materia': 'i8', 'dia': 'f8', 'nota': 'f8'}, parametros)
+    atividades = _colunas(conn, "SELECT materia_id, julianday(data_entrega) FROM atividades"
+                          + (f" WHERE materia_id IN (SELECT materia_id FROM {origem})" if pares is not None else ""),
+                          {'materia': 'i8', 'dia': 'f8'}, parametros)
+
+    base = int(max([0] + [int(coluna['materia'].max()) for coluna in (inscricoes, presencas, entregas, atividades)
+                          if len(coluna)])) + 1
+    chaves = inscricoes['aluno'] * base + inscricoes['materia']
+    presenca_par = _indices(chaves, presencas['aluno'] * base + presencas['materia'])
+    entrega_par = _indices(chaves, entregas['aluno'] * base + entregas['materia'])
+    materias, par_materia = np.unique(inscricoes['materia'], return_inverse=True)
+    atividade_materia = np.searchsorted(materias, atividades['materia'])
+    da_materia = atividade_materia < len(materias)
+    da_materia[da_materia] = materias[atividade_materia[da_materia]] == atividades['materia'][da_materia]
+    notas = entregas['nota'].copy()
+    notas[notas < 0] = np.nan
+    presentes, entregues = presenca_par >= 0, entrega_par >= 0
+    return Dados(
+        inscricoes['aluno'], inscricoes['materia'], par_materia,
+        presenca_par[presentes], presencas['dia'][presentes], presencas['presente'][presentes],
+        entrega_par[entregues], entregas['dia'][entregues], notas[entregues],
+        atividade_materia[da_materia], atividades['dia'][da_materia],
+    )
+
+
+def ultimo_dia(dados):
+    dias = [coluna.max() for coluna in (dados.presenca_dia, dados.entrega_dia) if len(coluna)]
+    return max(dias) if dias else dia_juliano(date.today())
+
+
+def atributos(dados, corte):
+    """Matriz (inscrições x ATRIBUTOS) com a situação de cada inscrição no dia juliano
+    `corte`, contando só aulas e atividades até ele. NaN onde ainda não há dado."""
+    n = len(dados.alunos)
+
+    def somar(par, mascara, pesos=None):
+        return np.bincount(par[mascara], weights=None if pesos is None else pesos[mascara], minlength=n)
+
+    ate = dados.presenca_dia <= corte
+    recentes = ate & (dados.presenca_dia > corte - JANELA_RECENTE_DIAS)
+    presentes = dados.presenca_ok.astype(float)
+    no_prazo = dados.entrega_dia <= corte
+    corrigidas = no_prazo & ~np.isnan(dados.entrega_nota)
+    notas = np.nan_to_num(dados.entrega_nota)
+    # Semanas contadas a partir do corte: números pequenos, sem perda de precisão nas somas de quadrados.
+    semanas = (dados.entrega_dia - corte) / 7
+    quantidade = somar(dados.entrega_par, corrigidas)
+    soma, soma_x = somar(dados.entrega_par, corrigidas, notas), somar(dados.entrega_par, corrigidas, semanas)
+    # Inclinação da reta de mínimos quadrados nota x semana do prazo, por inscrição.
+    variacao = quantidade * somar(dados.entrega_par, corrigidas, semanas * semanas) - soma_x ** 2
+    covariacao = quantidade * somar(dados.entrega_par, corrigidas, semanas * notas) - soma_x * soma
+    previstas = np.bincount(dados.atividade_materia[dados.atividade_dia <= corte],
+                            minlength=dados.par_materia.max() + 1 if n else 0)[dados.par_materia]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.column_stack([
+            somar(dados.presenca_par, ate, presentes) / somar(dados.presenca_par, ate),
+            somar(dados.presenca_par, recentes, presentes) / somar(dados.presenca_par, recentes),
+            soma / quantidade,
+            np.minimum(somar(dados.entrega_par, no_prazo) / previstas, 1.0),
+            somar(dados.entrega_par, corrigidas, (notas < MEDIA_MINIMA).astype(float)) / quantidade,
+            np.where(variacao > 1e-9, covariacao / variacao, np.where(quantidade > 0, 0.0, np.nan)),
+        ])
+
+
+def situacao_reprovado(matriz):
+    frequencia, media = matriz[:, ATRIBUTOS.index('frequencia')], matriz[:, ATRIBUTOS.index('media')]
+    return (frequencia < FREQUENCIA_MINIMA) | (media < MEDIA_MINIMA)
+
+
+def _padronizar(matriz, medias, desvios):
+    # Falta de dado vira a média (0 depois de padronizar): não empurra o risco para nenhum lado.
+    return np.nan_to_num((matriz - medias) / desvios)
+
+
+def auc(rotulos, pontuacoes):
+    """Área sob a curva ROC pela estatística de Mann-Whitney."""
+    positivos = rotulos.sum()
+    negativos = len(rotulos) - positivos
+    if not positivos or not negativos:
+        return None
+    postos = np.empty(len(pontuacoes))
+    postos[np.argsort(pontuacoes, kind='stable')] = np.arange(1, len(pontuacoes) + 1)
+    return float((postos[rotulos].sum() - positivos * (positivos + 1) / 2) / (positivos * negativos))
+
+
+def treinar(matriz, rotulos, regularizacao=REGULARIZACAO, iteracoes=25):
+    """Regressão logística com penalidade L2 pelo método de Newton (IRLS): cada iteração
+    é uma passada vetorizada pelas linhas. Retorna o modelo como dicionário, com peso
+    zero nos atributos deixados de fora."""
+    # Média e desvio de cada atributo ignorando NaN (0 e 1 para colunas sem nenhum dado).
+    presentes = np.maximum((~np.isnan(matriz)).sum(axis=0), 1)
+    medias = np.nan_to_num(matriz).sum(axis=0) / presentes
+    desvios = np.sqrt(((np.where(np.isnan(matriz), medias, matriz) - medias) ** 2).sum(axis=0) / presentes)
+    desvios = np.where(desvios > 0, desvios, 1.0)
+    x = np.column_stack([np.ones(len(matriz)), _padronizar(matriz, medias, desvios)])
+    y = rotulos.astype(float)
+    sentidos = np.r_[0, [SENTIDOS[atributo] for atributo in ATRIBUTOS]]
+    ativos = np.ones(x.shape[1], dtype=bool)
+    # Um atributo cujo peso sai contra o SENTIDO esperado (efeito de outro atributo
+    # correlacionado) fica de fora e o modelo é refeito sem ele.
+    while True:
+        pesos = np.zeros(x.shape[1])
+        pesos[ativos] = _newton(x[:, ativos], y, regularizacao, iteracoes)
+        contrarios = pesos * sentidos < 0
+        if not contrarios.any():
+            break
+        ativos &= ~contrarios
+    return {'atributos': list(ATRIBUTOS), 'medias': medias.tolist(), 'desvios': desvios.tolist(),
+            'vies': float(pesos[0]), 'pesos': pesos[1:].tolist()}
+
+
+def _newton(x, y, regularizacao, iteracoes):
+    pesos = np.zeros(x.shape[1])
+    penalidade = np.r_[0.0, np.full(x.shape[1] - 1, regularizacao)]
+    for _ in range(iteracoes):
+        p = 1 / (1 + np.exp(-x @ pesos))
+        gradiente = x.T @ (p - y) + penalidade * pesos
+        hessiana = (x * (p * (1 - p))[:, None]).T @ x + np.diag(penalidade)
+        passo = np.linalg.solve(hessiana, gradiente)
+        pesos -= passo
+        if np.abs(passo).max() < 1e-6:
+            break
+    return pesos
+
+
+def pontuar(modelo, matriz):
+    """Retorna (probabilidades, motivos): o motivo de cada linha é o atributo que mais
+    empurra o risco para cima, descrito com o valor dele."""
+    z = _padronizar(matriz, np.array(modelo['medias']), np.array(modelo['desvios']))
+    contribuicoes = z * np.array(modelo['pesos'])
+    probabilidades = 1 / (1 + np.exp(-(contribuicoes.sum(axis=1) + modelo['vies'])))
+    principais = contribuicoes.argmax(axis=1)
+    motivos = [
+        _MOTIVOS[ATRIBUTOS[coluna]](matriz[linha, coluna]) if contribuicoes[linha, coluna] > 0 else None
+        for linha, coluna in enumerate(principais)
+    ]
+    return probabilidades, motivos
+
+
+def _treinar_com_historico(dados, referencia):
+    # Só entram inscrições que já tinham aula ou nota na data do corte.
+    antes = atributos(dados, referencia - HORIZONTE_DIAS)
+    com_dados = ~np.isnan(antes[:, [ATRIBUTOS.index('frequencia'), ATRIBUTOS.index('media')]]).all(axis=1)
+    rotulos = situacao_reprovado(atributos(dados, referencia))[com_dados]
+    antes, alunos = antes[com_dados], dados.alunos[com_dados]
+    if len(rotulos) < MIN_AMOSTRAS or rotulos.all() or not rotulos.any():
+        raise HistoricoInsuficiente("Histórico insuficiente para treinar o modelo de risco "
+                         f"({len(rotulos)} inscrições com dados, {int(rotulos.sum())} reprovações).")
+    # Um a cada cinco alunos fica fora do treino para medir o modelo.
+    validacao = alunos % 5 == 0
+    modelo = treinar(antes[~validacao], rotulos[~validacao])
+    modelo.update(referencia=float(referencia), amostras=int(len(rotulos)), positivos=int(rotulos.sum()),
+                  auc=auc(rotulos[validacao], pontuar(modelo, antes[validacao])[0]))
+    return modelo
+
+
+def ultimo_modelo(conn):
+    linha = conn.execute(db.select(ModeloRisco.treinado_em, ModeloRisco.parametros)
+                         .order_by(ModeloRisco.id.desc()).limit(1)).first()
+    if linha is None:
+        return None, None
+    return linha.treinado_em, json.loads(linha.parametros)
+
+
+_SQL_ALTERADOS = """
+SELECT r.aluno_id, r.materia_id FROM resumos_aluno_materia r
+LEFT JOIN riscos_aluno_materia k ON k.aluno_id = r.aluno_id AND k.materia_id = r.materia_id
+WHERE k.calculado_em IS NULL OR r.atualizado_em > k.calculado_em
+"""
+
+
+def analisar_riscos(conn, retreino=24 * 60 * 60, completa=False, progresso=None, exigir_modelo=False):
+    """Atualiza `riscos_aluno_materia`. Retreina o modelo e reavalia todas as inscrições
+    se `completa`, se não houver modelo ou se o último tiver mais de `retreino` segundos;
+    senão reavalia só as inscrições alteradas. Lê e calcula tudo antes da primeira
+    gravação, então a trava de escrita fica só com os INSERTs.
+    Sem histórico para treinar (instalação nova, poucos dados), não grava nada e retorna
+    o modo 'sem_modelo'; com `exigir_modelo`, levanta HistoricoInsuficiente."""
+    inicio = time.perf_counter()
+    agora = datetime.utcnow()
+    hoje = dia_juliano(date.today())
+    avisar = progresso or (lambda *args: None)
+    treinado_em, modelo = ultimo_modelo(conn)
+    completa = completa or modelo is None or agora - treinado_em > timedelta(seconds=retreino)
+    if completa:
+        avisar(0, 3, 'Lendo presenças e notas')
+        dados = carregar(conn)
+        referencia = min(hoje, ultimo_dia(dados))
+        avisar(1, 3, 'Treinando o modelo')
+        try:
+            modelo = _treinar_com_historico(dados, referencia)
+        except HistoricoInsuficiente as erro:
+            if exigir_modelo:
+                raise
+            logger.info('analise de risco sem modelo: %s', erro)
+            return {'modo': 'sem_modelo', 'avaliadas': 0, 'motivo': str(erro),
+                    'segundos': round(time.perf_counter() - inicio, 3)}
+    else:
+        pares = conn.execute(text(_SQL_ALTERADOS)).all()
+        if not pares:
+            return {'modo': 'incremental', 'avaliadas': 0, 'segundos': round(time.perf_counter() - inicio, 3)}
+        avisar(0, 3, f'Lendo {len(pares)} inscrições alteradas')
+        dados = carregar(conn, pares)
+        referencia = min(hoje, max(modelo['referencia'], ultimo_dia(dados)))
+    avisar(2, 3, 'Calculando os riscos')
+    probabilidades, motivos = pontuar(modelo, atributos(dados, referencia))
+
+    if completa:
+        conn.execute(db.insert(ModeloRisco).values(treinado_em=agora, parametros=json.dumps(modelo)))
+        conn.execute(text("DELETE FROM riscos_aluno_materia"))
+    conn.execute(text(
+        "INSERT INTO riscos_aluno_materia (aluno_id, materia_id, risco, motivo, calculado_em)"
+        " VALUES (:aluno_id, :materia_id, :risco, :motivo, :agora)"
+        " ON CONFLICT (aluno_id, materia_id) DO UPDATE SET"
+        " risco = excluded.risco, motivo = excluded.motivo, calculado_em = excluded.calculado_em"
+    ), [{'aluno_id': int(aluno), 'materia_id': int(materia), 'risco': float(risco), 'motivo': motivo, 'agora': agora}
+        for aluno, materia, risco, motivo in zip(dados.alunos, dados.materias, probabilidades, motivos)])
+    # Inscrições desfeitas desde a última análise.
+    conn.execute(text("DELETE FROM riscos_aluno_materia WHERE NOT EXISTS (SELECT 1 FROM inscricoes i"
+                      " WHERE i.aluno_id = riscos_aluno_materia.aluno_id"
+                      " AND i.materia_id = riscos_aluno_materia.materia_id)"))
+    if completa:
+        # Sem estatísticas da tabela o SQLite percorre as matérias em vez do índice de risco.
+        conn.execute(text("ANALYZE riscos_aluno_materia"))
+    return {
+        'modo': 'completa' if completa else 'incremental',
+        'avaliadas': len(dados.alunos),
+        'em_risco': int((probabilidades >= LIMIAR_RISCO).sum()),
+        'auc': modelo['auc'],
+        'segundos': round(time.perf_counter() - inicio, 3),
+    }
+
+
+def alunos_em_risco(professor_id=None, limite=10):
+    """As inscrições com risco a partir de LIMIAR_RISCO, da maior para a menor, das
+    matérias do professor (ou de todas)."""
+    consulta = (db.select(RiscoAlunoMateria, Usuario.nome, Usuario.ra, Materia.nome)
+                .join(Usuario, Usuario.id == RiscoAlunoMateria.aluno_id)
+                .join(Materia, Materia.id == RiscoAlunoMateria.materia_id)
+                .where(RiscoAlunoMateria.risco >= LIMIAR_RISCO)
+                .order_by(RiscoAlunoMateria.risco.desc())
+                .limit(limite))
+    if professor_id is not None:
+        consulta = consulta.where(Materia.professor_id == professor_id)
+    return db.session.execute(consulta).all()
+
+
+def total_em_risco():
+    return db.session.execute(
+        db.select(db.func.count()).select_from(RiscoAlunoMateria).where(RiscoAlunoMateria.risco >= LIMIAR_RISCO)
+    ).scalar()
+
+
+if __name__ == '__main__':
+    from app import create_app
+
+    app = create_app({'TAREFAS_TRABALHADORES': 0})
+
+    if len(sys.argv) < 2 or sys.argv[1] not in ('analisar', 'treinar'):
+        print("Uso: python risco.py analisar   # só as inscrições alteradas (treina se não houver modelo)\n"
+              "     python risco.py treinar    # retreina e reavalia todas")
+        sys.exit(2)
+
+    with app.app_context():
+        with db.engine.begin() as conn:
+            retreinar = sys.argv[1] == 'treinar'
+            print(analisar_riscos(conn, app.config['RISCO_RETREINO'], completa=retreinar, exigir_modelo=retreinar))
@@ -0,0 +1,166 @@
+from flask import Blueprint, render_template, request, redirect, url_for, session, flash, jsonify
+from models import db, Usuario, Materia, Atividade, Entrega, ResumoAlunoMateria
+from models import materias_do_aluno
+from resumos import atualizar_resumos
+from presencas import historico_presencas
+from conteudos import guardar_conteudo
+from similaridade import comparar_entrega, registrar_entrega
+from autorizacao import pode_acessar_materia, login_required
+from fragmentos import adiado
+from validacao import condicional, versao_materia, versao_atividade
+from banco import executar_escrita, BancoOcupado, MENSAGEM_BANCO_OCUPADO
+
+bp = Blueprint('aluno', __name__)
+
+@bp.route('/dashboard/aluno')
+@login_required(role='aluno')
+def dashboard_aluno():
+
+    aluno = db.session.get(Usuario, session['user_id'])
+
+    materias = adiado(materias_do_aluno, aluno.id)
+
+    return render_template('alunos/dashboard_aluno.html', aluno=aluno, materias=materias)
+
+def _resumo_do_aluno(aluno_id, materia_id):
+    resumo = db.session.get(ResumoAlunoMateria, (aluno_id, materia_id))
+    if resumo is None:
+        # Inscrição criada depois do último recálculo: monta o resumo agora.
+        atualizar_resumos(materia_id, [aluno_id])
+        db.session.commit()
+        resumo = db.session.get(ResumoAlunoMateria, (aluno_id, materia_id))
+    return resumo
+
+@bp.route('/aluno/materia/<int:materia_id>')
+@login_required(role='aluno')
+@condicional(versao_materia)
+def materia_detalhes_aluno(materia_id):
+    aluno_id = session['user_id']
+
+    if not pode_acessar_materia(materia_id):
+        flash('Você não está inscrito nesta matéria.', 'warning')
+        return redirect(url_for('aluno.dashboard_aluno'))
+    materia = db.get_or_404(Materia, materia_id)
+
+    return render_template(
+        'alunos/materia_detalhes_aluno.html',
+        materia=materia,
+        resumo=_resumo_do_aluno(aluno_id, materia_id)
+    )
+
+@bp.route('/aluno/materia/<int:materia_id>/historico')
+@login_required(role='aluno', materia='materia_id')
+@condicional(versao_materia)
+def historico_materia_aluno(materia_id):
+    aluno_id = session['user_id']
+
+    atividades = Atividade.query.filter_by(materia_id=materia_id).order_by(Atividade.data_entrega.asc()).all()
+
+    entregas = db.session.execute(
+        db.select(Entrega.atividade_id, Entrega.nota).where(
+            Entrega.aluno_id == aluno_id,
+            Entrega.atividade_id.in_([a.id for a in atividades])
+        )
+    ).all()
+
+    notas_entregas = {atividade_id: nota for atividade_id, nota in entregas}
+
+    presencas = historico_presencas(aluno_id, materia_id)
+
+    return render_template(
+        'alunos/historico_materia_aluno.html',
+        atividades=atividades,
+        notas_entregas=notas_entregas,
+        presencas=presencas
+    )
+
+@bp.route('/aluno/materia/<int:materia_id>/resumo')
+@login_required(role='aluno')
+@condicional(versao_materia)
+def resumo_materia_aluno(materia_id):
+    aluno_id = session['user_id']
+    if not pode_acessar_materia(materia_id):
+        return jsonify(erro='Você não está inscrito nesta matéria.'), 403
+
+    resumo = _resumo_do_aluno(aluno_id, materia_id)
+    return jsonify(
+        materia_id=materia_id,
+        aulas_total=resumo.aulas_total,
+        aulas_presente=resumo.aulas_presente,
+        faltas=resumo.faltas,
+        percentual_presenca=resumo.percentual_presenca,
+        entregas_corrigidas=resumo.entregas_corrigidas,
+        entregas_pendentes=resumo.entregas_pendentes,
+        media_notas=resumo.media_notas,
+        atualizado_em=resumo.atualizado_em.isoformat()
+    )
+
+@bp.route('/atividade/<int:atividade_id>', methods=['GET', 'POST'])
+@login_required(role='aluno')
+@condicional(versao_atividade)
+def responder_atividade(atividade_id):
+    aluno_id = session['user_id']
+    atividade = db.get_or_404(Atividade, atividade_id)
+
+    if not pode_acessar_materia(atividade.materia_id):
+        flash('Você não tem permissão para acessar esta atividade.', 'warning')
+        return redirect(url_for('aluno.dashboard_aluno'))
+
+    entrega_existente = Entrega.query.filter_by(
+        aluno_id=aluno_id,
+        atividade_id=atividade.id
+    ).first()
+
+    if request.method == 'POST':
+        if entrega_existente:
+            flash('Você já entregou esta atividade.', 'info')
+            return redirect(url_for('aluno.responder_atividade', atividade_id=atividade.id))
+
+        conteudo_resposta = request.form.get('resposta')
+        if not conteudo_resposta or not conteudo_resposta.strip():
+             flash('A resposta não pode estar vazia.', 'warning')
+             return render_template(
+                'alunos/responder_atividade.html',
+                atividade=atividade,
+                entrega=None
+             )
+
+        def gravar():
+            # A comparação com as outras respostas vem antes do INSERT, fora da trava de escrita.
+            comparacao = comparar_entrega(atividade_id, conteudo_resposta)
+            nova_entrega = Entrega(
+                conteudo_id=guardar_conteudo(db.session, conteudo_resposta),
+                aluno_id=aluno_id,
+                atividade_id=atividade_id
+            )
+            db.session.add(nova_entrega)
+            db.session.flush()
+            atualizar_resumos(materia_id, [aluno_id])
+            registrar_entrega(nova_entrega, comparacao)
+
+        materia_id = atividade.materia_id
+        try:
+            executar_escrita(gravar)
+            flash('Atividade entregue com sucesso!', 'success')
+            return redirect(url_for('aluno.materia_detalhes_aluno', materia_id=materia_id))
+        except BancoOcupado:
+            flash(MENSAGEM_BANCO_OCUPADO, 'warning')
+            return render_template(
+               'alunos/responder_atividade.html',
+               atividade=atividade,
+               entrega=None
+            )
+        except Exception as e:
+            db.session.rollback()
+            flash(f'Erro ao salvar a entrega: {str(e)}', 'danger')
+            return render_template(
+               'alunos/responder_atividade.html',
+               atividade=atividade,
+               entrega=None
+            )
+
+    return render_template(
+        'alunos/responder_atividade.html',
+        atividade=atividade,
+        entrega=entrega_existente
+    )
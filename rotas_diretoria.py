@@ -0,0 +1,369 @@
+import os
+from flask import Blueprint, render_template, request, redirect, url_for, session, flash, jsonify, send_from_directory
+from models import db, Usuario, Materia, Turma, Tarefa, turma_alunos
+from models import materias_com_professor, turmas_com_contagem
+from models import pagina_keyset, buscar_usuarios
+from exportacao import consulta_exportacao, resposta_csv
+from estatisticas import obter_estatisticas
+from importacao import importar, COLUNAS as COLUNAS_IMPORTACAO
+from autorizacao import login_required
+from fragmentos import cache_fragmentos
+from sessoes import revogar_sessoes
+from matriculas import adicionar_alunos, remover_aluno, adicionar_materia, remover_materia
+from metricas import registro_metricas
+from busca import pesquisar_usuarios
+from risco import alunos_em_risco, total_em_risco
+from tarefas import enfileirar, listar_tarefas, como_dict, pasta_arquivos, TIPOS as TIPOS_TAREFA, MANUTENCAO, ATIVAS
+from datetime import datetime
+
+bp = Blueprint('diretoria', __name__)
+
+@bp.route('/dashboard/diretor')
+@login_required(role='diretor')
+def dashboard_diretor():
+
+    return render_template('Diretoria/dashboard_diretor.html', fragmentos=cache_fragmentos().contadores(),
+                           em_risco=alunos_em_risco(limite=20), total_em_risco=total_em_risco(),
+                           **obter_estatisticas())
+
+@bp.route('/diretor/metrics')
+@login_required(role='diretor')
+def metricas():
+    registro = registro_metricas()
+    if request.args.get('formato') == 'prometheus':
+        return registro.prometheus(), 200, {'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'}
+    if request.args.get('formato') == 'json':
+        return jsonify(desde=registro.desde, endpoints=registro.resumo())
+    return render_template('Diretoria/metricas.html', endpoints=registro.resumo(),
+                           desde=datetime.fromtimestamp(registro.desde))
+
+@bp.route('/diretor/busca')
+@login_required(role='diretor')
+def buscar():
+    termo = request.args.get('q', '').strip()
+    role = request.args.get('perfil') or None
+    if role not in (None, 'aluno', 'professor', 'diretor'):
+        return "Erro: Perfil inválido.", 400
+    pagina = max(1, request.args.get('pagina', 1, type=int))
+    usuarios, proxima = pesquisar_usuarios(termo, role, pagina) if termo else ([], None)
+
+    if request.args.get('formato') == 'json':
+        return jsonify(itens=[{**u, 'trecho': str(u['trecho'])} for u in usuarios], proxima=proxima)
+    return render_template('Diretoria/busca.html', termo=termo, perfil=role, usuarios=usuarios,
+                           pagina=pagina, proxima=proxima)
+
+@bp.route('/diretor/usuario/<int:usuario_id>/encerrar_sessoes', methods=['POST'])
+@login_required(role='diretor')
+def encerrar_sessoes_usuario(usuario_id):
+    usuario = db.get_or_404(Usuario, usuario_id)
+    revogar_sessoes(usuario.id)
+
+    if usuario.role == 'aluno':
+        return redirect(url_for('diretoria.gerenciar_alunos'))
+    return redirect(url_for('diretoria.gerenciar_professores'))
+
+@bp.route('/diretor/professores')
+@login_required(role='diretor')
+def gerenciar_professores():
+    termo = request.args.get('q', '')
+    professores, proximo = pagina_keyset(buscar_usuarios('professor', termo), Usuario.id, request.args.get('apos', type=int))
+
+    if request.args.get('formato') == 'json':
+        return jsonify(
+            itens=[{'id': p.id, 'nome': p.nome, 'email': p.email} for p in professores],
+            proximo=proximo
+        )
+    return render_template('Diretoria/gerenciar_professores.html', professores=professores, termo=termo, proximo=proximo)
+
+@bp.route('/diretor/cadastrar_professor', methods=['GET', 'POST'])
+@login_required(role='diretor')
+def cadastrar_professor():
+    if request.method == 'POST':
+        nome = request.form.get('nome')
+        email = request.form.get('email')
+        senha = request.form.get('senha')
+
+        if Usuario.query.filter_by(email=email).first():
+            return "Erro: Este e-mail já está cadastrado.", 400
+
+        novo_professor = Usuario(
+            nome=nome,
+            email=email,
+            role='professor'
+        )
+        novo_professor.set_senha(senha)
+
+        db.session.add(novo_professor)
+        db.session.commit()
+
+        return redirect(url_for('diretoria.gerenciar_professores'))
+
+    return render_template('Diretoria/Cadastro_Professores.html')
+
+@bp.route('/diretor/turmas')
+@login_required(role='diretor')
+def gerenciar_turmas():
+    termo = request.args.get('q', '')
+    turmas, proximo = pagina_keyset(
+        turmas_com_contagem(termo), Turma.id, request.args.get('apos', type=int),
+        chave=lambda linha: linha[0].id
+    )
+
+    if request.args.get('formato') == 'json':
+        return jsonify(
+            itens=[{'id': t.id, 'nome': t.nome, 'num_alunos': num_alunos} for t, num_alunos in turmas],
+            proximo=proximo
+        )
+    return render_template('Diretoria/gerenciar_turmas.html', turmas=turmas, termo=termo, proximo=proximo)
+
+@bp.route('/diretor/turma/<int:turma_id>/exportar/<tipo>')
+@login_required(role='diretor')
+def exportar_turma(turma_id, tipo):
+    turma = db.get_or_404(Turma, turma_id)
+
+    try:
+        cabecalho, consulta, formatar = consulta_exportacao(tipo, turma_id=turma.id)
+    except KeyError:
+        return "Tipo de exportação inválido.", 404
+    return resposta_csv(f'{tipo}_turma_{turma.id}.csv', cabecalho, consulta, formatar)
+
+@bp.route('/diretor/turma/<int:turma_id>')
+@login_required(role='diretor')
+def detalhes_turma(turma_id):
+    turma = db.get_or_404(Turma, turma_id)
+    materias = (Materia.query.options(db.joinedload(Materia.professor))
+                .filter(Materia.turmas.any(Turma.id == turma.id)).order_by(Materia.nome).all())
+    # Só a primeira página das matérias que faltam; a busca do formulário traz as demais.
+    disponiveis, _ = pagina_keyset(materias_com_professor(fora_da_turma=turma.id), Materia.id)
+    alunos, proximo = pagina_keyset(
+        Usuario.query.join(turma_alunos, turma_alunos.c.aluno_id == Usuario.id)
+        .filter(turma_alunos.c.turma_id == turma.id),
+        Usuario.id, request.args.get('apos', type=int)
+    )
+    return render_template(
+        'Diretoria/detalhes_turma.html',
+        turma=turma,
+        materias=materias,
+        disponiveis=disponiveis,
+        alunos=alunos,
+        proximo=proximo
+    )
+
+@bp.route('/diretor/turma/<int:turma_id>/materias', methods=['POST'])
+@login_required(role='diretor')
+def adicionar_materia_turma(turma_id):
+    turma = db.get_or_404(Turma, turma_id)
+    materia = db.get_or_404(Materia, request.form.get('materia_id', type=int))
+
+    incluidas, removidas = adicionar_materia(turma.id, materia.id)
+    db.session.commit()
+    flash(f"Matéria '{materia.nome}' vinculada à turma: {incluidas} inscrição(ões) criada(s).", 'success')
+    return redirect(url_for('diretoria.detalhes_turma', turma_id=turma.id))
+
+@bp.route('/diretor/turma/<int:turma_id>/materias/<int:materia_id>/remover', methods=['POST'])
+@login_required(role='diretor')
+def remover_materia_turma(turma_id, materia_id):
+    turma = db.get_or_404(Turma, turma_id)
+
+    incluidas, removidas = remover_materia(turma.id, materia_id)
+    db.session.commit()
+    flash(f"Matéria desvinculada da turma: {removidas} inscrição(ões) removida(s).", 'success')
+    return redirect(url_for('diretoria.detalhes_turma', turma_id=turma.id))
+
+@bp.route('/diretor/turma/<int:turma_id>/alunos', methods=['POST'])
+@login_required(role='diretor')
+def adicionar_alunos_turma(turma_id):
+    turma = db.get_or_404(Turma, turma_id)
+    ras = set(request.form.get('ras', '').replace(',', ' ').split())
+    encontrados = dict(db.session.execute(
+        db.select(Usuario.ra, Usuario.id).where(Usuario.role == 'aluno', Usuario.ra.in_(ras))
+    ).all())
+
+    incluidas, removidas = adicionar_alunos(turma.id, encontrados.values())
+    db.session.commit()
+    flash(f"{len(encontrados)} aluno(s) adicionado(s) à turma: {incluidas} inscrição(ões) criada(s).", 'success')
+    nao_encontrados = sorted(ras - encontrados.keys())
+    if nao_encontrados:
+        flash(f"RA(s) não encontrado(s): {', '.join(nao_encontrados)}.", 'danger')
+    return redirect(url_for('diretoria.detalhes_turma', turma_id=turma.id))
+
+@bp.route('/diretor/turma/<int:turma_id>/alunos/<int:aluno_id>/remover', methods=['POST'])
+@login_required(role='diretor')
+def remover_aluno_turma(turma_id, aluno_id):
+    turma = db.get_or_404(Turma, turma_id)
+
+    incluidas, removidas = remover_aluno(turma.id, aluno_id)
+    db.session.commit()
+    flash(f"Aluno removido da turma: {removidas} inscrição(ões) removida(s).", 'success')
+    return redirect(url_for('diretoria.detalhes_turma', turma_id=turma.id))
+
+@bp.route('/diretor/cadastrar_turma', methods=['GET', 'POST'])
+@login_required(role='diretor')
+def cadastrar_turma():
+    if request.method == 'POST':
+        nome = request.form.get('nome')
+
+        if Turma.query.filter_by(nome=nome).first():
+
+            return "Erro: Já existe uma turma com este nome.", 400
+
+        nova_turma = Turma(nome=nome)
+        db.session.add(nova_turma)
+        db.session.commit()
+
+        return redirect(url_for('diretoria.gerenciar_turmas'))
+
+    return render_template('Diretoria/Cadastro_Turmas.html')
+
+@bp.route('/diretor/alunos')
+@login_required(role='diretor')
+def gerenciar_alunos():
+    termo = request.args.get('q', '')
+    alunos, proximo = pagina_keyset(buscar_usuarios('aluno', termo), Usuario.id, request.args.get('apos', type=int))
+
+    if request.args.get('formato') == 'json':
+        return jsonify(
+            itens=[{'id': a.id, 'nome': a.nome, 'email': a.email, 'ra': a.ra} for a in alunos],
+            proximo=proximo
+        )
+    return render_template('Diretoria/gerenciar_alunos.html', alunos=alunos, termo=termo, proximo=proximo)
+
+@bp.route('/diretor/cadastrar_aluno', methods=['GET', 'POST'])
+@login_required(role='diretor')
+def cadastrar_aluno():
+    if request.method == 'POST':
+        nome = request.form.get('nome')
+        email = request.form.get('email')
+        ra = request.form.get('ra')
+        senha = request.form.get('senha')
+
+        if Usuario.query.filter_by(email=email).first() or Usuario.query.filter_by(ra=ra).first():
+            return "Erro: Email ou RA já cadastrado.", 400
+
+        novo_aluno = Usuario(
+            nome=nome,
+            email=email,
+            ra=ra,
+            role='aluno'
+        )
+        novo_aluno.set_senha(senha)
+        db.session.add(novo_aluno)
+        db.session.commit()
+
+        return redirect(url_for('diretoria.gerenciar_alunos'))
+
+    return render_template('Diretoria/Cadastro_Alunos.html')
+
+@bp.route('/diretor/importar', methods=['GET', 'POST'])
+@login_required(role='diretor')
+def importar_csv():
+    relatorio = None
+    if request.method == 'POST':
+        arquivo = request.files.get('arquivo')
+        if not arquivo or not arquivo.filename:
+            return "Erro: Nenhum arquivo enviado.", 400
+        if request.form.get('segundo_plano') or request.args.get('segundo_plano'):
+            tipo = request.form.get('tipo')
+            if tipo not in COLUNAS_IMPORTACAO:
+                return "Erro: Tipo de importação inválido.", 400
+            tarefa_id = enfileirar('importar_csv', {'tipo': tipo, 'nome_arquivo': arquivo.filename},
+                                   arquivo.read(), session.get('user_id'))
+            if request.args.get('formato') == 'json':
+                return jsonify(tarefa=tarefa_id,
+                               status=url_for('diretoria.status_tarefa', tarefa_id=tarefa_id)), 202
+            flash(f"Importação adicionada à fila (tarefa #{tarefa_id}).", 'success')
+            return redirect(url_for('diretoria.tarefas'))
+        try:
+            relatorio = importar(request.form.get('tipo'), arquivo.stream)
+        except ValueError as erro:
+            return f"Erro: {erro}", 400
+
+        if request.args.get('formato') == 'json':
+            return jsonify(relatorio.como_dict())
+    return render_template('Diretoria/importar.html', relatorio=relatorio, colunas=COLUNAS_IMPORTACAO)
+
+@bp.route('/diretor/tarefas')
+@login_required(role='diretor')
+def tarefas():
+    itens, proximo = listar_tarefas(request.args.get('antes', type=int))
+
+    if request.args.get('formato') == 'json':
+        return jsonify(itens=[como_dict(t) for t in itens], proximo=proximo)
+    return render_template('Diretoria/tarefas.html', tarefas=itens, proximo=proximo, tipos=TIPOS_TAREFA,
+                           manutencao=MANUTENCAO, ativas=any(t.estado in ATIVAS for t in itens))
+
+@bp.route('/diretor/tarefas/nova', methods=['POST'])
+@login_required(role='diretor')
+def enfileirar_tarefa():
+    tipo = request.form.get('tipo')
+    parametros = {}
+    if tipo == 'exportar':
+        parametros = {'tipo': request.form.get('exportacao'), 'turma_id': request.form.get('turma_id', type=int)}
+        if parametros['tipo'] not in ('notas', 'presencas'):
+            return "Erro: Tipo de exportação inválido.", 400
+        if parametros['turma_id'] is None or db.session.get(Turma, parametros['turma_id']) is None:
+            return "Erro: Turma não encontrada.", 404
+    elif tipo not in MANUTENCAO:
+        return "Erro: Tipo de tarefa inválido.", 400
+
+    tarefa_id = enfileirar(tipo, parametros, usuario_id=session.get('user_id'))
+    flash(f"{TIPOS_TAREFA[tipo].rotulo}: adicionada à fila (tarefa #{tarefa_id}).", 'success')
+    return redirect(url_for('diretoria.tarefas'))
+
+@bp.route('/diretor/tarefas/<int:tarefa_id>')
+@login_required(role='diretor')
+def status_tarefa(tarefa_id):
+    tarefa = db.get_or_404(Tarefa, tarefa_id, options=[db.defer(Tarefa.arquivo)])
+    return jsonify(como_dict(tarefa))
+
+@bp.route('/diretor/tarefas/<int:tarefa_id>/arquivo')
+@login_required(role='diretor')
+def baixar_arquivo_tarefa(tarefa_id):
+    tarefa = db.get_or_404(Tarefa, tarefa_id, options=[db.defer(Tarefa.arquivo)])
+    resultado = tarefa.dados_resultado or {}
+    if tarefa.estado != 'concluida' or tarefa.saida is None or 'arquivo' not in resultado:
+        return "Erro: A tarefa não gerou arquivo.", 404
+    pasta = pasta_arquivos()
+    if not os.path.isfile(os.path.join(pasta, tarefa.saida)):
+        return "Erro: O arquivo da tarefa não existe mais.", 404
+    return send_from_directory(pasta, tarefa.saida, mimetype='text/csv; charset=utf-8',
+                               as_attachment=True, download_name=resultado['arquivo'])
+
+@bp.route('/diretor/materias')
+@login_required(role='diretor')
+def gerenciar_materias():
+    termo = request.args.get('q', '')
+    materias, proximo = pagina_keyset(
+        materias_com_professor(termo, fora_da_turma=request.args.get('fora_da_turma', type=int)),
+        Materia.id, request.args.get('apos', type=int)
+    )
+
+    if request.args.get('formato') == 'json':
+        return jsonify(
+            itens=[{'id': m.id, 'nome': m.nome, 'professor': m.professor.nome} for m in materias],
+            proximo=proximo
+        )
+    # Primeira página dos professores; a busca do formulário usa gerenciar_professores.
+    professores, _ = pagina_keyset(buscar_usuarios('professor'), Usuario.id)
+    return render_template(
+        'Diretoria/gerenciar_materias.html',
+        materias=materias,
+        professores=professores,
+        termo=termo,
+        proximo=proximo
+    )
+
+@bp.route('/diretor/cadastrar_materia', methods=['POST'])
+@login_required(role='diretor')
+def cadastrar_materia():
+    nome = request.form.get('nome')
+    professor_id = request.form.get('professor_id')
+
+    if Materia.query.filter_by(nome=nome).first():
+        return "Erro: Já existe uma matéria com este nome.", 400
+
+    nova_materia = Materia(nome=nome, professor_id=professor_id)
+    db.session.add(nova_materia)
+    db.session.commit()
+
+    return redirect(url_for('diretoria.gerenciar_materias'))
@@ -0,0 +1,304 @@
+from flask import Blueprint, render_template, request, redirect, url_for, session, flash, jsonify
+from models import db, Usuario, Materia, Inscricao, Atividade, Entrega
+from models import alunos_da_materia, entregas_da_atividade
+from presencas import registrar_presencas, intervalo_de_datas
+from conteudos import textos_das_entregas, RESPOSTAS_POR_PAGINA
+from notas import lancar_notas as gravar_notas, MAX_NOTAS_POR_LANCAMENTO
+from resumos import atualizar_resumos
+from exportacao import consulta_exportacao, resposta_csv
+from autorizacao import pode_acessar_materia, materias_permitidas, login_required
+from busca import pesquisar_atividades, pesquisar_entregas
+from similaridade import analisar_atividade, grupos_da_atividade
+from risco import alunos_em_risco
+from fragmentos import adiado
+from validacao import condicional, versao_materia, versao_atividade
+from banco import executar_escrita, BancoOcupado, MENSAGEM_BANCO_OCUPADO
+from datetime import datetime, date
+
+bp = Blueprint('professor', __name__)
+
+@bp.route('/professor/materia/<int:materia_id>')
+@login_required(role='professor', materia='materia_id')
+@condicional(lambda materia_id: (versao_materia(materia_id), date.today()))
+def materia_detalhes_professor(materia_id):
+    materia = db.get_or_404(Materia, materia_id)
+
+    alunos = adiado(alunos_da_materia, materia.id)
+    atividades = adiado(
+        lambda: Atividade.query.filter_by(materia_id=materia.id).order_by(Atividade.data_entrega.desc()).all()
+    )
+
+    today_date_str = date.today().strftime('%Y-%m-%d')
+
+    return render_template(
+        'professores/materia_detalhes_professor.html', 
+        materia=materia,
+        alunos=alunos,
+        atividades=atividades,
+        today_date=today_date_str
+    )
+
+@bp.route('/professor/materia/<int:materia_id>/registrar_presenca', methods=['POST'])
+@login_required(role='professor')
+def registrar_presenca(materia_id):
+    if not pode_acessar_materia(materia_id):
+        flash('Erro: Você não tem permissão para registrar presença nesta matéria.', 'danger')
+        return redirect(url_for('professor.dashboard_professor'))
+
+    data_str = request.form.get('data_presenca')
+    if not data_str:
+        flash('Erro: Data não selecionada.', 'danger')
+        return redirect(url_for('professor.materia_detalhes_professor', materia_id=materia_id))
+
+    try:
+        data_obj = datetime.strptime(data_str, '%Y-%m-%d').date()
+        data_fim_str = request.form.get('data_fim')
+        data_fim = datetime.strptime(data_fim_str, '%Y-%m-%d').date() if data_fim_str else data_obj
+    except ValueError:
+        flash('Erro: Formato de data inválido.', 'danger')
+        return redirect(url_for('professor.materia_detalhes_professor', materia_id=materia_id))
+
+    try:
+        datas = intervalo_de_datas(data_obj, data_fim)
+    except ValueError as e:
+        flash(f'Erro: {e}', 'danger')
+        return redirect(url_for('professor.materia_detalhes_professor', materia_id=materia_id))
+
+    alunos_ids = db.session.scalars(
+        db.select(Inscricao.aluno_id).filter_by(materia_id=materia_id)
+    ).all()
+
+    # Um status por aluno vale para todas as datas; presenca_<id>_<data> sobrescreve um dia específico.
+    presencas = {}
+    for aluno_id in alunos_ids:
+        status_padrao = request.form.get(f'presenca_{aluno_id}')
+        for data in datas:
+            status_presenca = request.form.get(f'presenca_{aluno_id}_{data.isoformat()}', status_padrao)
+            presencas[(aluno_id, data)] = (status_presenca == 'presente')
+
+    def gravar():
+        registrar_presencas(materia_id, presencas)
+        atualizar_resumos(materia_id)
+
+    try:
+        executar_escrita(gravar)
+        if len(datas) > 1:
+            flash(f'Presença de {datas[0].strftime("%d/%m/%Y")} a {datas[-1].strftime("%d/%m/%Y")} registrada com sucesso!', 'success')
+        else:
+            flash(f'Presença para {data_obj.strftime("%d/%m/%Y")} registrada com sucesso!', 'success')
+
+    except BancoOcupado:
+        flash(f'Erro: {MENSAGEM_BANCO_OCUPADO}', 'warning')
+    except Exception as e:
+        db.session.rollback()
+        flash(f'Erro ao registrar presença: {e}', 'danger')
+
+    return redirect(url_for('professor.materia_detalhes_professor', materia_id=materia_id))
+
+@bp.route('/dashboard/professor')
+@login_required(role='professor')
+def dashboard_professor():
+
+    professor = db.session.get(Usuario, session['user_id'])
+
+    materias = adiado(lambda: Materia.query.filter_by(professor_id=professor.id).all())
+
+    return render_template('professores/dashboard_professor.html', professor=professor, materias=materias,
+                           em_risco=alunos_em_risco(professor.id))
+
+@bp.route('/professor/materia/<int:materia_id>/criar_atividade', methods=['GET', 'POST'])
+@login_required(role='professor', materia='materia_id')
+def criar_atividade(materia_id):
+    materia = db.get_or_404(Materia, materia_id)
+
+    if request.method == 'POST':
+        titulo = request.form.get('titulo')
+        descricao = request.form.get('descricao')
+        data_entrega_str = request.form.get('data_entrega')
+
+
+        data_entrega = datetime.strptime(data_entrega_str, '%Y-%m-%d')
+
+        nova_atividade = Atividade(
+            titulo=titulo,
+            descricao=descricao,
+            data_entrega=data_entrega,
+            materia_id=materia.id
+        )
+        db.session.add(nova_atividade)
+        db.session.commit()
+
+        return redirect(url_for('professor.materia_detalhes_professor', materia_id=materia.id))
+
+    return render_template('professores/criar_atividade.html', materia=materia)
+
+@bp.route('/professor/busca')
+@login_required(role='professor')
+def buscar():
+    termo = request.args.get('q', '').strip()
+    onde = request.args.get('em', 'entregas')
+    pagina = max(1, request.args.get('pagina', 1, type=int))
+    # Mesma regra das rotas: só atividades e entregas das matérias que o professor leciona.
+    pesquisar = pesquisar_atividades if onde == 'atividades' else pesquisar_entregas
+    itens, proxima = pesquisar(termo, materias_permitidas(), pagina) if termo else ([], None)
+
+    if request.args.get('formato') == 'json':
+        return jsonify(itens=[{**item, 'trecho': str(item['trecho'])} for item in itens], proxima=proxima)
+    return render_template('professores/busca.html', termo=termo, onde=onde, itens=itens,
+                           pagina=pagina, proxima=proxima)
+
+@bp.route('/professor/atividade/<int:atividade_id>/entregas')
+@login_required(role='professor')
+@condicional(versao_atividade)
+def ver_entregas(atividade_id):
+
+    atividade = db.get_or_404(Atividade, atividade_id, options=[db.joinedload(Atividade.materia)])
+    if not pode_acessar_materia(atividade.materia_id):
+         flash('Você não tem permissão para acessar as entregas desta atividade.', 'danger')
+         return redirect(url_for('professor.dashboard_professor'))
+
+
+    entregas = entregas_da_atividade(atividade.id)
+    # Só as respostas da primeira página vêm com ela; as outras são buscadas em
+    # respostas_entregas quando aparecem na tela.
+    respostas = textos_das_entregas(atividade.id, [entrega.id for entrega in entregas[:RESPOSTAS_POR_PAGINA]])
+    parecidas = grupos_da_atividade(atividade.id)
+    # Grupos na ordem da primeira entrega; cada um com as entregas da mais parecida para a menos.
+    grupos = {}
+    for entrega in entregas:
+        if entrega.id in parecidas:
+            grupos.setdefault(parecidas[entrega.id][0], []).append(entrega)
+    for membros in grupos.values():
+        membros.sort(key=lambda entrega: -parecidas[entrega.id][1])
+
+    return render_template('professores/ver_entregas.html', atividade=atividade, entregas=entregas,
+                           respostas=respostas, respostas_por_pagina=RESPOSTAS_POR_PAGINA,
+                           parecidas=parecidas, grupos=list(grupos.values()))
+
+@bp.route('/professor/atividade/<int:atividade_id>/respostas')
+@login_required(role='professor')
+@condicional(versao_atividade)
+def respostas_entregas(atividade_id):
+    """Respostas das entregas `?ids=1,2,3` da atividade, {"respostas": {"<entrega_id>": texto}},
+    no máximo RESPOSTAS_POR_PAGINA por requisição."""
+    atividade = db.get_or_404(Atividade, atividade_id)
+    if not pode_acessar_materia(atividade.materia_id):
+        return jsonify(erro='Você não tem permissão para acessar as entregas desta atividade.'), 403
+    try:
+        ids = [int(valor) for valor in request.args.get('ids', '').split(',') if valor.strip()]
+    except ValueError:
+        return jsonify(erro='Identificador de entrega inválido.'), 400
+    if len(ids) > RESPOSTAS_POR_PAGINA:
+        return jsonify(erro=f'No máximo {RESPOSTAS_POR_PAGINA} respostas por requisição.'), 400
+    textos = textos_das_entregas(atividade.id, ids)
+    return jsonify(respostas={str(entrega_id): texto for entrega_id, texto in textos.items()})
+
+@bp.route('/professor/atividade/<int:atividade_id>/similaridade', methods=['POST'])
+@login_required(role='professor')
+def reanalisar_similaridade(atividade_id):
+    atividade = db.get_or_404(Atividade, atividade_id)
+    if not pode_acessar_materia(atividade.materia_id):
+        flash('Você não tem permissão para analisar as entregas desta atividade.', 'danger')
+        return redirect(url_for('professor.dashboard_professor'))
+    try:
+        resumo = executar_escrita(lambda: analisar_atividade(atividade.id))
+    except BancoOcupado:
+        flash(MENSAGEM_BANCO_OCUPADO, 'warning')
+        return redirect(url_for('professor.ver_entregas', atividade_id=atividade.id))
+    flash(f"{resumo['entregas']} entregas analisadas em {resumo['segundos']:.1f}s: "
+          f"{resumo['parecidas']} em {resumo['grupos']} grupo(s) de respostas parecidas.", 'info')
+    return redirect(url_for('professor.ver_entregas', atividade_id=atividade.id))
+
+@bp.route('/professor/atividade/<int:atividade_id>/notas', methods=['POST'])
+@login_required(role='professor')
+def lancar_notas(atividade_id):
+    """Lançamento de várias notas de uma vez: o formulário de ver_entregas envia um campo
+    `nota-<entrega_id>` por entrega; a variante JSON recebe {"notas": {"<entrega_id>": nota}}
+    (null remove a nota) e responde com as alteradas e os erros por entrega."""
+    atividade = db.get_or_404(Atividade, atividade_id)
+    como_json = request.is_json
+    if not pode_acessar_materia(atividade.materia_id):
+        if como_json:
+            return jsonify(erro='Você não tem permissão para atribuir notas nesta atividade.'), 403
+        flash('Você não tem permissão para atribuir notas nesta atividade.', 'danger')
+        return redirect(url_for('professor.dashboard_professor'))
+
+    if como_json:
+        notas = (request.get_json(silent=True) or {}).get('notas')
+        if not isinstance(notas, dict):
+            return jsonify(erro='Envie {"notas": {"<entrega_id>": nota}}.'), 400
+    else:
+        notas = {chave[len('nota-'):]: valor for chave, valor in request.form.items() if chave.startswith('nota-')}
+    if len(notas) > MAX_NOTAS_POR_LANCAMENTO:
+        mensagem = f'No máximo {MAX_NOTAS_POR_LANCAMENTO} notas por envio.'
+        if como_json:
+            return jsonify(erro=mensagem), 400
+        flash(mensagem, 'danger')
+        return redirect(url_for('professor.ver_entregas', atividade_id=atividade.id))
+
+    if como_json:
+        # Com o banco travado, BancoOcupado vira 503 no tratador da aplicação.
+        alteradas, erros = executar_escrita(lambda: gravar_notas(atividade, notas))
+        return jsonify(alteradas=alteradas, erros=erros)
+
+    try:
+        alteradas, erros = executar_escrita(lambda: gravar_notas(atividade, notas))
+    except BancoOcupado:
+        flash(MENSAGEM_BANCO_OCUPADO, 'warning')
+        return redirect(url_for('professor.ver_entregas', atividade_id=atividade.id))
+    flash(f'{alteradas} nota(s) salva(s).' if alteradas else 'Nenhuma nota alterada.',
+          'success' if alteradas else 'info')
+    for erro in erros[:20]:
+        flash(f"Entrega {erro['entrega_id']}: {erro['erro']}", 'warning')
+    if len(erros) > 20:
+        flash(f'... e mais {len(erros) - 20} entrega(s) com erro.', 'warning')
+    return redirect(url_for('professor.ver_entregas', atividade_id=atividade.id))
+
+@bp.route('/professor/materia/<int:materia_id>/exportar/<tipo>')
+@login_required(role='professor', materia='materia_id')
+def exportar_materia(materia_id, tipo):
+    try:
+        cabecalho, consulta, formatar = consulta_exportacao(tipo, materia_id=materia_id)
+    except KeyError:
+        return "Tipo de exportação inválido.", 404
+    return resposta_csv(f'{tipo}_materia_{materia_id}.csv', cabecalho, consulta, formatar)
+
+@bp.route('/professor/entrega/<int:entrega_id>/atribuir_nota', methods=['POST'])
+@login_required(role='professor')
+def atribuir_nota(entrega_id):
+    entrega = db.get_or_404(Entrega, entrega_id, options=[db.joinedload(Entrega.atividade)])
+    atividade = entrega.atividade
+
+    if not pode_acessar_materia(atividade.materia_id):
+        flash('Você não tem permissão para atribuir nota nesta entrega.', 'danger')
+        return redirect(url_for('professor.dashboard_professor'))
+
+    materia_id, aluno_id = atividade.materia_id, entrega.aluno_id
+
+    def gravar(nota):
+        entrega.nota = nota
+        db.session.flush()
+        atualizar_resumos(materia_id, [aluno_id])
+
+    try:
+        nota_str = request.form.get('nota')
+        if nota_str:
+             nota = float(nota_str)
+             if 0 <= nota <= 10:
+                 executar_escrita(lambda: gravar(nota))
+                 flash(f'Nota {nota} atribuída para {entrega.aluno.nome}.', 'success')
+             else:
+                 flash('Nota inválida. Deve ser entre 0 e 10.', 'warning')
+        else:
+             executar_escrita(lambda: gravar(None))
+             flash(f'Nota removida para {entrega.aluno.nome}.', 'info')
+
+    except ValueError:
+        flash('Valor da nota inválido.', 'danger')
+    except BancoOcupado:
+        flash(MENSAGEM_BANCO_OCUPADO, 'warning')
+    except Exception as e:
+        db.session.rollback()
+        flash(f'Erro ao salvar nota: {str(e)}', 'danger')
+
+    return redirect(url_for('professor.ver_entregas', atividade_id=atividade.id))
@@ -0,0 +1,65 @@
+from flask import Blueprint, render_template, request, redirect, url_for, session
+from models import Usuario
+from autenticacao import verificar_senha, registrar_evento, LoginSobrecarregado
+from autorizacao import carregar_acesso
+from sessoes import regenerar_id
+
+bp = Blueprint('publico', __name__)
+
+@bp.route('/')
+def index():
+    return render_template('index.html')
+
+@bp.route('/login/aluno')
+def login_aluno_page():
+    return render_template('alunos/Alunos.html')
+
+@bp.route('/login/professor')
+def login_professor_page():
+    return render_template('professores/professor.html')
+
+@bp.route('/login', methods=['POST'])
+def login():
+    if 'ra' in request.form and request.form.get('ra'):
+        metodo_login = 'ra'
+        usuario = Usuario.query.filter_by(ra=request.form.get('ra'), role='aluno').first()
+
+    elif 'email' in request.form and request.form.get('email'):
+        metodo_login = 'email'
+        usuario = Usuario.query.filter_by(email=request.form.get('email')).first()
+
+        if usuario and usuario.role not in ['professor', 'diretor']:
+            usuario = None
+    else:
+        metodo_login = 'nenhum'
+        usuario = None
+
+    try:
+        autenticado = usuario is not None and verificar_senha(usuario, request.form.get('password'))
+    except LoginSobrecarregado as erro:
+        registrar_evento('login', forcar=True, resultado='recusado', motivo=erro.motivo, metodo=metodo_login)
+        return 'Muitos acessos no momento. Tente novamente em alguns segundos.', 503, {'Retry-After': '2'}
+
+    if autenticado:
+        registrar_evento('login', resultado='sucesso', metodo=metodo_login, perfil=usuario.role, usuario_id=usuario.id)
+        regenerar_id(session)
+        session['authenticated'] = True
+        session['user_id'] = usuario.id
+        session['username'] = usuario.nome
+        session['role'] = usuario.role
+        carregar_acesso(usuario.id, usuario.role)
+
+        if usuario.role == 'aluno':
+            return redirect(url_for('aluno.dashboard_aluno'))
+        elif usuario.role == 'professor':
+            return redirect(url_for('professor.dashboard_professor'))
+        elif usuario.role == 'diretor':
+            return redirect(url_for('diretoria.dashboard_diretor'))
+
+    registrar_evento('login', resultado='falha', metodo=metodo_login, usuario_encontrado=usuario is not None)
+    return '<h1>Usuário ou senha inválidos.</h1><a href="/">Voltar</a>'
+
+@bp.route('/logout')
+def logout():
+    session.clear()
+    return redirect(url_for('publico.index'))
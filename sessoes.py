@@ -0,0 +1,235 @@
+import copy
+import os
+import random
+import secrets
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from flask import current_app
+from flask.json.tag import TaggedJSONSerializer
+from flask.sessions import SessionInterface, SessionMixin
+from werkzeug.datastructures import CallbackDict
+
+# Sessões guardadas no servidor: o cookie leva só um id aleatório e opaco, e os dados
+# ficam num armazém plugável (memória do processo ou um arquivo SQLite compartilhado
+# entre workers). Só sessões alteradas são gravadas; as demais têm a validade renovada
+# de tempos em tempos (expiração deslizante), e todas as sessões de um usuário podem
+# ser encerradas de uma vez.
+
+
+class SessaoServidor(CallbackDict, SessionMixin):
+
+    def __init__(self, dados=None, sid=None, nova=False, expira=0.0):
+        def ao_alterar(sessao):
+            sessao.modified = True
+        CallbackDict.__init__(self, dados, ao_alterar)
+        self.sid = sid
+        self.new = nova
+        self.expira = expira
+        self.sid_anterior = None
+        self.modified = False
+
+    def regenerar(self):
+        # Novo id após o login, para que um id conhecido antes da autenticação não sirva depois.
+        if not self.new:
+            self.sid_anterior = self.sid
+        self.sid = secrets.token_urlsafe(32)
+        self.new = True
+        self.modified = True
+
+
+class ArmazemMemoria:
+    """Sessões num dicionário LRU do próprio processo; serve para um único worker."""
+
+    def __init__(self, capacidade):
+        self.capacidade = capacidade
+        self.sessoes = OrderedDict()
+        self.por_usuario = {}
+        self.trava = threading.Lock()
+
+    def carregar(self, sid, agora):
+        with self.trava:
+            registro = self.sessoes.get(sid)
+            if registro is None:
+                return None
+            dados, expira, usuario_id = registro
+            if expira < agora:
+                self._remover(sid)
+                return None
+            self.sessoes.move_to_end(sid)
+        return copy.deepcopy(dados), expira
+
+    def salvar(self, sid, dados, expira, usuario_id):
+        with self.trava:
+            if sid in self.sessoes:
+                self._remover(sid)
+            self.sessoes[sid] = (copy.deepcopy(dados), expira, usuario_id)
+            if usuario_id is not None:
+                self.por_usuario.setdefault(usuario_id, set()).add(sid)
+            while len(self.sessoes) > self.capacidade:
+                self._remover(next(iter(self.sessoes)))
+
+    def renovar(self, sid, expira):
+        with self.trava:
+            registro = self.sessoes.get(sid)
+            if registro is not None:
+                self.sessoes[sid] = (registro[0], expira, registro[2])
+
+    def excluir(self, sid):
+        with self.trava:
+            self._remover(sid)
+
+    def revogar_usuario(self, usuario_id):
+        with self.trava:
+            sids = list(self.por_usuario.get(usuario_id, ()))
+            for sid in sids:
+                self._remover(sid)
+        return len(sids)
+
+    def _remover(self, sid):
+        registro = self.sessoes.pop(sid, None)
+        if registro is not None and registro[2] is not None:
+            sids = self.por_usuario.get(registro[2])
+            if sids is not None:
+                sids.discard(sid)
+                if not sids:
+                    del self.por_usuario[registro[2]]
+
+
+class ArmazemSQLite:
+    """Sessões num arquivo SQLite próprio (fora do banco acadêmico), compartilhado
+    por todos os workers da máquina. Cada thread usa a sua conexão."""
+
+    # Fração das gravações que também apaga sessões expiradas.
+    TAXA_LIMPEZA = 0.01
+
+    def __init__(self, caminho):
+        self.caminho = caminho
+        self.local = threading.local()
+        self.serializador = TaggedJSONSerializer()
+        self._conexao().executescript(
+            "CREATE TABLE IF NOT EXISTS sessoes ("
+            " sid TEXT NOT NULL PRIMARY KEY, usuario_id INTEGER, dados TEXT NOT NULL, expira REAL NOT NULL);"
+            "CREATE INDEX IF NOT EXISTS ix_sessoes_usuario_id ON sessoes (usuario_id);"
+            "CREATE INDEX IF NOT EXISTS ix_sessoes_expira ON sessoes (expira);"
+        )
+
+    def _conexao(self):
+        # Conexões não atravessam fork: um worker nunca usa a conexão aberta pelo processo pai.
+        if getattr(self.local, 'pid', None) != os.getpid():
+            conexao = sqlite3.connect(self.caminho, timeout=5, isolation_level=None, check_same_thread=False)
+            conexao.execute("PRAGMA journal_mode=WAL")
+            conexao.execute("PRAGMA synchronous=NORMAL")
+            self.local.conexao = conexao
+            self.local.pid = os.getpid()
+        return self.local.conexao
+
+    def carregar(self, sid, agora):
+        linha = self._conexao().execute(
+            "SELECT dados, expira FROM sessoes WHERE sid = ? AND expira >= ?", (sid, agora)
+        ).fetchone()
+        if linha is None:
+            return None
+        return self.serializador.loads(linha[0]), linha[1]
+
+    def salvar(self, sid, dados, expira, usuario_id):
+        conexao = self._conexao()
+        conexao.execute(
+            "INSERT OR REPLACE INTO sessoes (sid, usuario_id, dados, expira) VALUES (?, ?, ?, ?)",
+            (sid, usuario_id, self.serializador.dumps(dados), expira)
+        )
+        if random.random() < self.TAXA_LIMPEZA:
+            conexao.execute("DELETE FROM sessoes WHERE expira < ?", (time.time(),))
+
+    def renovar(self, sid, expira):
+        self._conexao().execute("UPDATE sessoes SET expira = ? WHERE sid = ?", (expira, sid))
+
+    def excluir(self, sid):
+        self._conexao().execute("DELETE FROM sessoes WHERE sid = ?", (sid,))
+
+    def revogar_usuario(self, usuario_id):
+        return self._conexao().execute("DELETE FROM sessoes WHERE usuario_id = ?", (usuario_id,)).rowcount
+
+
+def criar_armazem(app):
+    backend = app.config.get('SESSAO_BACKEND', 'sqlite')
+    if backend == 'memoria':
+        return ArmazemMemoria(app.config.get('SESSAO_CAPACIDADE', 10_000))
+    if backend == 'sqlite':
+        caminho = app.config.get('SESSAO_ARQUIVO') or os.path.join(app.instance_path, 'sessoes.db')
+        os.makedirs(os.path.dirname(os.path.abspath(caminho)), exist_ok=True)
+        return ArmazemSQLite(caminho)
+    raise ValueError(f"SESSAO_BACKEND desconhecido: {backend}")
+
+
+_trava_armazem = threading.Lock()
+
+
+def armazem_sessoes(app=None):
+    app = app or current_app._get_current_object()
+    armazem = app.extensions.get('armazem_sessoes')
+    if armazem is None:
+        with _trava_armazem:
+            armazem = app.extensions.get('armazem_sessoes')
+            if armazem is None:
+                armazem = app.extensions['armazem_sessoes'] = criar_armazem(app)
+    return armazem
+
+
+class InterfaceSessaoServidor(SessionInterface):
+
+    def open_session(self, app, request):
+        sid = request.cookies.get(self.get_cookie_name(app))
+        if sid:
+            registro = armazem_sessoes(app).carregar(sid, time.time())
+            if registro is not None:
+                dados, expira = registro
+                return SessaoServidor(dados, sid=sid, expira=expira)
+        return SessaoServidor(sid=secrets.token_urlsafe(32), nova=True)
+
+    def save_session(self, app, session, response):
+        armazem = armazem_sessoes(app)
+        nome = self.get_cookie_name(app)
+        dominio = self.get_cookie_domain(app)
+        caminho = self.get_cookie_path(app)
+
+        if session.accessed:
+            response.vary.add('Cookie')
+        if session.sid_anterior:
+            armazem.excluir(session.sid_anterior)
+
+        if not session:
+            # Sessão esvaziada (logout): apaga no servidor e no navegador.
+            if not session.new or session.sid_anterior:
+                armazem.excluir(session.sid)
+                response.delete_cookie(nome, domain=dominio, path=caminho)
+            return
+
+        duracao = app.config.get('SESSAO_DURACAO', 7200)
+        agora = time.time()
+        if session.modified or session.new:
+            armazem.salvar(session.sid, dict(session), agora + duracao, session.get('user_id'))
+        elif session.expira - agora < duracao * 0.9:
+            # Sem alteração: só renova a validade, e no máximo uma vez a cada décimo da duração.
+            armazem.renovar(session.sid, agora + duracao)
+
+        if session.new:
+            response.set_cookie(
+                nome, session.sid,
+                httponly=self.get_cookie_httponly(app),
+                secure=self.get_cookie_secure(app),
+                samesite=self.get_cookie_samesite(app),
+                domain=dominio,
+                path=caminho
+            )
+
+
+def regenerar_id(sessao):
+    if isinstance(sessao, SessaoServidor):
+        sessao.regenerar()
+
+
+def revogar_sessoes(usuario_id):
+    """Encerra todas as sessões abertas do usuário e retorna quantas eram."""
+    return armazem_sessoes().revogar_usuario(usuario_id)
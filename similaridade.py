@@ -0,0 +1,253 @@
+import re
+import sys
+import time
+import unicodedata
+import zlib
+import numpy as np
+from sqlalchemy import bindparam, text
+from models import db, TextoComprimido
+from validacao import versionar
+
+# Respostas parecidas entre as entregas de uma atividade. Cada entrega vira o conjunto
+# dos seus trechos de 3 palavras (shingles), resumido numa assinatura MinHash de 128
+# inteiros de 32 bits (512 bytes) gravada em `assinaturas_entregas`; a fração de
+# posições iguais entre duas assinaturas estima a similaridade de Jaccard dos textos.
+# Uma entrega nova é comparada de uma vez com a matriz de assinaturas da atividade; a
+# reanálise da atividade inteira usa LSH (faixas da assinatura) para só comparar pares
+# candidatos. Entregas parecidas formam um grupo identificado pela menor entrega dele.
+
+NUM_PERMUTACOES = 128
+FAIXAS, LINHAS_POR_FAIXA = 32, 4
+TAMANHO_SHINGLE = 3
+# Respostas curtas ("Sim.", "Não sei") coincidem naturalmente e ficam de fora.
+MIN_SHINGLES = 5
+LIMIAR = 0.6
+# Shingles processados por bloco no cálculo das assinaturas (1 KB cada um).
+_SHINGLES_POR_BLOCO = 1 << 16
+# Pares candidatos conferidos por bloco (cada um compara duas linhas de 512 bytes).
+_PARES_POR_BLOCO = 1 << 15
+
+_PRIMO = (1 << 31) - 1
+# Coeficientes fixos: assinaturas só são comparáveis se calculadas com os mesmos.
+_gerador = np.random.default_rng(0x5167A)
+_A = _gerador.integers(1, _PRIMO, NUM_PERMUTACOES, dtype=np.uint64)
+_B = _gerador.integers(0, _PRIMO, NUM_PERMUTACOES, dtype=np.uint64)
+_PESOS_FAIXA = _gerador.integers(1, 1 << 63, LINHAS_POR_FAIXA, dtype=np.uint64) | np.uint64(1)
+_TIPO = np.dtype('<u4')
+_ACENTOS = re.compile(r'[\u0300-\u036f]')
+
+
+def shingles(texto):
+    palavras = re.findall(r'\w+', _ACENTOS.sub('', unicodedata.normalize('NFKD', (texto or '').lower())))
+    return {' '.join(palavras[i:i + TAMANHO_SHINGLE]) for i in range(len(palavras) - TAMANHO_SHINGLE + 1)}
+
+
+def assinaturas(textos):
+    """Retorna a matriz (len(textos), NUM_PERMUTACOES) de assinaturas e a máscara dos
+    textos com shingles suficientes (as linhas dos demais não devem ser usadas)."""
+    conjuntos = [shingles(texto) for texto in textos]
+    validos = np.array([len(conjunto) >= MIN_SHINGLES for conjunto in conjuntos], dtype=bool)
+    matriz = np.zeros((len(textos), NUM_PERMUTACOES), dtype=_TIPO)
+    indices = np.flatnonzero(validos)
+    inicio = 0
+    while inicio < len(indices):
+        # Um bloco de textos inteiros com até _SHINGLES_POR_BLOCO shingles (e pelo menos um texto).
+        fim, total = inicio + 1, len(conjuntos[indices[inicio]])
+        while fim < len(indices) and total + len(conjuntos[indices[fim]]) <= _SHINGLES_POR_BLOCO:
+            total += len(conjuntos[indices[fim]])
+            fim += 1
+        bloco = [conjuntos[i] for i in indices[inicio:fim]]
+        valores = np.fromiter((zlib.crc32(s.encode()) % _PRIMO for conjunto in bloco for s in conjunto),
+                              dtype=np.uint64, count=total)
+        # Cada permutação é x -> (a·x + b) mod p; a assinatura guarda o menor valor de cada uma.
+        permutados = (valores[:, None] * _A + _B) % _PRIMO
+        comecos = np.cumsum([0] + [len(conjunto) for conjunto in bloco[:-1]])
+        matriz[indices[inicio:fim]] = np.minimum.reduceat(permutados, comecos, axis=0)
+        inicio = fim
+    return matriz, validos
+
+
+def _matriz(blobs):
+    return np.frombuffer(b''.join(blobs), dtype=_TIPO).reshape(-1, NUM_PERMUTACOES)
+
+
+def agrupar(matriz):
+    """Agrupa as linhas parecidas de `matriz`. Retorna (rotulos, similaridades): o índice
+    da menor linha do grupo de cada uma (ela mesma se ficou sozinha) e a maior
+    similaridade estimada com outra linha do grupo (0 se sozinha)."""
+    n = len(matriz)
+    origens, destinos = [], []
+    for faixa in range(FAIXAS):
+        bloco = matriz[:, faixa * LINHAS_POR_FAIXA:(faixa + 1) * LINHAS_POR_FAIXA].astype(np.uint64)
+        chaves = (bloco * _PESOS_FAIXA).sum(axis=1)
+        ordem = np.argsort(chaves, kind='stable')
+        ordenadas = chaves[ordem]
+        novo_balde = np.r_[True, ordenadas[1:] != ordenadas[:-1]]
+        # Cada linha de um balde é candidata com a primeira (a menor) e com a anterior dele.
+        primeira = ordem[np.maximum.accumulate(np.where(novo_balde, np.arange(n), 0))]
+        repetidas = ~novo_balde
+        origens += [ordem[repetidas], ordem[repetidas]]
+        destinos += [primeira[repetidas], ordem[np.flatnonzero(repetidas) - 1]]
+    rotulos, similaridades = np.arange(n), np.zeros(n)
+    if not origens:
+        return rotulos, similaridades
+    origens, destinos = np.concatenate(origens), np.concatenate(destinos)
+    pares = np.unique(np.stack([np.minimum(origens, destinos), np.maximum(origens, destinos)]), axis=1)
+    pares = pares[:, pares[0] != pares[1]]
+    estimativas = np.concatenate([
+        (matriz[pares[0, i:i + _PARES_POR_BLOCO]] == matriz[pares[1, i:i + _PARES_POR_BLOCO]]).mean(axis=1)
+        for i in range(0, pares.shape[1], _PARES_POR_BLOCO)
+    ] or [np.zeros(0)])
+    parecidos = estimativas >= LIMIAR
+    origem, destino, estimativas = pares[0][parecidos], pares[1][parecidos], estimativas[parecidos]
+    np.maximum.at(similaridades, origem, estimativas)
+    np.maximum.at(similaridades, destino, estimativas)
+    # Componentes conexos: cada linha fica com o menor rótulo dos vizinhos até estabilizar.
+    while True:
+        menores = np.minimum(rotulos[origem], rotulos[destino])
+        novos = rotulos.copy()
+        np.minimum.at(novos, origem, menores)
+        np.minimum.at(novos, destino, menores)
+        if np.array_equal(novos, rotulos):
+            return rotulos, similaridades
+        rotulos = novos
+
+
+def comparar_entrega(atividade_id, conteudo, conn=None):
+    """Calcula a assinatura de uma resposta e a compara com as já gravadas da atividade.
+    Só lê o banco: chamada antes de gravar a entrega, a leitura das assinaturas não
+    segura a trava de escrita do SQLite. Retorna None se a resposta for curta demais."""
+    matriz, validos = assinaturas([conteudo])
+    if not validos[0]:
+        return None
+    existentes = (conn or db.session).execute(
+        text("SELECT entrega_id, assinatura, grupo FROM assinaturas_entregas WHERE atividade_id = :atividade_id"),
+        {'atividade_id': atividade_id},
+    ).all()
+    parecidas = []
+    if existentes:
+        estimativas = (_matriz([linha.assinatura for linha in existentes]) == matriz[0]).mean(axis=1)
+        parecidas = [(existentes[i].entrega_id, existentes[i].grupo, float(estimativas[i]))
+                     for i in np.flatnonzero(estimativas >= LIMIAR)]
+    return matriz[0].tobytes(), parecidas
+
+
+def registrar_entrega(entrega, comparacao, conn=None):
+    """Grava a assinatura da entrega nova (já com id) com o resultado de comparar_entrega,
+    juntando os grupos das parecidas, dentro da transação atual. Duas entregas gravadas
+    ao mesmo tempo não se enxergam; a reanálise da atividade as agrupa."""
+    if comparacao is None:
+        return
+    assinatura, parecidas = comparacao
+    executar = (conn or db.session).execute
+    grupo = similaridade = None
+    if parecidas:
+        similaridade = max(estimativa for _, _, estimativa in parecidas)
+        antigos = {grupo_antigo for _, grupo_antigo, _ in parecidas if grupo_antigo is not None}
+        grupo = min(antigos | {entrega_id for entrega_id, _, _ in parecidas} | {entrega.id})
+        executar(text(
+            "UPDATE assinaturas_entregas SET grupo = :grupo,"
+            " similaridade = max(coalesce(similaridade, 0), :similaridade) WHERE entrega_id = :entrega_id"
+        ), [{'grupo': grupo, 'similaridade': estimativa, 'entrega_id': entrega_id}
+            for entrega_id, _, estimativa in parecidas])
+        if antigos - {grupo}:
+            executar(text(
+                "UPDATE assinaturas_entregas SET grupo = :grupo"
+                " WHERE atividade_id = :atividade_id AND grupo IN :antigos"
+            ).bindparams(bindparam('antigos', expanding=True)),
+                {'grupo': grupo, 'atividade_id': entrega.atividade_id, 'antigos': sorted(antigos - {grupo})})
+    executar(text(
+        "INSERT INTO assinaturas_entregas (entrega_id, atividade_id, assinatura, grupo, similaridade)"
+        " VALUES (:entrega_id, :atividade_id, :assinatura, :grupo, :similaridade)"
+    ), {'entrega_id': entrega.id, 'atividade_id': entrega.atividade_id, 'assinatura': assinatura,
+        'grupo': grupo, 'similaridade': similaridade})
+
+
+def _assinar_pendentes(executar, filtro, parametros):
+    # Entregas ainda sem assinatura (gravadas por SQL direto ou antes desta análise).
+    pendentes = executar(text(
+        "SELECT e.id, e.atividade_id, c.texto AS conteudo FROM entregas e"
+        " LEFT JOIN conteudos_entregas c ON c.id = e.conteudo_id"
+        " LEFT JOIN assinaturas_entregas s ON s.entrega_id = e.id"
+        f" WHERE s.entrega_id IS NULL AND {filtro}"
+    ).columns(conteudo=TextoComprimido), parametros).all()
+    if not pendentes:
+        return 0
+    matriz, validos = assinaturas([linha.conteudo for linha in pendentes])
+    linhas = [{'entrega_id': linha.id, 'atividade_id': linha.atividade_id, 'assinatura': matriz[i].tobytes()}
+              for i, linha in enumerate(pendentes) if validos[i]]
+    if linhas:
+        executar(text(
+            "INSERT INTO assinaturas_entregas (entrega_id, atividade_id, assinatura)"
+            " VALUES (:entrega_id, :atividade_id, :assinatura)"
+        ), linhas)
+    return len(linhas)
+
+
+def analisar_atividade(atividade_id, conn=None):
+    """Refaz os grupos de respostas parecidas da atividade, assinando antes as entregas
+    que ainda não têm assinatura. Retorna um resumo com as contagens e a duração."""
+    inicio = time.perf_counter()
+    sessao = conn or db.session
+    executar = sessao.execute
+    assinadas = _assinar_pendentes(executar, "e.atividade_id = :atividade_id", {'atividade_id': atividade_id})
+    linhas = executar(
+        text("SELECT entrega_id, assinatura FROM assinaturas_entregas"
+             " WHERE atividade_id = :atividade_id ORDER BY entrega_id"),
+        {'atividade_id': atividade_id},
+    ).all()
+    ids = np.array([linha.entrega_id for linha in linhas], dtype=np.int64)
+    rotulos, similaridades = agrupar(_matriz([linha.assinatura for linha in linhas])) if linhas else ((), ())
+    agrupadas = [{'entrega_id': int(ids[i]), 'grupo': int(ids[rotulos[i]]), 'similaridade': float(similaridades[i])}
+                 for i in np.flatnonzero(np.asarray(similaridades) > 0)]
+    executar(text("UPDATE assinaturas_entregas SET grupo = NULL, similaridade = NULL"
+                  " WHERE atividade_id = :atividade_id AND grupo IS NOT NULL"), {'atividade_id': atividade_id})
+    if agrupadas:
+        executar(text("UPDATE assinaturas_entregas SET grupo = :grupo, similaridade = :similaridade"
+                      " WHERE entrega_id = :entrega_id"), agrupadas)
+    versionar(sessao, atividades=[atividade_id])
+    return {
+        'entregas': len(linhas),
+        'assinadas': assinadas,
+        'parecidas': len(agrupadas),
+        'grupos': len({linha['grupo'] for linha in agrupadas}),
+        'segundos': round(time.perf_counter() - inicio, 3),
+    }
+
+
+def recalcular_similaridades(conn):
+    """Assina todas as entregas e refaz os grupos de todas as atividades."""
+    _assinar_pendentes(conn.execute, "1", {})
+    atividades = conn.execute(text("SELECT DISTINCT atividade_id FROM assinaturas_entregas")).scalars().all()
+    for atividade_id in atividades:
+        analisar_atividade(atividade_id, conn)
+    return len(atividades)
+
+
+def grupos_da_atividade(atividade_id):
+    """Retorna {entrega_id: (grupo, similaridade)} das entregas com respostas parecidas."""
+    return {
+        linha.entrega_id: (linha.grupo, linha.similaridade)
+        for linha in db.session.execute(
+            text("SELECT entrega_id, grupo, similaridade FROM assinaturas_entregas"
+                 " WHERE atividade_id = :atividade_id AND grupo IS NOT NULL"),
+            {'atividade_id': atividade_id},
+        )
+    }
+
+
+if __name__ == '__main__':
+    from app import create_app
+
+    app = create_app()
+
+    if len(sys.argv) not in (2, 3) or sys.argv[1] != 'reanalisar':
+        print("Uso: python similaridade.py reanalisar [atividade_id]")
+        sys.exit(2)
+
+    with app.app_context():
+        with db.engine.begin() as conn:
+            if len(sys.argv) == 3:
+                print(analisar_atividade(int(sys.argv[2]), conn))
+            else:
+                print(f"- {recalcular_similaridades(conn)} atividades analisadas")
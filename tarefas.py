@@ -0,0 +1,465 @@
+import io
+import json
+import logging
+import os
+import signal
+import socket
+import sys
+import tempfile
+import threading
+import time
+from collections import namedtuple
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import insert
+from sqlalchemy.exc import OperationalError
+from models import db, Tarefa
+from banco import banco_travado, repetir_se_travado, executar_escrita
+from estatisticas import recalcular_estatisticas
+from matriculas import sincronizar_inscricoes
+from importacao import importar
+from exportacao import consulta_exportacao, gerar_csv
+from risco import analisar_riscos
+
+logger = logging.getLogger('sigma.tarefas')
+
+# Fila de tarefas em segundo plano, guardada na tabela `tarefas` do próprio banco: a rota
+# grava a tarefa e responde na hora, e threads trabalhadoras (no processo web ou num
+# processo à parte, `python tarefas.py trabalhar`) pegam a próxima com um único
+# UPDATE ... RETURNING, de modo que vários processos consomem a mesma fila sem executar a
+# mesma tarefa duas vezes. Uma falha devolve a tarefa à fila com espera exponencial até
+# acabarem as tentativas. Enquanto a tarefa roda, uma thread de pulso renova o
+# `atualizada_em` a cada TAREFAS_PULSO segundos, com ou sem progresso; uma tarefa
+# 'executando' sem pulso há TAREFAS_ABANDONO segundos (o processo morreu no meio) volta a
+# ser pega por outro trabalhador. Tipos periódicos são enfileirados pelos próprios
+# trabalhadores quando não há um pendente.
+
+PENDENTE, EXECUTANDO, CONCLUIDA, FALHOU = 'pendente', 'executando', 'concluida', 'falhou'
+ATIVAS = (PENDENTE, EXECUTANDO)
+# Intervalo mínimo, em segundos, entre duas gravações de progresso da mesma tarefa.
+INTERVALO_PROGRESSO = 0.5
+TAMANHO_PAGINA = 50
+
+# Intervalo mínimo, em segundos, entre duas verificações dos tipos periódicos por processo.
+INTERVALO_AGENDA = 30
+
+TipoTarefa = namedtuple('TipoTarefa', 'funcao rotulo tentativas intervalo')
+TIPOS = {}
+
+
+def tarefa(tipo, rotulo, tentativas=3, intervalo=None):
+    """Registra a função que executa as tarefas do `tipo`. Ela recebe a Execucao e os
+    parâmetros da tarefa como argumentos nomeados; o que retornar (JSON) vira o resultado.
+    ValueError é tratado como erro definitivo, sem nova tentativa. `intervalo` é a chave
+    de app.config com os segundos entre execuções automáticas (0 ou None desliga)."""
+    def registrar(funcao):
+        TIPOS[tipo] = TipoTarefa(funcao, rotulo, tentativas, intervalo)
+        return funcao
+    return registrar
+
+
+def enfileirar(tipo, parametros=None, arquivo=None, usuario_id=None):
+    """Grava uma tarefa pendente e retorna o id. Usa uma conexão própria, com commit
+    imediato, independente da sessão da requisição."""
+    if tipo not in TIPOS:
+        raise ValueError(f"Tipo de tarefa desconhecido: {tipo}")
+    agora = datetime.utcnow()
+    with db.engine.begin() as conn:
+        tarefa_id = conn.execute(insert(Tarefa.__table__).values(
+            tipo=tipo, parametros=json.dumps(parametros or {}), estado=PENDENTE, tentativas=0,
+            max_tentativas=TIPOS[tipo].tentativas, progresso=0.0, arquivo=arquivo,
+            criada_por=usuario_id, criada_em=agora, disponivel_em=agora,
+        )).inserted_primary_key[0]
+    trabalhadores().acordar()
+    return tarefa_id
+
+
+def agendar_periodicas():
+    """Enfileira a próxima execução de cada tipo periódico sem tarefa pendente ou em
+    andamento, disponível um intervalo depois da última que terminou. A verificação e a
+    inclusão são um único INSERT ... SELECT, então vários processos não a duplicam."""
+    tabela = Tarefa.__table__
+    agora = datetime.utcnow()
+    agendadas = 0
+    for tipo, definicao in TIPOS.items():
+        intervalo = current_app.config.get(definicao.intervalo) if definicao.intervalo else None
+        if not intervalo:
+            continue
+        with db.engine.begin() as conn:
+            ultima = conn.execute(db.select(db.func.max(tabela.c.concluida_em)).where(tabela.c.tipo == tipo)).scalar()
+            disponivel = max(agora, ultima + timedelta(seconds=intervalo)) if ultima else agora
+            ativa = db.select(tabela.c.id).where(tabela.c.tipo == tipo, tabela.c.estado.in_(ATIVAS))
+            agendadas += conn.execute(insert(tabela).from_select(
+                ['tipo', 'parametros', 'estado', 'tentativas', 'max_tentativas', 'progresso',
+                 'criada_em', 'disponivel_em'],
+                db.select(db.literal(tipo), db.literal('{}'), db.literal(PENDENTE), db.literal(0),
+                          db.literal(definicao.tentativas), db.literal(0.0), db.literal(agora),
+                          db.literal(disponivel)).where(~db.exists(ativa)),
+            )).rowcount
+    return agendadas
+
+
+def listar_tarefas(antes=None, tamanho=TAMANHO_PAGINA):
+    """Retorna (tarefas, proximo): as mais recentes primeiro, com id menor que `antes`."""
+    consulta = Tarefa.query.options(db.defer(Tarefa.arquivo), db.joinedload(Tarefa.usuario))
+    if antes is not None:
+        consulta = consulta.filter(Tarefa.id < antes)
+    itens = consulta.order_by(Tarefa.id.desc()).limit(tamanho + 1).all()
+    if len(itens) <= tamanho:
+        return itens, None
+    return itens[:tamanho], itens[tamanho - 1].id
+
+
+def como_dict(t):
+    return {
+        'id': t.id,
+        'tipo': t.tipo,
+        'estado': t.estado,
+        'progresso': round(t.progresso, 4),
+        'mensagem': t.mensagem,
+        'tentativas': t.tentativas,
+        'max_tentativas': t.max_tentativas,
+        'erro': t.erro,
+        'resultado': t.dados_resultado,
+        'criada_em': t.criada_em.isoformat(),
+        'iniciada_em': t.iniciada_em.isoformat() if t.iniciada_em else None,
+        'concluida_em': t.concluida_em.isoformat() if t.concluida_em else None,
+    }
+
+
+def pasta_arquivos(app=None):
+    app = app or current_app
+    return app.config.get('TAREFAS_PASTA') or os.path.join(app.instance_path, 'tarefas')
+
+
+def _atualizar(tarefa_id, dono, **valores):
+    # Só altera a tarefa enquanto ela ainda é deste trabalhador (pode ter sido dada
+    # como abandonada e retomada por outro).
+    tabela = Tarefa.__table__
+    with db.engine.begin() as conn:
+        return conn.execute(tabela.update().where(
+            tabela.c.id == tarefa_id, tabela.c.trabalhador == dono, tabela.c.estado == EXECUTANDO
+        ).values(**valores)).rowcount
+
+
+class Execucao:
+    """O que a função da tarefa recebe: a tentativa atual, o arquivo de entrada e os
+    meios de informar o progresso e de deixar um arquivo como resultado."""
+
+    def __init__(self, tarefa_id, tentativa, max_tentativas, trabalhador):
+        self.id = tarefa_id
+        self.tentativa = tentativa
+        self.max_tentativas = max_tentativas
+        self.trabalhador = trabalhador
+        self.saida = None
+        self._ultimo_progresso = 0.0
+
+    @property
+    def arquivo(self):
+        return db.session.execute(db.select(Tarefa.arquivo).where(Tarefa.id == self.id)).scalar()
+
+    def progresso(self, feitos, total, mensagem=None):
+        # Grava numa conexão própria: chame fora de uma transação de escrita da sessão.
+        agora = time.monotonic()
+        if mensagem is None and feitos < total and agora - self._ultimo_progresso < INTERVALO_PROGRESSO:
+            return
+        self._ultimo_progresso = agora
+        valores = {'progresso': min(1.0, feitos / total) if total else 0.0, 'atualizada_em': datetime.utcnow()}
+        if mensagem is not None:
+            valores['mensagem'] = mensagem[:200]
+        try:
+            _atualizar(self.id, self.trabalhador, **valores)
+        except OperationalError as erro:
+            # Progresso não vale uma espera: com o banco ocupado, fica para a próxima.
+            if not banco_travado(erro):
+                raise
+
+    def gravar_arquivo(self, partes):
+        # Grava os pedaços de texto em TAREFAS_PASTA à medida que `partes` os gera, sem
+        # juntar o arquivo na memória; a tarefa guarda só o nome dele ao terminar.
+        pasta = pasta_arquivos()
+        os.makedirs(pasta, exist_ok=True)
+        destino = tempfile.NamedTemporaryFile('wb', buffering=0, dir=pasta, prefix=f'tarefa_{self.id}_',
+                                              delete=False)
+        try:
+            with destino:
+                for parte in partes:
+                    destino.write(parte.encode('utf-8'))
+        except BaseException:
+            os.remove(destino.name)
+            raise
+        self.saida = f'tarefa_{self.id}'
+        os.replace(destino.name, os.path.join(pasta, self.saida))
+
+
+def _finalizar(execucao, **valores):
+    agora = datetime.utcnow()
+    repetir_se_travado(lambda: _atualizar(execucao.id, execucao.trabalhador, atualizada_em=agora, **valores),
+                       lambda: None, 5, 0.2)
+
+
+def _falhar(execucao, erro, definitivo):
+    descricao = str(erro) if isinstance(erro, ValueError) else f'{type(erro).__name__}: {erro}'
+    if definitivo or execucao.tentativa >= execucao.max_tentativas:
+        _finalizar(execucao, estado=FALHOU, erro=descricao, arquivo=None, concluida_em=datetime.utcnow())
+        return
+    espera = current_app.config.get('TAREFAS_ESPERA', 5) * 2 ** (execucao.tentativa - 1)
+    _finalizar(execucao, estado=PENDENTE, erro=descricao, trabalhador=None,
+               mensagem=f'Nova tentativa em {espera:.0f}s',
+               disponivel_em=datetime.utcnow() + timedelta(seconds=espera))
+
+
+def _pulsar(app, execucao, parar):
+    # Renova o `atualizada_em` até a tarefa terminar, mesmo numa etapa longa sem progresso
+    # (uma consulta de contagem, um recálculo numa transação só).
+    intervalo = app.config.get('TAREFAS_PULSO', 60)
+    with app.app_context():
+        while not parar.wait(intervalo):
+            try:
+                if not _atualizar(execucao.id, execucao.trabalhador, atualizada_em=datetime.utcnow()):
+                    return
+            except OperationalError as erro:
+                # Com o banco ocupado, o pulso fica para a próxima volta.
+                if not banco_travado(erro):
+                    raise
+
+
+def _reservar_proxima(trabalhador):
+    config = current_app.config
+    agora = datetime.utcnow()
+    abandono = agora - timedelta(seconds=config.get('TAREFAS_ABANDONO', 600))
+    tabela = Tarefa.__table__
+    proxima = (db.select(tabela.c.id)
+               .where(db.or_(db.and_(tabela.c.estado == PENDENTE, tabela.c.disponivel_em <= agora),
+                             db.and_(tabela.c.estado == EXECUTANDO, tabela.c.atualizada_em < abandono)))
+               .order_by(tabela.c.id).limit(1).scalar_subquery())
+    try:
+        with db.engine.begin() as conn:
+            return conn.execute(
+                tabela.update().where(tabela.c.id == proxima)
+                .values(estado=EXECUTANDO, tentativas=tabela.c.tentativas + 1, trabalhador=trabalhador,
+                        iniciada_em=agora, atualizada_em=agora)
+                .returning(tabela.c.id, tabela.c.tipo, tabela.c.parametros,
+                           tabela.c.tentativas, tabela.c.max_tentativas)
+            ).first()
+    except OperationalError as erro:
+        # Outro processo está escrevendo; a fila é consultada de novo no próximo ciclo.
+        if banco_travado(erro):
+            return None
+        raise
+
+
+def executar_proxima(trabalhador):
+    """Reserva e executa a próxima tarefa disponível. Retorna o id dela, ou None se não
+    havia nenhuma."""
+    linha = _reservar_proxima(trabalhador)
+    if linha is None:
+        return None
+    execucao = Execucao(linha.id, linha.tentativas, linha.max_tentativas, trabalhador)
+    tipo = TIPOS.get(linha.tipo)
+    if tipo is None:
+        _falhar(execucao, ValueError(f"Tipo de tarefa desconhecido: {linha.tipo}"), definitivo=True)
+        return linha.id
+    if linha.tentativas > linha.max_tentativas:
+        # Só acontece quando a tarefa foi abandonada na última tentativa.
+        _falhar(execucao, ValueError("A tarefa foi interrompida antes de terminar."), definitivo=True)
+        return linha.id
+
+    inicio = time.perf_counter()
+    parar_pulso = threading.Event()
+    pulso = threading.Thread(target=_pulsar, args=(current_app._get_current_object(), execucao, parar_pulso),
+                             name=f'pulso-{linha.id}', daemon=True)
+    pulso.start()
+    try:
+        resultado = tipo.funcao(execucao, **json.loads(linha.parametros))
+    except Exception as erro:
+        db.session.rollback()
+        logger.exception('tarefa=%d tipo=%s tentativa=%d falhou', linha.id, linha.tipo, linha.tentativas)
+        _falhar(execucao, erro, definitivo=isinstance(erro, ValueError))
+    else:
+        _finalizar(execucao, estado=CONCLUIDA, progresso=1.0, erro=None, mensagem=None,
+                   resultado=json.dumps(resultado) if resultado is not None else None,
+                   arquivo=None, saida=execucao.saida, concluida_em=datetime.utcnow())
+        logger.info('tarefa=%d tipo=%s concluida em %.2fs', linha.id, linha.tipo, time.perf_counter() - inicio)
+    finally:
+        parar_pulso.set()
+        pulso.join()
+        db.session.remove()
+    return linha.id
+
+
+class Trabalhadores:
+    """Threads que consomem a fila neste processo. São criadas na primeira requisição
+    (ou no primeiro enfileiramento) de cada processo, nunca antes de um fork."""
+
+    def __init__(self, app, quantidade):
+        self.app = app
+        self.quantidade = quantidade
+        self.sinal = threading.Event()
+        self.parar = threading.Event()
+        self.threads = []
+        self.pid = None
+        self.trava = threading.Lock()
+        self.proxima_agenda = 0.0
+
+    def _ativas(self):
+        return self.pid == os.getpid() and len(self.threads) == self.quantidade and all(
+            thread.is_alive() for thread in self.threads)
+
+    def iniciar(self):
+        if not self.quantidade or self.parar.is_set() or self._ativas():
+            return
+        with self.trava:
+            if self._ativas():
+                return
+            # Num processo filho (fork) as threads do pai já não existem.
+            self.pid = os.getpid()
+            base = f'{socket.gethostname()}:{self.pid}'
+            vivas = [thread for thread in self.threads if thread.is_alive()]
+            for indice in range(len(vivas), self.quantidade):
+                thread = threading.Thread(target=self._laco, args=(f'{base}:{indice}',),
+                                          name=f'tarefas-{indice}', daemon=True)
+                thread.start()
+                vivas.append(thread)
+            self.threads = vivas
+
+    def acordar(self):
+        self.iniciar()
+        self.sinal.set()
+
+    def encerrar(self, espera=None):
+        # As threads terminam a tarefa em andamento antes de sair.
+        self.parar.set()
+        self.sinal.set()
+        for thread in self.threads:
+            thread.join(espera)
+
+    def _agendar(self):
+        agora = time.monotonic()
+        with self.trava:
+            if agora < self.proxima_agenda:
+                return
+            self.proxima_agenda = agora + INTERVALO_AGENDA
+        try:
+            agendar_periodicas()
+        except OperationalError as erro:
+            # Com o banco ocupado, a agenda fica para a próxima verificação.
+            if not banco_travado(erro):
+                raise
+
+    def _laco(self, nome):
+        intervalo = self.app.config.get('TAREFAS_INTERVALO', 1.0)
+        with self.app.app_context():
+            while not self.parar.is_set():
+                try:
+                    self._agendar()
+                    executada = executar_proxima(nome)
+                except Exception:
+                    logger.exception('trabalhador=%s erro ao consultar a fila', nome)
+                    executada = None
+                if executada is None:
+                    self.sinal.wait(intervalo)
+                    self.sinal.clear()
+
+
+_trava_trabalhadores = threading.Lock()
+
+
+def trabalhadores(app=None):
+    app = app or current_app._get_current_object()
+    grupo = app.extensions.get('tarefas')
+    if grupo is None:
+        with _trava_trabalhadores:
+            grupo = app.extensions.get('tarefas')
+            if grupo is None:
+                grupo = app.extensions['tarefas'] = Trabalhadores(app, app.config.get('TAREFAS_TRABALHADORES', 1))
+    return grupo
+
+
+def configurar_tarefas(app):
+
+    @app.before_request
+    def _iniciar_trabalhadores():
+        # Retoma as tarefas deixadas na fila por um processo anterior.
+        trabalhadores(app).iniciar()
+
+
+@tarefa('importar_csv', 'Importação de CSV', tentativas=1)
+def _importar_csv(execucao, tipo, nome_arquivo=None):
+    # Uma tentativa só: os lotes já gravados voltariam como "já cadastrado" numa repetição.
+    return importar(tipo, io.BytesIO(execucao.arquivo), execucao.progresso).como_dict()
+
+
+@tarefa('exportar', 'Exportação de CSV')
+def _exportar(execucao, tipo, turma_id=None, materia_id=None):
+    try:
+        cabecalho, consulta, formatar = consulta_exportacao(tipo, materia_id=materia_id, turma_id=turma_id)
+    except KeyError:
+        raise ValueError("Tipo de exportação inválido.")
+    # Nas presenças a consulta traz cada aula do calendário; o total é uma estimativa por cima.
+    total = db.session.execute(db.select(db.func.count()).select_from(consulta.subquery())).scalar()
+    feitas = 0
+
+    def ao_lote(linhas):
+        nonlocal feitas
+        feitas += linhas
+        execucao.progresso(feitas, total)
+
+    execucao.gravar_arquivo(gerar_csv(cabecalho, consulta, formatar, ao_lote))
+    escopo = f'turma_{turma_id}' if turma_id is not None else f'materia_{materia_id}'
+    return {'linhas': feitas, 'arquivo': f'{tipo}_{escopo}.csv'}
+
+
+@tarefa('recalcular_estatisticas', 'Recalcular contadores do dashboard')
+def _recalcular_estatisticas(execucao):
+    with db.engine.begin() as conn:
+        divergencias = recalcular_estatisticas(conn)
+    return {'corrigidos': len(divergencias)}
+
+
+@tarefa('sincronizar_matriculas', 'Sincronizar inscrições com as turmas')
+def _sincronizar_matriculas(execucao):
+    incluidas, removidas = executar_escrita(sincronizar_inscricoes)
+    return {'incluidas': incluidas, 'removidas': removidas}
+
+
+@tarefa('analisar_risco', 'Análise de risco dos alunos', intervalo='RISCO_INTERVALO')
+def _analisar_risco(execucao, completa=False):
+    with db.engine.begin() as conn:
+        return analisar_riscos(conn, current_app.config['RISCO_RETREINO'], completa, execucao.progresso)
+
+
+# Tarefas que a diretoria pode disparar diretamente pela página da fila.
+MANUTENCAO = ('recalcular_estatisticas', 'sincronizar_matriculas', 'analisar_risco')
+
+
+if __name__ == '__main__':
+    from app import create_app
+
+    if len(sys.argv) < 2 or sys.argv[1] not in ('trabalhar', 'enfileirar'):
+        print("Uso: python tarefas.py trabalhar [threads]\n"
+              f"     python tarefas.py enfileirar {{{'|'.join(MANUTENCAO)}}}")
+        sys.exit(2)
+
+    if sys.argv[1] == 'enfileirar':
+        if len(sys.argv) != 3 or sys.argv[2] not in MANUTENCAO:
+            print(f"Tipos disponíveis: {', '.join(MANUTENCAO)}")
+            sys.exit(2)
+        app = create_app({'TAREFAS_TRABALHADORES': 0})
+        with app.app_context():
+            print(f"Tarefa {enfileirar(sys.argv[2])} adicionada à fila.")
+        sys.exit(0)
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(name)s %(message)s')
+    app = create_app({'TAREFAS_TRABALHADORES': int(sys.argv[2]) if len(sys.argv) > 2 else 2})
+    grupo = trabalhadores(app)
+    signal.signal(signal.SIGTERM, lambda *_: grupo.parar.set())
+    grupo.iniciar()
+    logger.info('%d trabalhador(es) consumindo a fila; Ctrl+C para encerrar', grupo.quantidade)
+    try:
+        while not grupo.parar.is_set():
+            grupo.parar.wait(1)
+    except KeyboardInterrupt:
+        pass
+    logger.info('encerrando após as tarefas em andamento')
+    grupo.encerrar()
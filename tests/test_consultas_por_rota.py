@@ -0,0 +1,117 @@
+from datetime import datetime
+
+import pytest
+from sqlalchemy import event
+from werkzeug.security import generate_password_hash
+
+from app import create_app
+from conteudos import guardar_conteudos
+from estatisticas import recalcular_estatisticas
+from migracoes import aplicar_migracoes
+from models import db, Usuario, Turma, Materia, Inscricao, Atividade, Entrega, turma_alunos, turma_materias
+from resumos import recalcular_resumos
+
+# Número de comandos SQL das rotas de dashboard e listagem com N e 10N linhas: os
+# relacionamentos vêm por joinedload e as contagens por agregação, então o número de
+# comandos não pode crescer com o volume.
+
+METODO_HASH = 'pbkdf2:sha256:1'
+# Ids de exemplo só para as mensagens de falha.
+DESCRICAO = {'materia_id': '<materia>', 'atividade_id': '<atividade>'}
+
+# (perfil logado, url, máximo de comandos SQL por requisição)
+ROTAS = [
+    ('aluno', lambda ids: '/dashboard/aluno', 2),
+    ('professor', lambda ids: f"/professor/materia/{ids['materia_id']}", 4),
+    ('professor', lambda ids: f"/professor/atividade/{ids['atividade_id']}/entregas", 5),
+    ('diretor', lambda ids: '/diretor/turmas', 1),
+    ('diretor', lambda ids: '/diretor/materias', 2),
+]
+
+
+def popular(n):
+    # n alunos inscritos na primeira matéria, com uma entrega cada; o primeiro aluno
+    # também cursa as n matérias, e cada uma tem a sua turma.
+    senha = generate_password_hash('senha', METODO_HASH)
+    usuarios = [Usuario(nome='Diretor', email='diretor@teste.edu', senha_hash=senha, role='diretor'),
+                Usuario(nome='Professor', email='professor@teste.edu', senha_hash=senha, role='professor')]
+    alunos = [Usuario(nome=f'Aluno {i}', email=f'aluno{i}@teste.edu', ra=f'{100000 + i}', senha_hash=senha,
+                      role='aluno') for i in range(n)]
+    db.session.add_all(usuarios + alunos)
+    db.session.flush()
+    professor = usuarios[1]
+    materias = [Materia(nome=f'Matéria {i}', professor_id=professor.id) for i in range(n)]
+    turmas = [Turma(nome=f'Turma {i}') for i in range(n)]
+    db.session.add_all(materias + turmas)
+    db.session.flush()
+    atividade = Atividade(titulo='Atividade', descricao='Descrição', data_entrega=datetime(2025, 12, 1),
+                          materia_id=materias[0].id)
+    db.session.add(atividade)
+    db.session.flush()
+
+    inscricoes = {(aluno.id, materias[0].id) for aluno in alunos}
+    inscricoes |= {(alunos[0].id, materia.id) for materia in materias}
+    db.session.execute(Inscricao.__table__.insert(),
+                       [{'aluno_id': a, 'materia_id': m, 'por_turma': False} for a, m in sorted(inscricoes)])
+    db.session.execute(turma_alunos.insert(),
+                       [{'turma_id': turma.id, 'aluno_id': aluno.id} for turma, aluno in zip(turmas, alunos)])
+    db.session.execute(turma_materias.insert(),
+                       [{'turma_id': turma.id, 'materia_id': materia.id} for turma, materia in zip(turmas, materias)])
+    conn = db.session.connection()
+    conteudos = guardar_conteudos(conn, [f'Resposta do aluno {aluno.id}.' for aluno in alunos])
+    db.session.execute(Entrega.__table__.insert(), [
+        {'conteudo_id': conteudo_id, 'data_envio': datetime(2025, 11, 1), 'nota': 7.0 if i % 2 else None,
+         'aluno_id': aluno.id, 'atividade_id': atividade.id}
+        for i, (aluno, conteudo_id) in enumerate(zip(alunos, conteudos))
+    ])
+    recalcular_estatisticas(conn)
+    recalcular_resumos(conn)
+    db.session.commit()
+    return {
+        'diretor': {'email': 'diretor@teste.edu', 'password': 'senha'},
+        'professor': {'email': 'professor@teste.edu', 'password': 'senha'},
+        'aluno': {'ra': alunos[0].ra, 'password': 'senha'},
+        'materia_id': materias[0].id,
+        'atividade_id': atividade.id,
+    }
+
+
+def comandos_por_rota(pasta, n):
+    app = create_app({
+        'TESTING': True,
+        'SQLALCHEMY_DATABASE_URI': f"sqlite:///{pasta / f'{n}.db'}",
+        'SESSAO_ARQUIVO': str(pasta / f'sessoes_{n}.db'),
+        'SENHA_METODO_HASH': METODO_HASH,
+        'TAREFAS_TRABALHADORES': 0,
+        'RISCO_INTERVALO': 0,
+    })
+    with app.app_context():
+        db.create_all()
+        aplicar_migracoes()
+        ids = popular(n)
+        total = [0]
+        event.listen(db.engine, 'before_cursor_execute', lambda *args: total.__setitem__(0, total[0] + 1))
+
+    clientes = {}
+    for perfil in ('aluno', 'professor', 'diretor'):
+        clientes[perfil] = app.test_client()
+        assert clientes[perfil].post('/login', data=ids[perfil]).status_code == 302
+
+    comandos = []
+    for perfil, url, _ in ROTAS:
+        # A segunda requisição já encontra os caches de autorização e de fragmentos.
+        contagens = []
+        for _ in range(2):
+            total[0] = 0
+            resposta = clientes[perfil].get(url(ids))
+            assert resposta.status_code == 200, url(ids)
+            contagens.append(total[0])
+        comandos.append(max(contagens))
+    return comandos
+
+
+@pytest.mark.parametrize('n', [20, 200])
+def test_comandos_sql_por_rota_nao_dependem_das_linhas(tmp_path, n):
+    comandos = comandos_por_rota(tmp_path, n)
+    for (_, url, maximo), total in zip(ROTAS, comandos):
+        assert total <= maximo, f'{url(DESCRICAO)}: {total} comandos SQL com {n} linhas (máximo {maximo})'
@@ -0,0 +1,47 @@
+import threading
+
+from werkzeug.security import generate_password_hash
+
+import autenticacao
+from app import create_app
+from migracoes import aplicar_migracoes
+from models import db, Usuario
+
+# Com o pool de verificação ocupado por um hash lento, o login espera até LOGIN_TIMEOUT
+# e responde 503, como quando a fila está cheia, em vez de um erro 500.
+
+METODO_HASH = 'pbkdf2:sha256:1'
+
+
+def test_login_com_hash_lento_responde_503(tmp_path, monkeypatch):
+    app = create_app({
+        'TESTING': True,
+        'SQLALCHEMY_DATABASE_URI': f"sqlite:///{tmp_path / 'login.db'}",
+        'SESSAO_ARQUIVO': str(tmp_path / 'sessoes.db'),
+        'SENHA_METODO_HASH': METODO_HASH,
+        'TAREFAS_TRABALHADORES': 0,
+        'RISCO_INTERVALO': 0,
+        'LOGIN_WORKERS': 1,
+        'LOGIN_TIMEOUT': 0.2,
+    })
+    with app.app_context():
+        db.create_all()
+        aplicar_migracoes()
+        db.session.add(Usuario(nome='Professor', email='professor@teste.edu', role='professor',
+                               senha_hash=generate_password_hash('senha', METODO_HASH)))
+        db.session.commit()
+
+    liberar = threading.Event()
+    verificar = autenticacao.check_password_hash
+
+    def hash_lento(senha_hash, senha):
+        liberar.wait(5)
+        return verificar(senha_hash, senha)
+
+    monkeypatch.setattr(autenticacao, 'check_password_hash', hash_lento)
+    try:
+        resposta = app.test_client().post('/login', data={'email': 'professor@teste.edu', 'password': 'senha'})
+    finally:
+        liberar.set()
+    assert resposta.status_code == 503
+    assert resposta.headers['Retry-After'] == '2'
@@ -0,0 +1,47 @@
+import pytest
+
+from app import create_app
+from models import db, ModeloRisco, RiscoAlunoMateria, Tarefa
+from risco import HistoricoInsuficiente, analisar_riscos
+from tarefas import CONCLUIDA, enfileirar, executar_proxima
+from usuarios_padrao import popular_banco
+
+# Com o banco de exemplo (um aluno, uma matéria) não há histórico para treinar o modelo:
+# a análise periódica termina sem modelo, em vez de falhar a cada RISCO_INTERVALO.
+
+
+@pytest.fixture
+def app(tmp_path):
+    app = create_app({
+        'TESTING': True,
+        'SQLALCHEMY_DATABASE_URI': f"sqlite:///{tmp_path / 'risco.db'}",
+        'SESSAO_ARQUIVO': str(tmp_path / 'sessoes.db'),
+        'SENHA_METODO_HASH': 'pbkdf2:sha256:1',
+        'TAREFAS_TRABALHADORES': 0,
+        'RISCO_INTERVALO': 0,
+    })
+    popular_banco(app)
+    return app
+
+
+def test_analise_sem_historico_termina_sem_modelo(app):
+    with app.app_context():
+        with db.engine.begin() as conn:
+            resultado = analisar_riscos(conn)
+        assert resultado['modo'] == 'sem_modelo'
+        assert resultado['avaliadas'] == 0
+        assert db.session.query(ModeloRisco).count() == 0
+        assert db.session.query(RiscoAlunoMateria).count() == 0
+
+        with pytest.raises(HistoricoInsuficiente):
+            with db.engine.begin() as conn:
+                analisar_riscos(conn, completa=True, exigir_modelo=True)
+
+
+def test_tarefa_de_risco_sem_historico_e_concluida(app):
+    with app.app_context():
+        tarefa_id = enfileirar('analisar_risco')
+        assert executar_proxima('trabalhador') == tarefa_id
+        tarefa = db.session.get(Tarefa, tarefa_id)
+        assert tarefa.estado == CONCLUIDA
+        assert tarefa.dados_resultado['modo'] == 'sem_modelo'
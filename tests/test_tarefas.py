@@ -0,0 +1,147 @@
+import os
+import threading
+import time
+from datetime import datetime
+
+from werkzeug.security import generate_password_hash
+
+import exportacao
+import tarefas
+from app import create_app
+from conteudos import guardar_conteudos
+from migracoes import aplicar_migracoes
+from models import db, Usuario, Materia, Turma, Atividade, Entrega, Tarefa, turma_alunos, turma_materias
+from tarefas import TIPOS, TipoTarefa, CONCLUIDA, enfileirar, executar_proxima, _reservar_proxima
+
+METODO_HASH = 'pbkdf2:sha256:1'
+ABANDONO = 1
+DURACAO = 3
+
+
+def criar_app(pasta, **config):
+    app = create_app({
+        'TESTING': True,
+        'SQLALCHEMY_DATABASE_URI': f"sqlite:///{pasta / 'tarefas.db'}",
+        'SESSAO_ARQUIVO': str(pasta / 'sessoes.db'),
+        'SENHA_METODO_HASH': METODO_HASH,
+        'TAREFAS_TRABALHADORES': 0,
+        'TAREFAS_PASTA': str(pasta / 'arquivos'),
+        'RISCO_INTERVALO': 0,
+        **config,
+    })
+    with app.app_context():
+        db.create_all()
+        aplicar_migracoes()
+    return app
+
+
+def test_tarefa_longa_sem_progresso_nao_e_retomada(tmp_path, monkeypatch):
+    # Uma tarefa que passa mais de TAREFAS_ABANDONO segundos sem informar progresso continua
+    # sendo dela: o pulso renova o `atualizada_em`, e outro trabalhador não a reserva de novo.
+    app = criar_app(tmp_path, TAREFAS_ABANDONO=ABANDONO, TAREFAS_PULSO=ABANDONO / 4)
+    iniciada = threading.Event()
+
+    def demorada(execucao):
+        iniciada.set()
+        time.sleep(DURACAO)
+        return {'ok': True}
+
+    monkeypatch.setitem(TIPOS, 'demorada', TipoTarefa(demorada, 'Demorada', 1, None))
+
+    with app.app_context():
+        tarefa_id = enfileirar('demorada')
+
+    def trabalhar():
+        with app.app_context():
+            executar_proxima('trabalhador-1')
+
+    thread = threading.Thread(target=trabalhar)
+    thread.start()
+    assert iniciada.wait(5)
+
+    reservas = []
+    with app.app_context():
+        fim = time.monotonic() + DURACAO - 0.5
+        while time.monotonic() < fim:
+            reservas.append(_reservar_proxima('trabalhador-2'))
+            time.sleep(0.2)
+    thread.join()
+
+    assert reservas and all(reserva is None for reserva in reservas)
+    with app.app_context():
+        tarefa = db.session.get(Tarefa, tarefa_id)
+        assert tarefa.estado == CONCLUIDA
+        assert tarefa.tentativas == 1
+        assert tarefa.trabalhador == 'trabalhador-1'
+
+
+def popular_turma(alunos):
+    # Uma turma com `alunos` alunos, uma matéria e uma entrega de cada aluno.
+    senha = generate_password_hash('senha', METODO_HASH)
+    diretor = Usuario(nome='Diretor', email='diretor@teste.edu', senha_hash=senha, role='diretor')
+    professor = Usuario(nome='Professor', email='professor@teste.edu', senha_hash=senha, role='professor')
+    matriculados = [Usuario(nome=f'Aluno {i}', email=f'aluno{i}@teste.edu', ra=f'{100000 + i}',
+                            senha_hash=senha, role='aluno') for i in range(alunos)]
+    db.session.add_all([diretor, professor] + matriculados)
+    db.session.flush()
+    materia = Materia(nome='Matéria', professor_id=professor.id)
+    turma = Turma(nome='Turma')
+    db.session.add_all([materia, turma])
+    db.session.flush()
+    atividade = Atividade(titulo='Atividade', descricao='Descrição', data_entrega=datetime(2025, 12, 1),
+                          materia_id=materia.id)
+    db.session.add(atividade)
+    db.session.flush()
+    db.session.execute(turma_materias.insert(), [{'turma_id': turma.id, 'materia_id': materia.id}])
+    db.session.execute(turma_alunos.insert(), [{'turma_id': turma.id, 'aluno_id': a.id} for a in matriculados])
+    conteudos = guardar_conteudos(db.session.connection(), [f'Resposta {a.id}.' for a in matriculados])
+    db.session.execute(Entrega.__table__.insert(), [
+        {'conteudo_id': conteudo_id, 'data_envio': datetime(2025, 11, 1), 'nota': 7.5,
+         'aluno_id': aluno.id, 'atividade_id': atividade.id}
+        for aluno, conteudo_id in zip(matriculados, conteudos)
+    ])
+    db.session.commit()
+    return turma.id
+
+
+def test_exportacao_grava_cada_lote_no_arquivo_ao_gerar(tmp_path, monkeypatch):
+    # O CSV da exportação vai para o disco lote a lote: quando o gerador produz um
+    # pedaço, os anteriores já estão no arquivo, e a tarefa guarda só o nome dele.
+    app = criar_app(tmp_path)
+    pasta = tmp_path / 'arquivos'
+    monkeypatch.setattr(exportacao, 'LINHAS_POR_LOTE', 10)
+    with app.app_context():
+        turma_id = popular_turma(45)
+        tarefa_id = enfileirar('exportar', {'tipo': 'notas', 'turma_id': turma_id})
+
+    gerar_csv = tarefas.gerar_csv
+    gerados = []
+    gravados_antes = []
+
+    def gerar_acompanhando(*args, **kwargs):
+        for parte in gerar_csv(*args, **kwargs):
+            gravados_antes.append(sum(os.path.getsize(arquivo) for arquivo in pasta.iterdir()))
+            gerados.append(len(parte.encode('utf-8')))
+            yield parte
+
+    monkeypatch.setattr(tarefas, 'gerar_csv', gerar_acompanhando)
+    with app.app_context():
+        assert executar_proxima('trabalhador') == tarefa_id
+        tarefa = db.session.get(Tarefa, tarefa_id)
+        assert tarefa.estado == CONCLUIDA
+        assert tarefa.arquivo is None
+        assert tarefa.dados_resultado['linhas'] == 45
+
+    # Cabeçalho e cinco lotes de até 10 linhas.
+    assert len(gerados) == 6
+    assert gravados_antes == [sum(gerados[:i]) for i in range(len(gerados))]
+    caminho = pasta / tarefa.saida
+    assert caminho.stat().st_size == sum(gerados)
+
+    cliente = app.test_client()
+    assert cliente.post('/login', data={'email': 'diretor@teste.edu', 'password': 'senha'}).status_code == 302
+    resposta = cliente.get(f'/diretor/tarefas/{tarefa_id}/arquivo')
+    assert resposta.status_code == 200
+    assert resposta.data == caminho.read_bytes()
+    assert f'notas_turma_{turma_id}.csv' in resposta.headers['Content-Disposition']
+    resposta.close()
@@ -1,5 +1,7 @@
-from app import app
-from models import db, Usuario, Materia, Inscricao, Atividade, Presenca, Entrega, Turma
+from app import create_app
+from models import db, Usuario, Materia, Inscricao, Atividade, Turma
+from migracoes import aplicar_migracoes
+from presencas import registrar_presencas
 from datetime import datetime, date
 
 usuarios_padrao = [
@@ -26,12 +28,17 @@ usuarios_padrao = [
     }
 ]
 
-def popular_banco():
+def popular_banco(app=None):
+    app = app or create_app()
     with app.app_context():
         
         print("Recriando o banco de dados...")
         db.drop_all()
+        # Os gatilhos de busca caem junto com as tabelas; as migrações rodam de novo para recriá-los.
+        with db.engine.begin() as conn:
+            conn.exec_driver_sql("PRAGMA user_version = 0")
         db.create_all()
+        aplicar_migracoes()
         
         print("\nCriando usuários padrão...")
         for dados in usuarios_padrao:
@@ -92,9 +99,8 @@ def popular_banco():
             
         print("\nRegistrando presenças...")
         if aluno and materia:
-            presenca1 = Presenca(data=date(2025, 10, 6), presente=True, aluno_id=aluno.id, materia_id=materia.id)
-            presenca2 = Presenca(data=date(2025, 10, 7), presente=False, aluno_id=aluno.id, materia_id=materia.id)
-            db.session.add_all([presenca1, presenca2])
+            registrar_presencas(materia.id, {(aluno.id, date(2025, 10, 6)): True,
+                                             (aluno.id, date(2025, 10, 7)): False})
             db.session.commit()
             print("- Presenças dos dias 06/10 e 07/10 registradas.")
 
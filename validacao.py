@@ -0,0 +1,99 @@
+import hashlib
+import time
+from functools import wraps
+from flask import current_app, make_response, request, session
+from sqlalchemy import bindparam, event, text
+from sqlalchemy.engine import Connection
+from models import db, Materia, Atividade, Entrega, Inscricao
+from autorizacao import pode_acessar_materia
+
+# Respostas condicionais: Materia e Atividade têm um contador `versao` que é incrementado,
+# na mesma transação, por qualquer gravação no que as páginas delas mostram (a própria
+# matéria ou atividade, inscrições, presenças e entregas). A ETag de uma página é derivada
+# dessas versões, do usuário e do processo; um GET com If-None-Match igual recebe 304 sem
+# consultar nem renderizar nada além da leitura da versão.
+
+# Muda a cada reinício, para que uma ETag não sobreviva a um deploy com templates novos.
+_INICIO = str(time.time_ns())
+
+_SQL_MATERIAS = text(
+    "UPDATE materias SET versao = versao + 1 WHERE id IN :materias"
+    " OR id IN (SELECT materia_id FROM atividades WHERE id IN :atividades)"
+).bindparams(bindparam('materias', expanding=True), bindparam('atividades', expanding=True))
+_SQL_ATIVIDADES = text(
+    "UPDATE atividades SET versao = versao + 1 WHERE id IN :atividades"
+).bindparams(bindparam('atividades', expanding=True))
+
+
+def versionar(sessao, materias=(), atividades=()):
+    """Incrementa a versão das matérias e atividades (e das matérias dessas atividades)
+    na transação de `sessao`. Usado por quem grava sem passar pelo ORM."""
+    if isinstance(sessao, Connection):
+        # Migrações: a coluna pode nem existir ainda, e o reinício já troca todas as ETags.
+        return
+    materias = sorted({m for m in materias if m is not None})
+    atividades = sorted({a for a in atividades if a is not None})
+    if not materias and not atividades:
+        return
+    executar = sessao.connection().execute
+    executar(_SQL_MATERIAS, {'materias': materias, 'atividades': atividades})
+    if atividades:
+        executar(_SQL_ATIVIDADES, {'atividades': atividades})
+
+
+# O acesso entra na validação: quem perdeu a matéria não recebe 304 para uma cópia antiga.
+def versao_materia(materia_id):
+    versao = db.session.execute(db.select(Materia.versao).where(Materia.id == materia_id)).scalar()
+    return versao, pode_acessar_materia(materia_id)
+
+
+def versao_atividade(atividade_id):
+    linha = db.session.execute(
+        db.select(Atividade.versao, Atividade.materia_id).where(Atividade.id == atividade_id)
+    ).first()
+    if linha is None:
+        return None
+    return linha.versao, pode_acessar_materia(linha.materia_id)
+
+
+def condicional(versoes):
+    """Decorador de rota: `versoes(**kwargs)` retorna o que identifica o conteúdo da página
+    (em geral a versão da entidade exibida). Só vale para GET e nunca quando há mensagens
+    flash pendentes, que são mostradas uma única vez."""
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            if request.method != 'GET':
+                return f(*args, **kwargs)
+            partes = (request.endpoint, session.get('user_id'), _INICIO, request.query_string, versoes(**kwargs))
+            etag = hashlib.sha1(repr(partes).encode()).hexdigest()[:20]
+            if '_flashes' not in session and etag in request.if_none_match:
+                resposta = current_app.response_class(status=304)
+            else:
+                resposta = make_response(f(*args, **kwargs))
+                if resposta.status_code != 200:
+                    return resposta
+            resposta.set_etag(etag)
+            # Privada (depende do usuário) e sempre revalidada: a ETag é que evita o trabalho.
+            resposta.cache_control.private = True
+            resposta.cache_control.no_cache = True
+            return resposta
+        return decorated_function
+    return decorator
+
+
+@event.listens_for(db.session, 'after_flush')
+def _versionar_flush(sessao, contexto):
+    materias, atividades = set(), set()
+    alterados = list(sessao.new) + list(sessao.deleted) + [o for o in sessao.dirty if sessao.is_modified(o)]
+    for obj in alterados:
+        if isinstance(obj, Materia):
+            materias.add(obj.id)
+        elif isinstance(obj, Atividade):
+            atividades.add(obj.id)
+            materias.add(obj.materia_id)
+        elif isinstance(obj, Entrega):
+            atividades.add(obj.atividade_id)
+        elif isinstance(obj, Inscricao):
+            materias.add(obj.materia_id)
+    versionar(sessao, materias, atividades)
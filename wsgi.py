@@ -0,0 +1,4 @@
+from app import create_app
+
+# Ponto de entrada dos servidores WSGI: gunicorn -c gunicorn.conf.py
+app = create_app()